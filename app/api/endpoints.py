@@ -1,172 +1,313 @@
+import asyncio
+import logging
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from fastapi.responses import StreamingResponse
-import json
+from starlette.background import BackgroundTask
 from typing import AsyncGenerator
 
+from app.api.sse import coalesce_answer_tokens, encode_event
+from app.core.config import settings
+from app.core.timing import CHAT_ACTIVE_STREAMS, CHAT_ERRORS, CHAT_TURN_LATENCY, RequestTimings, stage
 from app.core.dependencies import get_db
 from app.db import crud
+from app.db.writer import PendingWritesTimeoutError, message_writer
 from app.schemas import conversation as conv_schema
 from app.schemas import chat as chat_schema
-from app.rag.chain import get_rag_chain
+from app.schemas import message as message_schema
+from app.rag.admission import LLMOverloadedError, get_llm_stats, llm_limiter
+from app.rag.chain import aget_rag_chain, aget_source_documents, reload_vector_store
+from app.rag.cache import semantic_cache
+from app.rag.context import get_context_stats
+from app.rag.embeddings import get_embedding_stats
+from app.rag.history import ChatHistory, load_chat_history, update_history_summary
+from app.rag.rerank import get_rerank_stats
+from app.rag.sources import expand_source_references, to_source_reference
 
 # 创建一个API路由实例
 router = APIRouter()
 
+async def _wait_for_pending_messages(conversation_id: int):
+    """等待会话在写入队列中的消息提交；数据库长时间不可用时返回503，而不是一直挂起请求。"""
+    try:
+        await message_writer.wait_for(conversation_id)
+    except PendingWritesTimeoutError as e:
+        logging.error(str(e))
+        raise HTTPException(status_code=503, detail="数据库暂时不可用，请稍后重试")
+
 @router.post("/conversations/", response_model=conv_schema.Conversation, status_code=201, summary="创建一个新会话")
-def create_new_conversation(db: Session = Depends(get_db)):
+async def create_new_conversation(db: AsyncSession = Depends(get_db)):
     """
     创建一个新的、空的对话会话。
     """
-    new_conv = crud.create_conversation(db)
+    new_conv = await crud.create_conversation(db)
     # 返回完整的会话对象，即使它是空的
-    return crud.get_conversation(db, new_conv.id)
+    return await crud.get_conversation(db, new_conv.id, with_messages=True)
 
 
 @router.get("/conversations/", response_model=List[conv_schema.ConversationSnippet], summary="获取所有会话列表")
-def get_all_conversations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """
-    获取所有对话会话的列表。
-    为每个会话返回一个摘要信息（ID，创建时间，标题）用于预览。
-    """
-    conversations = crud.get_conversations(db, skip=skip, limit=limit)
-    snippets = []
-    for conv in conversations:
-        # 使用第一条消息作为标题，如果不存在则使用默认标题
-        first_message = conv.messages[0].content if conv.messages else "新会话"
-        snippets.append(
-            conv_schema.ConversationSnippet(
-                id=conv.id,
-                created_at=conv.created_at,
-                title=first_message[:50]  # 截断标题长度
-            )
+async def get_all_conversations(before_id: Optional[int] = None, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    """
+    获取对话会话的列表，按创建时间从新到旧排列。
+    为每个会话返回一个摘要信息（ID，创建时间，标题，消息数）用于预览。
+
+    分页使用游标：获取下一页时，将本页最后一个会话的ID作为 `before_id` 传入。
+    每页只执行一次查询，与会话的长度和翻页的深度无关。
+    """
+    conversations = await crud.get_conversations(db, before_id=before_id, limit=limit)
+    return [
+        conv_schema.ConversationSnippet(
+            id=conv.id,
+            created_at=conv.created_at,
+            # 还没有消息的会话使用默认标题
+            title=conv.title or "新会话",
+            message_count=conv.message_count,
         )
-    return snippets
+        for conv in conversations
+    ]
 
 @router.get("/conversations/{conversation_id}", response_model=conv_schema.Conversation, summary="获取特定会话")
-def get_conversation_by_id(conversation_id: int, db: Session = Depends(get_db)):
+async def get_conversation_by_id(conversation_id: int, expand_sources: bool = False, db: AsyncSession = Depends(get_db)):
     """
     获取一个指定ID的完整对话，包含所有消息历史。
+
+    AI消息的溯源文档默认只包含文本块ID和元数据；`expand_sources=true` 时从知识库中读取并附带原文。
     """
-    db_conversation = crud.get_conversation(db, conversation_id)
+    # 先等待该会话在写入队列中的消息提交，保证返回的历史是完整的
+    await _wait_for_pending_messages(conversation_id)
+    db_conversation = await crud.get_conversation(db, conversation_id, with_messages=True)
     if db_conversation is None:
         raise HTTPException(status_code=404, detail="会话未找到")
-    return db_conversation
+    if not expand_sources:
+        return db_conversation
+    conversation = conv_schema.Conversation.from_orm(db_conversation)
+    for message in conversation.messages:
+        message.source_documents = await expand_source_references(message.source_documents)
+    return conversation
 
 @router.delete("/conversations/{conversation_id}", status_code=204, summary="删除特定会话")
-def delete_a_conversation(conversation_id: int, db: Session = Depends(get_db)):
+async def delete_a_conversation(conversation_id: int, db: AsyncSession = Depends(get_db)):
     """
     删除一个指定的对话及其所有关联的消息。
     """
-    db_conversation = crud.delete_conversation(db, conversation_id)
+    # 先等待该会话在写入队列中的消息提交，避免它们在会话删除后才写入
+    await _wait_for_pending_messages(conversation_id)
+    db_conversation = await crud.delete_conversation(db, conversation_id)
     if db_conversation is None:
         raise HTTPException(status_code=404, detail="会话未找到")
     # 状态码204表示无内容，因此不返回任何响应体
     return
 
+@router.get("/chunks/{chunk_id}", response_model=message_schema.SourceChunk, summary="获取溯源文档的原文")
+async def get_source_chunk(chunk_id: str):
+    """
+    按文本块ID获取知识库中文本块的原文和元数据，用于展开AI消息中的某一条溯源文档。
+    """
+    documents = await aget_source_documents([chunk_id])
+    doc = documents.get(chunk_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="文本块未找到，可能已在重新灌输知识库时被移除")
+    return message_schema.SourceChunk(chunk_id=chunk_id, page_content=doc.page_content, metadata=doc.metadata)
+
+@router.get("/cache/stats", summary="获取语义缓存统计信息")
+def get_cache_stats():
+    """
+    返回语义答案缓存的命中/未命中计数、命中率和当前大小。
+    """
+    return semantic_cache.stats()
+
+
+@router.get("/embeddings/stats", summary="获取查询向量化批处理统计信息")
+def get_embeddings_stats():
+    """
+    返回查询向量化的批大小直方图、排队等待时间直方图以及LRU缓存的命中/未命中计数，
+    用于调整批处理参数。
+    """
+    return get_embedding_stats()
+
+
+@router.get("/rerank/stats", summary="获取重排序统计信息")
+def get_reranking_stats():
+    """
+    返回重排序的耗时直方图，以及因超出时间预算或出错而退回检索顺序的次数，
+    用于调整 RERANK_CANDIDATES 和 RERANK_TIMEOUT_MS。
+    """
+    return get_rerank_stats()
+
+
+@router.get("/context/stats", summary="获取上下文构建统计信息")
+def get_context_assembly_stats():
+    """
+    返回问答Prompt中检索上下文的token数直方图、累计节省的token数，以及合并相邻文本块、
+    丢弃重复文本块和超出预算截断的次数，用于调整 CONTEXT_TOKEN_BUDGET 和 CONTEXT_DEDUP_THRESHOLD。
+    """
+    return get_context_stats()
+
+
+@router.get("/llm/stats", summary="获取大模型调用的准入控制统计信息")
+def get_llm_admission_stats():
+    """
+    返回当前发往大模型的并发请求数、排队数、排队等待时间直方图和被拒绝的请求数，
+    用于调整 LLM_MAX_CONCURRENCY 和 LLM_MAX_QUEUE。
+    """
+    return get_llm_stats()
+
+
+@router.post("/vector-store/reload", summary="热加载向量数据库的新版本")
+async def reload_the_vector_store(force: bool = False):
+    """
+    如果数据灌输发布了新的向量数据库版本，在后台加载、预热并原子地切换到该版本，无需重启服务。
+    进行中的请求在旧版本上完成。`force=true` 时即使版本没有变化也重新加载。
+
+    服务也会每隔 VECTOR_STORE_RELOAD_INTERVAL_SECONDS 秒自动检查一次；多worker部署时，
+    这个接口只作用于处理本次请求的worker（使用检索服务进程时则作用于所有worker）。
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, reload_vector_store, force)
+    except Exception as e:
+        logging.error(f"热加载向量数据库失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"热加载向量数据库失败，继续使用当前版本: {e}")
+
 
 async def stream_chat_response_generator(
     conversation_id: int,
     user_question: str,
-    db: Session
-) -> AsyncGenerator[str, None]:
+    history: ChatHistory,
+    db: AsyncSession,
+    timings: RequestTimings,
+) -> AsyncGenerator[bytes, None]:
     """
     一个异步生成器函数，用于流式传输聊天响应。
-    它会产生多种事件类型的JSON字符串（例如：token流，源信息，结束信号）。
-    """
-    # 1. 获取RAG链实例
-    rag_chain = get_rag_chain()
-    if not rag_chain:
-        error_message = json.dumps({
-            "type": "error",
-            "data": "RAG链不可用。"
-        })
-        yield f"data: {error_message}\n\n"
-        return
-
-    # 2. 从数据库检索聊天历史
-    chat_history = []
-    db_messages = crud.get_messages_by_conversation(db, conversation_id)
-    for msg in db_messages:
-        if msg.message_type == 'user':
-            chat_history.append(("user", msg.content))
-        else:
-            chat_history.append(("ai", msg.content))
-
-    # 3. 从RAG链流式获取响应
-    full_ai_response = ""
-    source_documents = []
-
+    它会产生多种事件类型的SSE数据帧（例如：token流，源信息，结束信号）。
+    相邻的答案token会按 SSE_COALESCE_MAX_DELAY_MS / SSE_COALESCE_MAX_CHARS 合并到同一个 `stream` 事件中。
+    各阶段的耗时记录到 `timings` 和 /metrics 的直方图中，结束时输出一行耗时日志。
+    """
+    # RAG链各步骤的耗时都累加到本请求的计时对象中
+    timings.activate()
+    CHAT_ACTIVE_STREAMS.inc()
     try:
-        # 使用astream方法进行异步流式调用
-        async for chunk in rag_chain.astream({
-            "question": user_question,
-            "chat_history": chat_history
-        }):
-            # 处理答案的token块
-            if "answer" in chunk:
-                token = chunk["answer"]
-                full_ai_response += token
-                response_json = json.dumps({"type": "stream", "data": token}, ensure_ascii=False)
-                yield f"data: {response_json}\n\n"
-
-            # 处理溯源文档块
-            if "source_documents" in chunk and chunk["source_documents"]:
-                # 转换Document对象为可序列化的字典
-                source_documents = [doc.dict() for doc in chunk["source_documents"]]
-                response_json = json.dumps({"type": "sources", "sources": source_documents}, ensure_ascii=False)
-                yield f"data: {response_json}\n\n"
+        # 1. 获取RAG链实例
+        rag_chain = await aget_rag_chain()
+        if not rag_chain:
+            CHAT_ERRORS.inc()
+            yield encode_event({"type": "error", "data": "RAG链不可用。"})
+            return
 
-    except Exception as e:
-        error_message = json.dumps({
-            "type": "error",
-            "data": f"流式处理过程中发生错误: {str(e)}"
-        }, ensure_ascii=False)
-        yield f"data: {error_message}\n\n"
-        return
-
-    # 4. 将完整的AI回答保存到数据库
-    if full_ai_response:
-        crud.create_message(
-            db,
-            conversation_id=conversation_id,
-            content=full_ai_response,
-            message_type='ai',
-            source_documents=source_documents
-        )
+        # 2. 从RAG链流式获取响应
+        # 答案片段先收集到列表中，结束后一次性拼接，避免逐个token拼接字符串
+        answer_parts = []
+        source_documents = []
+
+        try:
+            # 使用astream方法进行异步流式调用，并合并相邻的答案token
+            chunks = rag_chain.astream({
+                "question": user_question,
+                "chat_history": history.messages,
+                "history_summary": history.summary,
+            })
+            async for chunk in coalesce_answer_tokens(
+                chunks,
+                max_delay_ms=settings.SSE_COALESCE_MAX_DELAY_MS,
+                max_chars=settings.SSE_COALESCE_MAX_CHARS,
+            ):
+                # 处理答案的token块
+                if "answer" in chunk:
+                    token = chunk["answer"]
+                    answer_parts.append(token)
+                    yield encode_event({"type": "stream", "data": token})
+
+                # 处理溯源文档块
+                if "source_documents" in chunk and chunk["source_documents"]:
+                    # 只发送和保存文本块ID和元数据，原文由客户端按需通过 /chunks/{chunk_id} 获取
+                    source_documents = [to_source_reference(doc) for doc in chunk["source_documents"]]
+                    yield encode_event({"type": "sources", "sources": source_documents})
+
+        except LLMOverloadedError as e:
+            # 大模型繁忙（排队超时）：附带重试提示，客户端可在 retry_after 秒后重新提问
+            CHAT_ERRORS.inc()
+            yield encode_event({"type": "error", "data": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            CHAT_ERRORS.inc()
+            yield encode_event({"type": "error", "data": f"流式处理过程中发生错误: {str(e)}"})
+            return
 
-    # 5. 发送结束信号
-    end_message = json.dumps({"type": "end"})
-    yield f"data: {end_message}\n\n"
+        # 3. 将完整的AI回答保存到数据库（batched模式下进入写入队列）
+        full_ai_response = "".join(answer_parts)
+        if full_ai_response:
+            with stage("persist"):
+                await message_writer.add(
+                    db,
+                    conversation_id=conversation_id,
+                    content=full_ai_response,
+                    message_type='ai',
+                    source_documents=source_documents
+                )
+                # batched模式下，等本轮的消息提交后再发送结束信号：下一轮对话可能由另一个worker处理，
+                # 它看不到本进程写入队列中的消息。等待期间的其他对话仍与本轮在同一个事务中批量提交。
+                try:
+                    await message_writer.wait_for(conversation_id)
+                except PendingWritesTimeoutError as e:
+                    logging.warning(f"{e}，消息仍在写入队列中等待重试。")
+
+        # 4. 发送结束信号
+        yield encode_event({"type": "end"})
+    finally:
+        CHAT_ACTIVE_STREAMS.dec()
+        CHAT_TURN_LATENCY.observe(timings.elapsed())
+        logging.info(f"会话 {conversation_id} 本轮耗时: {timings.summary()}")
 
 
 @router.post("/chat/stream", summary="流式聊天接口")
 async def stream_chat(
     chat_request: chat_schema.ChatRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     用于流式聊天响应的主接口。
     处理会话创建、消息保存，并流式传输AI的回答。
+    大模型繁忙（等待队列已满）时返回429，`Retry-After` 响应头给出建议的重试间隔（秒）。
+    指定的 `conversation_id` 不存在（或已被删除）时返回404。
     """
     conversation_id = chat_request.conversation_id
+    timings = RequestTimings()
+    timings.activate()
+
+    # 大模型的等待队列已满时直接返回429，不创建会话、不保存用户消息
+    if llm_limiter.is_saturated():
+        retry_after = llm_limiter.retry_after()
+        raise HTTPException(
+            status_code=429,
+            detail="大模型服务繁忙，请稍后重试。",
+            headers={"Retry-After": str(retry_after)},
+        )
 
-    # 如果未提供conversation_id，则创建一个新的会话
+    # 如果未提供conversation_id，则创建一个新的会话；指定的会话不存在（或已删除）时返回404，
+    # 否则保存用户消息时会违反外键约束
     if conversation_id is None:
-        new_conv = crud.create_conversation(db)
+        new_conv = await crud.create_conversation(db)
         conversation_id = new_conv.id
+    elif await crud.get_conversation(db, conversation_id) is None:
+        raise HTTPException(status_code=404, detail="会话未找到")
 
-    # 保存用户的消息到数据库
-    crud.create_message(
-        db,
-        conversation_id=conversation_id,
-        content=chat_request.question,
-        message_type='user'
-    )
+    # 读取聊天历史：较早轮次的滚动摘要 + 最近几轮的原文。在保存本轮的用户消息之前读取，使其不包含本轮的问题
+    with stage("history_load"):
+        history = await load_chat_history(db, conversation_id)
+
+    # 保存用户的消息到数据库（batched模式下进入写入队列）
+    with stage("persist"):
+        await message_writer.add(
+            db,
+            conversation_id=conversation_id,
+            content=chat_request.question,
+            message_type='user'
+        )
 
-    # 创建并返回流式响应
+    # 创建并返回流式响应。响应发送完毕后，在后台将移出历史窗口的消息合并进会话摘要。
     return StreamingResponse(
-        stream_chat_response_generator(conversation_id, chat_request.question, db),
-        media_type="text/event-stream"
+        stream_chat_response_generator(conversation_id, chat_request.question, history, db, timings),
+        media_type="text/event-stream",
+        background=BackgroundTask(update_history_summary, conversation_id),
     )
@@ -18,14 +18,102 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL_NAME: str # 使用的嵌入模型名称
     DOCS_PATH: str            # 知识库源文件路径
     VECTOR_STORE_PATH: str    # FAISS向量数据库存储路径
+    LOADER_MAX_WORKERS: int = 1        # 数据灌输时并行解析文档的进程数（1表示串行）
+    LOADER_FILE_TIMEOUT: float = 600   # 单个文件的解析超时时间（秒），0表示不限制
+    INGEST_BATCH_SIZE: int = 256       # 数据灌输时每批向量化并写入索引的文本块数量
+    INGEST_QUEUE_SIZE: int = 4         # 灌输流水线各阶段之间有界队列的容量
+    INGEST_CHECKPOINT_EVERY: int = 20  # 每写入多少个批次保存一次检查点
+    VECTOR_STORE_KEEP_VERSIONS: int = 2           # 灌输完成后保留的向量数据库版本数（至少2个）
+    VECTOR_STORE_RELOAD_INTERVAL_SECONDS: int = 30  # 检查并热加载向量数据库新版本的间隔（秒），0表示只通过接口手动触发
+
+    # --- FAISS索引配置 ---
+    VECTOR_INDEX_TYPE: str = "flat"               # 索引类型：flat、ivf_flat、ivf_pq 或 hnsw
+    VECTOR_INDEX_NLIST: int = 1024                # IVF索引的聚类数
+    VECTOR_INDEX_PQ_M: int = 64                   # IVF-PQ索引的子量化器数量（需能整除向量维度）
+    VECTOR_INDEX_HNSW_M: int = 32                 # HNSW索引每个节点的邻居数
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION: int = 200  # HNSW索引构建时的候选列表大小
+    VECTOR_INDEX_TRAIN_SIZE: int = 50000          # IVF索引训练使用的样本数
+    VECTOR_SEARCH_NPROBE: int = 16                # IVF索引查询时访问的聚类数
+    VECTOR_SEARCH_EF: int = 128                   # HNSW索引查询时的候选列表大小
+    RETRIEVAL_MAX_WORKERS: int = 4  # 执行FAISS检索的线程池大小
+
+    # --- 检索配置 ---
+    RETRIEVAL_TOP_K: int = 4              # 返回给大模型的文档数
+    HYBRID_SEARCH_ENABLED: bool = True    # 是否同时使用BM25关键词检索，并与向量检索结果融合
+    HYBRID_SEARCH_FETCH_K: int = 20       # 融合前每一路检索返回的候选数
+    HYBRID_SEARCH_RRF_K: int = 60         # 倒数排名融合（RRF）的平滑常数
+    RETRIEVAL_SIDECAR_SOCKET: str = ""            # 检索服务进程的Unix套接字路径；为空时每个worker各自加载嵌入模型和索引
+    RETRIEVAL_SIDECAR_POOL_SIZE: int = 16         # 每个worker到检索服务进程的最大连接数
+    RETRIEVAL_SIDECAR_TIMEOUT_SECONDS: float = 10.0  # 单次检索服务请求的超时时间（秒）
+
+    # --- 上下文构建配置 ---
+    CONTEXT_TOKEN_BUDGET: int = 3000        # 问答Prompt中检索上下文的token预算，0表示不限制
+    CONTEXT_MERGE_ADJACENT: bool = True     # 是否合并同一来源中相邻（首尾重叠）的文本块
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8    # 与排名更靠前的文本的字符3-gram重合度达到该值时视为重复而丢弃，0表示不去重
+
+    # --- 重排序配置 ---
+    RERANK_ENABLED: bool = False                       # 是否使用交叉编码器对候选文档重排序
+    RERANK_MODEL_NAME: str = "BAAI/bge-reranker-base"  # 交叉编码器模型名称
+    RERANK_CANDIDATES: int = 20                        # 送入重排序的候选文档数（重排序后保留RETRIEVAL_TOP_K个）
+    RERANK_TIMEOUT_MS: int = 300                       # 重排序的时间预算（毫秒），超时则按检索顺序截取
+    RERANK_MAX_LENGTH: int = 512                       # 每个（问题, 文档）对的最大token数
+    RERANK_MAX_QUEUE: int = 2                          # 等待打分的任务数达到此值时跳过重排序（含正在执行的任务）
+
+    # --- 嵌入模型推理配置 ---
+    EMBEDDING_BACKEND: str = "torch"                 # 嵌入模型推理后端：torch（sentence-transformers）或 onnx（ONNX Runtime）
+    EMBEDDING_ONNX_QUANTIZE: bool = True             # onnx后端是否使用int8动态量化的模型
+    EMBEDDING_ONNX_CACHE_DIR: str = "./onnx_models"  # 导出的ONNX模型的缓存目录
+    EMBEDDING_INTRA_OP_THREADS: int = 0              # 嵌入模型推理的算子内线程数，0表示使用默认值
+    EMBEDDING_INFERENCE_BATCH_SIZE: int = 32         # 嵌入模型单次推理的文本数
+
+    # --- 查询向量化批处理配置 ---
+    EMBEDDING_BATCH_MAX_SIZE: int = 32        # 单次批量向量化的最大查询数
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0  # 收集一个批次的最长等待时间（毫秒）
+    EMBEDDING_QUERY_CACHE_SIZE: int = 2048    # 最近查询向量的LRU缓存大小
+
+    # --- 聊天历史配置 ---
+    HISTORY_MAX_TURNS: int = 5                # 原文保留的最近对话轮数
+    HISTORY_TOKEN_BUDGET: int = 1000          # 原文保留的历史消息的token预算
+    HISTORY_SUMMARY_ENABLED: bool = True      # 是否将更早的对话合并为滚动摘要
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300     # 滚动摘要的最大长度（token）
+
+    # --- 语义缓存配置 ---
+    SEMANTIC_CACHE_ENABLED: bool = True       # 是否启用语义答案缓存
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95    # 命中缓存所需的最低余弦相似度
+    SEMANTIC_CACHE_MAX_SIZE: int = 1000       # 缓存的最大条目数（LRU淘汰）
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600    # 缓存条目的存活时间（秒）
+
+    # --- 启动预热配置 ---
+    WARMUP_ON_STARTUP: bool = True            # 是否在应用启动时预先创建并预热RAG链
+    WARMUP_LLM_PING: bool = False             # 预热时是否向vLLM发送一个只生成1个token的请求
+    WARMUP_RETRY_INTERVAL_SECONDS: int = 30   # 预热失败（例如知识库尚未灌输）后的重试间隔（秒）
+
+    # --- 流式响应配置 ---
+    SSE_COALESCE_MAX_DELAY_MS: int = 30       # 合并相邻答案token的最长等待时间（毫秒），0表示逐token发送
+    SSE_COALESCE_MAX_CHARS: int = 64          # 单个stream事件合并的最大字符数，0表示只按时间合并
 
     # --- vLLM配置 ---
     LLM_MODEL_NAME: str       # vLLM加载的大语言模型名称
     VLLM_API_BASE: str        # vLLM提供的OpenAI兼容API的基础URL
     VLLM_API_KEY: str         # vLLM API的密钥（本地部署通常为"EMPTY"）
+    LLM_TOKENIZER_PATH: str = ""                 # 大模型分词器的本地路径（例如vLLM加载的模型目录），用于精确计算token数；为空时按字符估算
+    LLM_MAX_CONCURRENCY: int = 16                # 每个worker同时发往vLLM的最大生成请求数，0表示不限制
+    LLM_MAX_QUEUE: int = 64                      # 超出并发上限的请求最多排队的数量，队列满时返回429
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 30.0      # 请求排队的最长时间（秒），超时则放弃
+    LLM_REQUEST_TIMEOUT_SECONDS: float = 120.0   # 单次生成请求的超时时间（秒）
+    LLM_HTTP_MAX_CONNECTIONS: int = 32           # 到vLLM的HTTP连接池的最大连接数
+    LLM_HTTP_MAX_KEEPALIVE: int = 16             # 连接池中保持的空闲keep-alive连接数
+    LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0  # 空闲keep-alive连接的保留时间（秒）
 
     # --- 数据库配置 ---
-    DATABASE_URL: str         # SQLAlchemy数据库连接URL
+    DATABASE_URL: str         # SQLAlchemy数据库连接URL（sqlite:// 会自动改用aiosqlite异步驱动）
+    DATABASE_POOL_SIZE: int = 10           # 数据库连接池大小
+    DATABASE_MAX_OVERFLOW: int = 20        # 连接池满时允许额外创建的连接数
+    DATABASE_BUSY_TIMEOUT_MS: int = 5000   # SQLite遇到写锁时的最长等待时间（毫秒）
+    MESSAGE_PERSISTENCE_MODE: str = "strict"  # 聊天消息的持久化模式：strict（逐条提交）或 batched（后台批量写入）
+    MESSAGE_BATCH_SIZE: int = 100          # batched模式下每个事务最多写入的消息数
+    MESSAGE_FLUSH_INTERVAL_MS: int = 200   # batched模式下后台写入的最长间隔（毫秒）
+    MESSAGE_WAIT_TIMEOUT_SECONDS: float = 10  # 读取或删除会话前等待其排队消息写入的最长时间（秒），超时返回503，0表示不限制
 
     class Config:
         # Pydantic V1直接使用 `env_file`。
@@ -1,19 +1,16 @@
-from typing import Generator
-from sqlalchemy.orm import Session
-from app.db.database import SessionLocal
+from typing import AsyncGenerator
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal
 
-def get_db() -> Generator[Session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
-    一个FastAPI依赖项，用于提供SQLAlchemy的数据库会话。
+    一个FastAPI依赖项，用于提供SQLAlchemy的异步数据库会话。
 
-    它通过try...finally块确保数据库会话在请求处理完毕后总是被关闭，
+    它通过async with块确保数据库会话在请求处理完毕后总是被关闭（连接归还连接池），
     即使在处理过程中发生了错误。
 
     Yields:
-        Generator[Session, None, None]: 一个SQLAlchemy会话生成器。
+        AsyncGenerator[AsyncSession, None]: 一个SQLAlchemy异步会话生成器。
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
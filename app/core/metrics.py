@@ -0,0 +1,173 @@
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+# 所有已创建的指标，按创建顺序排列，由 `render_prometheus` 导出
+REGISTRY: List["_Metric"] = []
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape_label_value(str(value))}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    """指标的公共部分：名称、说明和固定的标签（同名的指标以不同的标签区分）。"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels: Dict[str, str] = dict(labels or {})
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """一个线程安全的单调递增计数器。"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, labels: Optional[Dict[str, str]] = None):
+        super().__init__(name, description, labels)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"value": self._value}
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self._value)}"]
+
+
+class Gauge(_Metric):
+    """一个线程安全的、可增可减的瞬时值（例如当前排队数）。"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Optional[Dict[str, str]] = None):
+        super().__init__(name, description, labels)
+        self._value = 0.0
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"value": self._value}
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self._value)}"]
+
+
+class Histogram(_Metric):
+    """
+    一个线程安全的固定分桶直方图。
+
+    `buckets` 为各个桶的上边界（升序），超过最大边界的观测值计入 "+Inf" 桶。
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float],
+        labels: Optional[Dict[str, str]] = None,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回直方图当前状态：各桶的（非累积）计数、观测总数和观测值之和。"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, counts)),
+            "count": count,
+            "sum": total,
+            "avg": total / count if count else 0.0,
+        }
+
+    def samples(self) -> List[str]:
+        """Prometheus格式的样本：累积的各桶计数、观测值之和与观测总数。"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + [float("inf")], counts):
+            cumulative += n
+            labels = _format_labels({**self.labels, "le": _format_value(bound)})
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render_prometheus() -> str:
+    """
+    以Prometheus文本格式（0.0.4）导出所有指标。同名的指标（不同标签）合并在同一组 HELP/TYPE 之下。
+
+    指标保存在进程内存中：使用多个worker进程时，每次抓取得到的是处理该请求的worker的数值。
+    """
+    groups: Dict[str, List[_Metric]] = {}
+    for metric in list(REGISTRY):
+        groups.setdefault(metric.name, []).append(metric)
+    lines = []
+    for name, metrics in groups.items():
+        lines.append(f"# HELP {name} {metrics[0].description}")
+        lines.append(f"# TYPE {name} {metrics[0].type_name}")
+        for metric in metrics:
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,106 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from app.core.metrics import Counter, Gauge, Histogram
+
+# 一轮对话的各个阶段：
+#   history_load      读取聊天历史
+#   question_rewrite  根据聊天历史重写独立问题（没有历史时跳过）
+#   query_embed       独立问题向量化
+#   retrieval         混合检索（FAISS向量检索 + BM25）
+#   rerank            重排序（启用时）
+#   prompt_build      拼接上下文、构建问答Prompt
+#   first_token       从开始生成到大模型输出第一个答案token
+#   generation        从开始生成到答案全部输出
+#   persist           保存消息（batched模式下为放入写入队列）
+CHAT_STAGES = (
+    "history_load",
+    "question_rewrite",
+    "query_embed",
+    "retrieval",
+    "rerank",
+    "prompt_build",
+    "first_token",
+    "generation",
+    "persist",
+)
+
+_STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# --- 聊天请求的统计指标 ---
+CHAT_STAGE_LATENCY: Dict[str, Histogram] = {
+    stage: Histogram(
+        "rag_chat_stage_seconds",
+        "一轮对话中各阶段的耗时（秒）",
+        buckets=_STAGE_BUCKETS,
+        labels={"stage": stage},
+    )
+    for stage in CHAT_STAGES
+}
+CHAT_TURN_LATENCY = Histogram("rag_chat_turn_seconds", "一轮对话从收到请求到发送完毕的总耗时（秒）", buckets=_STAGE_BUCKETS)
+CHAT_TOKENS_STREAMED = Counter("rag_chat_tokens_streamed_total", "流式输出的答案token数（含语义缓存重放）")
+CHAT_ERRORS = Counter("rag_chat_errors_total", "以error事件结束的对话轮数")
+CHAT_ACTIVE_STREAMS = Gauge("rag_chat_active_streams", "正在进行的流式响应数")
+
+# 当前请求的各阶段耗时。在请求的任务中设置，RAG链各步骤（包括在子任务中执行的步骤）都能读取到
+_current_timings: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    一次聊天请求中各阶段的耗时（秒）。
+
+    `activate` 之后，同一请求中通过 `record_stage` / `stage` 记录的耗时都会累加到这里，
+    请求结束时可以用 `summary` 输出一行日志，定位一轮对话的时间花在了哪里。
+    通过 `record_count` 记录的数值（例如上下文的token数）也会输出在同一行中。
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def activate(self):
+        """将本对象设为当前上下文（请求的任务）的计时对象。"""
+        _current_timings.set(self)
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_count(self, name: str, value: int):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> str:
+        parts = [f"{stage}={self.stages[stage] * 1000:.0f}ms" for stage in CHAT_STAGES if stage in self.stages]
+        parts.append(f"total={self.elapsed() * 1000:.0f}ms")
+        return ", ".join(parts + [f"{name}={value}" for name, value in self.counts.items()])
+
+
+def record_stage(stage: str, seconds: float):
+    """记录一个阶段的耗时：写入该阶段的直方图，并累加到当前请求的计时对象（如果有）。"""
+    CHAT_STAGE_LATENCY[stage].observe(seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def record_count(name: str, value: int):
+    """将一个数值累加到当前请求的计时对象（如果有），在本轮的耗时日志中一并输出。"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_count(name, value)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录 `with` 块执行耗时的上下文管理器（见 `record_stage`）。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
@@ -1,80 +1,172 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional, Dict, Any
 
 from . import models
 
 # CRUD: Create, Read, Update, Delete
+# 所有操作都是异步的，通过 `await` 调用，等待数据库I/O时不会阻塞事件循环。
+
+# 会话标题的最大长度（取第一条消息的开头部分）
+CONVERSATION_TITLE_MAX_LENGTH = 50
 
 # -----------------------------------------------------------------------------
 # 会话 (Conversation) CRUD 操作
 # -----------------------------------------------------------------------------
 
-def create_conversation(db: Session) -> models.Conversation:
+async def create_conversation(db: AsyncSession) -> models.Conversation:
     """
     创建一个新的对话会话。
 
     Args:
-        db (Session): 数据库会话对象。
+        db (AsyncSession): 数据库会话对象。
 
     Returns:
         models.Conversation: 新创建的会话对象。
     """
     db_conversation = models.Conversation()
     db.add(db_conversation)
-    db.commit()
-    db.refresh(db_conversation)
+    await db.commit()
+    await db.refresh(db_conversation)
     return db_conversation
 
-def get_conversation(db: Session, conversation_id: int) -> Optional[models.Conversation]:
+async def get_conversation(
+    db: AsyncSession,
+    conversation_id: int,
+    with_messages: bool = False
+) -> Optional[models.Conversation]:
     """
     根据ID获取单个对话会话。
 
+    异步会话中不能隐式地懒加载关联对象，需要消息列表时应传入 `with_messages=True` 一并加载。
+
     Args:
-        db (Session): 数据库会话对象。
+        db (AsyncSession): 数据库会话对象。
         conversation_id (int): 会话的ID。
+        with_messages (bool): 是否同时加载该会话的所有消息。
 
     Returns:
         Optional[models.Conversation]: 找到的会话对象，如果不存在则为None。
     """
-    return db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
-
-def get_conversations(db: Session, skip: int = 0, limit: int = 100) -> List[models.Conversation]:
+    stmt = select(models.Conversation).where(models.Conversation.id == conversation_id)
+    if with_messages:
+        stmt = stmt.options(selectinload(models.Conversation.messages))
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_conversations(
+    db: AsyncSession,
+    before_id: Optional[int] = None,
+    limit: int = 100
+) -> List[models.Conversation]:
     """
-    获取所有对话会话的列表，支持分页。
+    获取对话会话的列表，按创建时间从新到旧排列，使用键集（keyset）分页。
+
+    会话ID随创建时间递增，因此按ID倒序即按创建时间倒序。下一页传入本页最后一个会话的ID
+    作为 `before_id`，查询直接沿主键索引定位，代价与翻页的深度无关（不同于OFFSET分页）。
+    不加载会话的消息，标题和消息数直接读取会话上的冗余字段。
 
     Args:
-        db (Session): 数据库会话对象。
-        skip (int): 跳过的记录数。
+        db (AsyncSession): 数据库会话对象。
+        before_id (Optional[int]): 只返回ID小于它的会话；为None时返回第一页。
         limit (int): 返回的最大记录数。
 
     Returns:
         List[models.Conversation]: 会话对象列表。
     """
-    return db.query(models.Conversation).order_by(models.Conversation.created_at.desc()).offset(skip).limit(limit).all()
+    stmt = select(models.Conversation)
+    if before_id is not None:
+        stmt = stmt.where(models.Conversation.id < before_id)
+    result = await db.execute(stmt.order_by(models.Conversation.id.desc()).limit(limit))
+    return list(result.scalars().all())
+
+async def add_conversation_stats(
+    db: AsyncSession,
+    conversation_id: int,
+    message_count: int,
+    first_content: str
+):
+    """
+    写入消息时同步更新会话的消息数，并在会话还没有标题时用第一条消息生成标题。
+
+    只执行UPDATE语句，不提交事务：应与插入消息在同一个事务中调用，使两者同时生效。
+
+    Args:
+        db (AsyncSession): 数据库会话对象。
+        conversation_id (int): 会话的ID。
+        message_count (int): 本次新增的消息数。
+        first_content (str): 本次新增的第一条消息的内容。
+    """
+    stmt = (
+        update(models.Conversation)
+        .where(models.Conversation.id == conversation_id)
+        .values(
+            message_count=models.Conversation.message_count + message_count,
+            title=func.coalesce(models.Conversation.title, first_content[:CONVERSATION_TITLE_MAX_LENGTH]),
+        )
+    )
+    await db.execute(stmt)
+
+async def update_conversation_summary(
+    db: AsyncSession,
+    conversation_id: int,
+    summary: str,
+    summarized_until_id: int,
+    expected_until_id: int,
+) -> bool:
+    """
+    更新会话的滚动摘要。
+
+    只有当数据库中的 `summarized_until_id` 仍等于 `expected_until_id` 时才会更新，
+    避免同一会话的两次并发摘要相互覆盖。
+
+    Args:
+        db (AsyncSession): 数据库会话对象。
+        conversation_id (int): 会话的ID。
+        summary (str): 新的摘要。
+        summarized_until_id (int): 新摘要包含的最后一条消息的ID。
+        expected_until_id (int): 生成新摘要时读取到的旧摘要位置。
+
+    Returns:
+        bool: 是否更新成功。
+    """
+    stmt = (
+        update(models.Conversation)
+        .where(
+            models.Conversation.id == conversation_id,
+            models.Conversation.summarized_until_id == expected_until_id,
+        )
+        .values(summary=summary, summarized_until_id=summarized_until_id)
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount > 0
 
-def delete_conversation(db: Session, conversation_id: int) -> Optional[models.Conversation]:
+async def delete_conversation(db: AsyncSession, conversation_id: int) -> Optional[models.Conversation]:
     """
     根据ID删除一个对话会话及其所有关联的消息。
 
     Args:
-        db (Session): 数据库会话对象。
+        db (AsyncSession): 数据库会话对象。
         conversation_id (int): 要删除的会话ID。
 
     Returns:
         Optional[models.Conversation]: 被删除的会话对象，如果不存在则为None。
     """
-    db_conversation = get_conversation(db, conversation_id)
+    # 一并加载消息，使ORM的级联删除无需再发起懒加载
+    db_conversation = await get_conversation(db, conversation_id, with_messages=True)
     if db_conversation:
-        db.delete(db_conversation)
-        db.commit()
+        await db.delete(db_conversation)
+        await db.commit()
     return db_conversation
 
 # -----------------------------------------------------------------------------
 # 消息 (Message) CRUD 操作
 # -----------------------------------------------------------------------------
 
-def create_message(
-    db: Session,
+async def create_message(
+    db: AsyncSession,
     conversation_id: int,
     content: str,
     message_type: str,
@@ -84,7 +176,7 @@ def create_message(
     在指定的会话中创建一条新消息。
 
     Args:
-        db (Session): 数据库会话对象。
+        db (AsyncSession): 数据库会话对象。
         conversation_id (int): 消息所属的会话ID。
         content (str): 消息内容。
         message_type (str): 消息类型，应为 'user' 或 'ai'。
@@ -100,19 +192,58 @@ def create_message(
         source_documents=source_documents
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await add_conversation_stats(db, conversation_id, 1, content)
+    await db.commit()
+    await db.refresh(db_message)
     return db_message
 
-def get_messages_by_conversation(db: Session, conversation_id: int) -> List[models.Message]:
+async def get_messages_by_conversation(db: AsyncSession, conversation_id: int) -> List[models.Message]:
     """
     根据会话ID获取所有消息，按时间升序排列。
 
     Args:
-        db (Session): 数据库会话对象。
+        db (AsyncSession): 数据库会话对象。
         conversation_id (int): 会话的ID。
 
     Returns:
         List[models.Message]: 该会话的消息列表。
     """
-    return db.query(models.Message).filter(models.Message.conversation_id == conversation_id).order_by(models.Message.created_at.asc()).all()
+    stmt = (
+        select(models.Message)
+        .where(models.Message.conversation_id == conversation_id)
+        .order_by(models.Message.created_at.asc())
+    )
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+async def get_recent_messages(
+    db: AsyncSession,
+    conversation_id: int,
+    after_id: int = 0,
+    before_id: Optional[int] = None,
+    limit: int = 20,
+) -> List[models.Message]:
+    """
+    获取会话中最近的若干条消息，按时间升序排列。
+
+    只读取ID在 (`after_id`, `before_id`) 范围内的最近 `limit` 条消息，
+    查询代价与会话的总长度无关。
+
+    Args:
+        db (AsyncSession): 数据库会话对象。
+        conversation_id (int): 会话的ID。
+        after_id (int): 只返回ID大于它的消息（例如已合并进摘要的消息之后）。
+        before_id (Optional[int]): 只返回ID小于它的消息（例如排除当前轮的用户消息）。
+        limit (int): 返回的最大消息数。
+
+    Returns:
+        List[models.Message]: 消息列表。
+    """
+    stmt = select(models.Message).where(
+        models.Message.conversation_id == conversation_id,
+        models.Message.id > after_id,
+    )
+    if before_id is not None:
+        stmt = stmt.where(models.Message.id < before_id)
+    result = await db.execute(stmt.order_by(models.Message.id.desc()).limit(limit))
+    return list(reversed(result.scalars().all()))
@@ -1,22 +1,131 @@
-from sqlalchemy import create_engine
+from typing import List
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
-# 创建一个SQLAlchemy引擎实例。
-# `connect_args={"check_same_thread": False}` 这个参数是SQLite特有的，
-# 用于允许多线程访问数据库，这在使用FastAPI的异步特性时是必需的。
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
 
-# 创建一个SessionLocal类。这个类的每个实例都将是一个独立的数据库会话。
-# autocommit=False 和 autoflush=False 确保事务需要手动提交，
-# 给予开发者更多的控制权。
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _async_database_url(database_url: str) -> str:
+    """
+    将数据库URL转换为对应的异步驱动。
+
+    `.env` 中通常写的是 `sqlite:///./app.db`，这里自动改用aiosqlite驱动；
+    已经显式指定了驱动（如 `sqlite+aiosqlite://`、`postgresql+asyncpg://`）的URL保持不变。
+    """
+    url = make_url(database_url)
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+_database_url = make_url(_async_database_url(settings.DATABASE_URL))
+_is_sqlite = _database_url.get_backend_name() == "sqlite"
+_is_memory_sqlite = _is_sqlite and _database_url.database in (None, "", ":memory:")
+
+_engine_kwargs = {"pool_pre_ping": True}
+if not _is_memory_sqlite:
+    # 内存数据库只能使用单个连接（StaticPool），不支持连接池参数
+    _engine_kwargs.update(
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    )
+if _is_sqlite:
+    # 驱动层面的锁等待时间（秒），与下方的busy_timeout保持一致
+    _engine_kwargs["connect_args"] = {"timeout": settings.DATABASE_BUSY_TIMEOUT_MS / 1000}
+
+# 创建一个异步SQLAlchemy引擎实例。
+# 所有数据库操作都通过异步会话执行，不会阻塞FastAPI的事件循环；
+# 连接池让并发的请求各自使用独立的连接，而不是在同一个连接上排队。
+engine = create_async_engine(_database_url, **_engine_kwargs)
+
+
+if _is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        为每个新的SQLite连接设置PRAGMA：
+        - WAL日志模式：读操作不会被写操作阻塞，多个连接可以并发读取。
+        - busy_timeout：遇到写锁时等待而不是立即报 "database is locked"。
+        - synchronous=NORMAL：WAL模式下既安全又能大幅减少fsync次数。
+        - foreign_keys：启用外键约束。
+        """
+        cursor = dbapi_connection.cursor()
+        if not _is_memory_sqlite:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.DATABASE_BUSY_TIMEOUT_MS)}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+# 创建一个AsyncSessionLocal类。这个类的每个实例都将是一个独立的异步数据库会话。
+# autoflush=False 确保事务需要手动提交，给予开发者更多的控制权；
+# expire_on_commit=False 使提交后仍可直接读取对象的属性，而不会触发隐式的（异步环境下不允许的）刷新查询。
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # 创建一个Base类。我们项目中的所有ORM模型都将继承自这个类。
 # SQLAlchemy会使用这个基类来发现和映射所有的数据表。
 Base = declarative_base()
+
+
+def add_missing_columns(connection) -> List[str]:
+    """
+    为已存在的表补充ORM模型中新增的列。
+
+    `Base.metadata.create_all` 只会创建不存在的表，不会修改已有的表。
+    本项目没有引入数据库迁移工具，新增的列都是可空的或带有服务器默认值的，
+    因此可以直接通过 `ALTER TABLE ... ADD COLUMN` 补齐。
+
+    Args:
+        connection: 同步连接（在异步引擎上通过 `conn.run_sync(add_missing_columns)` 调用）。
+
+    Returns:
+        List[str]: 新增的列，格式为 "表名.列名"。
+    """
+    added = []
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+            connection.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def add_missing_indexes(connection):
+    """为已存在的表补充ORM模型中新增的索引（同样只有 `create_all` 无法覆盖的情况才需要）。"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+# 为升级前创建的会话回填标题和消息数（标题长度与 crud.CONVERSATION_TITLE_MAX_LENGTH 一致）
+_BACKFILL_CONVERSATION_STATS = text("""
+UPDATE conversations SET
+    message_count = (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id),
+    title = (
+        SELECT substr(content, 1, 50) FROM messages
+        WHERE messages.conversation_id = conversations.id
+        ORDER BY messages.id LIMIT 1
+    )
+""")
+
+
+async def init_db():
+    """创建所有在ORM模型中定义的表，并为旧版本创建的表补充新增的列和索引。"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        added = await conn.run_sync(add_missing_columns)
+        await conn.run_sync(add_missing_indexes)
+        if "conversations.message_count" in added:
+            await conn.execute(_BACKFILL_CONVERSATION_STATS)
@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text, Index
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -13,6 +13,16 @@ class Conversation(Base):
     id = Column(Integer, primary_key=True, index=True, comment="会话ID，主键")
     created_at = Column(DateTime, default=datetime.datetime.utcnow, comment="会话创建时间")
 
+    # 标题和消息数在写入消息时同步更新，会话列表无需加载任何消息。
+    title = Column(String(50), nullable=True, comment="会话标题（第一条消息的开头部分）")
+    message_count = Column(Integer, nullable=False, default=0, server_default="0", comment="会话中的消息数")
+
+    # 较早对话轮次的滚动摘要。超出历史窗口的消息会被增量地合并进这个摘要，
+    # 而不是每一轮都把全部历史发给大模型。
+    summary = Column(Text, nullable=True, comment="较早对话轮次的滚动摘要")
+    # 已合并进摘要的最后一条消息的ID，ID不大于它的消息不再需要读取
+    summarized_until_id = Column(Integer, nullable=False, default=0, server_default="0", comment="已合并进摘要的最后一条消息ID")
+
     # 'relationship' 定义了与Message模型的一对多关系。
     # 'back_populates' 指明了在Message模型中对应的反向关系属性。
     # 'cascade="all, delete-orphan"' 表示当一个Conversation被删除时，
@@ -42,3 +52,8 @@ class Message(Base):
 
     # 定义与Conversation模型的反向关系
     conversation = relationship("Conversation", back_populates="messages")
+
+    # 按会话读取消息并按时间排序是最常见的查询，使用复合索引避免全表扫描和额外排序
+    __table_args__ = (
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),
+    )
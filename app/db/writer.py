@@ -0,0 +1,258 @@
+import asyncio
+import datetime
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from . import crud, models
+from .database import AsyncSessionLocal
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PERSISTENCE_MODES = ("strict", "batched")
+
+
+class PendingWritesTimeoutError(RuntimeError):
+    """等待写入队列中的消息提交超时（例如数据库暂时不可用）。"""
+
+
+@dataclass
+class PendingMessage:
+    """
+    一条已进入写入队列、尚未（或刚刚）提交到数据库的消息。
+
+    它与 `models.Message` 有相同的 `content`、`message_type` 等属性，读取聊天历史时可以直接混用。
+    `id` 在写入数据库后才会被赋值。
+    """
+    conversation_id: int
+    content: str
+    message_type: str
+    source_documents: Optional[List[Dict[str, Any]]] = None
+    created_at: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    id: Optional[int] = None
+    committed: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class MessageWriter:
+    """
+    聊天消息的写入器，支持两种模式（配置项 MESSAGE_PERSISTENCE_MODE）：
+
+    - strict：每条消息单独提交（与 `crud.create_message` 相同），返回时消息已持久化。
+    - batched：消息先进入进程内的写入队列，由后台任务在队列达到 `batch_size` 条或每隔
+      `flush_interval_ms` 毫秒时，用一个事务批量写入。高峰期每轮对话不再各自触发多次fsync。
+      应用关闭时会把队列中剩余的消息全部写入。进程意外崩溃时，最近一个刷新间隔内的消息可能丢失。
+
+    读取某个会话的聊天历史时，应通过 `pending_messages` 合并该会话尚未写入的消息，
+    或通过 `wait_for` 等待它们写入，以保证能读到自己刚写的内容。
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        mode: str = "strict",
+        batch_size: int = 100,
+        flush_interval_ms: float = 200,
+        wait_timeout_seconds: float = 10,
+    ):
+        if mode not in PERSISTENCE_MODES:
+            raise ValueError(f"不支持的消息持久化模式: {mode}，可选值为 {', '.join(PERSISTENCE_MODES)}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000.0
+        self.wait_timeout = wait_timeout_seconds
+
+        self._queue: List[PendingMessage] = []
+        # 按会话索引的未写入消息（包括正在写入、尚未确认提交的消息）
+        self._pending: Dict[int, List[PendingMessage]] = {}
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def batched(self) -> bool:
+        return self.mode == "batched"
+
+    # --- 生命周期 ---
+
+    def start(self):
+        """启动后台刷新任务（batched模式下，必须在事件循环中调用）。"""
+        if not self.batched or (self._task is not None and not self._task.done()):
+            return
+        self._stopping = False
+        self._flush_requested = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="message-writer")
+
+    async def stop(self):
+        """停止后台刷新任务，并将队列中剩余的消息全部写入数据库。"""
+        if self._task is not None:
+            # 不直接取消任务，以免中断一个正在提交的事务
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        while self._queue:
+            if not await self._flush_batch():
+                logging.error(f"关闭时仍有 {len(self._queue)} 条消息无法写入数据库。")
+                return
+        if self.batched:
+            logging.info("消息写入队列已全部写入数据库。")
+
+    # --- 写入 ---
+
+    async def add(
+        self,
+        db: AsyncSession,
+        conversation_id: int,
+        content: str,
+        message_type: str,
+        source_documents: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        保存一条消息。
+
+        strict模式下使用传入的数据库会话立即提交，返回 `models.Message`；
+        batched模式下放入写入队列并立即返回 `PendingMessage`。
+        """
+        if not self.batched:
+            return await crud.create_message(
+                db,
+                conversation_id=conversation_id,
+                content=content,
+                message_type=message_type,
+                source_documents=source_documents,
+            )
+
+        self.start()
+        message = PendingMessage(
+            conversation_id=conversation_id,
+            content=content,
+            message_type=message_type,
+            source_documents=source_documents,
+        )
+        self._queue.append(message)
+        self._pending.setdefault(conversation_id, []).append(message)
+        if len(self._queue) >= self.batch_size:
+            self._flush_requested.set()
+        return message
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            while self._queue:
+                if not await self._flush_batch():
+                    # 数据库暂时不可用时，等到下一个刷新间隔再重试
+                    break
+
+    async def _flush_batch(self) -> bool:
+        """将队列头部的至多 `batch_size` 条消息在一个事务中写入。返回是否成功。"""
+        batch = self._queue[:self.batch_size]
+        try:
+            await self._insert(batch)
+            return True
+        except IntegrityError as e:
+            # 个别消息违反约束（例如所属会话已被删除）时，逐条重试，只丢弃无法写入的消息
+            logging.warning(f"批量写入 {len(batch)} 条消息失败，改为逐条写入: {e}")
+        except Exception as e:
+            # 数据库暂时不可用（例如锁等待超时）时，保留队列，稍后重试
+            logging.error(f"批量写入 {len(batch)} 条消息失败，稍后重试: {e}", exc_info=True)
+            return False
+
+        for message in batch:
+            try:
+                await self._insert([message])
+            except IntegrityError as e:
+                logging.error(f"会话 {message.conversation_id} 的消息无法写入，已丢弃: {e}")
+                self._complete([message], e)
+            except Exception as e:
+                logging.error(f"写入会话 {message.conversation_id} 的消息失败，稍后重试: {e}", exc_info=True)
+                return False
+        return True
+
+    async def _insert(self, batch: List[PendingMessage]):
+        async with self.session_factory() as db:
+            rows = [
+                models.Message(
+                    conversation_id=message.conversation_id,
+                    content=message.content,
+                    message_type=message.message_type,
+                    source_documents=message.source_documents,
+                    created_at=message.created_at,
+                )
+                for message in batch
+            ]
+            db.add_all(rows)
+            # 在同一个事务中更新各会话的消息数和标题
+            added: Dict[int, List[PendingMessage]] = {}
+            for message in batch:
+                added.setdefault(message.conversation_id, []).append(message)
+            for conversation_id, messages in added.items():
+                await crud.add_conversation_stats(db, conversation_id, len(messages), messages[0].content)
+            await db.flush()
+            # 提交之前先记下数据库分配的ID：读取历史时，已能从数据库中读到的消息按ID去重
+            for message, row in zip(batch, rows):
+                message.id = row.id
+            await db.commit()
+        self._complete(batch)
+
+    def _complete(self, batch: List[PendingMessage], error: Optional[Exception] = None):
+        """将已处理的消息移出队列和会话索引，并通知等待者。"""
+        done = {id(message) for message in batch}
+        self._queue = [message for message in self._queue if id(message) not in done]
+        for message in batch:
+            pending = self._pending.get(message.conversation_id)
+            if pending is not None:
+                pending[:] = [m for m in pending if m is not message]
+                if not pending:
+                    del self._pending[message.conversation_id]
+            if not message.committed.done():
+                if error is None:
+                    message.committed.set_result(message.id)
+                else:
+                    message.committed.set_exception(error)
+                    # 没有人等待时，避免asyncio报告"Future exception was never retrieved"
+                    message.committed.exception()
+
+    # --- 读取 ---
+
+    def pending_messages(self, conversation_id: int) -> List[PendingMessage]:
+        """返回某个会话尚未确认写入的消息，按写入顺序排列。"""
+        return list(self._pending.get(conversation_id, ()))
+
+    async def wait_for(self, conversation_id: int):
+        """
+        等待某个会话当前所有未写入的消息写入数据库（或写入失败）。
+
+        数据库不可用时写入队列会一直重试；超过 `wait_timeout` 秒仍未写入时抛出 `PendingWritesTimeoutError`，
+        消息仍留在队列中。
+        """
+        pending = self.pending_messages(conversation_id)
+        if not pending:
+            return
+        # 使用asyncio.wait而不是wait_for：超时时不能取消消息的committed，其他等待者和写入任务仍依赖它
+        _, not_done = await asyncio.wait(
+            [message.committed for message in pending],
+            timeout=self.wait_timeout if self.wait_timeout > 0 else None,
+        )
+        if not_done:
+            raise PendingWritesTimeoutError(
+                f"会话 {conversation_id} 有 {len(not_done)} 条消息在 {self.wait_timeout} 秒内未能写入数据库"
+            )
+
+
+# 创建一个全局的消息写入器实例
+message_writer = MessageWriter(
+    mode=settings.MESSAGE_PERSISTENCE_MODE,
+    batch_size=settings.MESSAGE_BATCH_SIZE,
+    flush_interval_ms=settings.MESSAGE_FLUSH_INTERVAL_MS,
+    wait_timeout_seconds=settings.MESSAGE_WAIT_TIMEOUT_SECONDS,
+)
@@ -1,26 +1,46 @@
+import asyncio
 import logging
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api import endpoints
-from app.db.database import Base, engine
+from app.core.config import settings
+from app.core.metrics import render_prometheus
+from app.db.database import init_db
+from app.db.writer import message_writer
+from app.rag.chain import is_ready, vector_store_reloader, warm_up_rag_chain
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def create_db_and_tables():
+async def create_db_and_tables():
     """
-    创建数据库和所有在ORM模型中定义的表。
+    创建数据库和所有在ORM模型中定义的表，并为旧版本创建的表补充新增的列。
     这个函数会在应用启动时被调用。
     """
     logging.info("正在创建数据库和表...")
     try:
-        Base.metadata.create_all(bind=engine)
+        await init_db()
         logging.info("数据库和表已成功创建。")
     except Exception as e:
         logging.error(f"创建数据库表时出错: {e}", exc_info=True)
         raise
 
+async def warm_up():
+    """
+    在后台创建并预热RAG链，失败时（例如知识库尚未灌输）按间隔重试，直到成功。
+    预热在线程池中执行，期间应用可以正常响应健康检查，/ready 返回未就绪。
+    """
+    loop = asyncio.get_running_loop()
+    while not await loop.run_in_executor(None, warm_up_rag_chain):
+        logging.warning(f"RAG链预热未成功，将在 {settings.WARMUP_RETRY_INTERVAL_SECONDS} 秒后重试。")
+        await asyncio.sleep(settings.WARMUP_RETRY_INTERVAL_SECONDS)
+
+# 后台预热任务和向量数据库热加载任务（保留引用，避免任务被垃圾回收）
+warm_up_task = None
+reload_task = None
+
 # 创建FastAPI应用实例
 app = FastAPI(
     title="企业级RAG智能客服API",
@@ -30,11 +50,33 @@ app = FastAPI(
 
 # 应用启动时执行的事件处理器
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """
     应用启动时的事件处理函数。
     """
-    create_db_and_tables()
+    await create_db_and_tables()
+    # batched持久化模式下启动消息的后台写入任务
+    message_writer.start()
+    # 预先创建并预热RAG链，第一个用户请求无需等待模型和索引加载
+    global warm_up_task, reload_task
+    if settings.WARMUP_ON_STARTUP:
+        warm_up_task = asyncio.create_task(warm_up())
+    # 定期检查数据灌输是否发布了新的向量数据库版本，有则在后台加载并切换，无需重启服务。
+    # 使用检索服务进程时由服务进程负责热加载
+    if settings.VECTOR_STORE_RELOAD_INTERVAL_SECONDS > 0 and not settings.RETRIEVAL_SIDECAR_SOCKET:
+        reload_task = asyncio.create_task(vector_store_reloader.watch(settings.VECTOR_STORE_RELOAD_INTERVAL_SECONDS))
+
+# 应用关闭时执行的事件处理器
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    应用关闭时的事件处理函数。
+    将写入队列中尚未提交的聊天消息全部写入数据库。
+    """
+    for task in (warm_up_task, reload_task):
+        if task is not None:
+            task.cancel()
+    await message_writer.stop()
 
 # CORS（跨域资源共享）策略现在由Nginx反向代理处理。
 # 因此，不再需要在FastAPI应用层添加CORS中间件。
@@ -57,3 +99,25 @@ def read_root():
     根节点，用于检查服务是否正在运行。
     """
     return {"status": "ok", "message": "欢迎使用企业级RAG智能客服API!"}
+
+# 用于就绪检查的节点
+@app.get("/ready", tags=["健康检查"])
+def read_ready():
+    """
+    就绪检查节点。RAG链创建并预热完成之前返回503，供负载均衡和容器编排工具判断
+    是否可以向这个worker转发流量。根节点 `/` 只表示进程存活。
+    """
+    if settings.WARMUP_ON_STARTUP and not is_ready():
+        return JSONResponse(status_code=503, content={"status": "warming_up", "message": "RAG链正在预热。"})
+    return {"status": "ready"}
+
+# Prometheus指标导出节点
+@app.get("/metrics", tags=["监控"], response_class=PlainTextResponse)
+def read_metrics():
+    """
+    以Prometheus文本格式导出本worker进程的指标：一轮对话各阶段的耗时直方图
+    （rag_chat_stage_seconds）、输出的token数、错误数、正在进行的流式响应数，
+    以及查询向量化、重排序和大模型准入控制的指标。
+    """
+    # starlette会自动追加 "; charset=utf-8"
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
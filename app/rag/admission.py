@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- 大模型调用准入控制的统计指标 ---
+LLM_IN_FLIGHT = Gauge("rag_llm_in_flight", "正在进行的大模型生成请求数")
+LLM_QUEUE_DEPTH = Gauge("rag_llm_queue_depth", "等待发往大模型的生成请求数")
+LLM_QUEUE_WAIT = Histogram(
+    "rag_llm_queue_wait_seconds",
+    "生成请求从进入等待队列到获得执行名额的等待时间（秒）",
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+)
+LLM_REJECTED = Counter("rag_llm_rejected_total", "因等待队列已满或等待超时而被拒绝的生成请求数")
+
+# 重试提示（秒）的取值范围
+_MIN_RETRY_AFTER = 1
+_MAX_RETRY_AFTER = 60
+
+
+def get_llm_stats() -> dict:
+    """返回大模型调用的并发数、排队数、排队等待直方图及拒绝次数。"""
+    return {
+        "max_concurrency": llm_limiter.max_concurrency,
+        "max_queue": llm_limiter.max_queue,
+        "in_flight": LLM_IN_FLIGHT.value,
+        "queue_depth": LLM_QUEUE_DEPTH.value,
+        "queue_wait_seconds": LLM_QUEUE_WAIT.snapshot(),
+        "rejected": LLM_REJECTED.value,
+    }
+
+
+class LLMOverloadedError(RuntimeError):
+    """大模型繁忙：等待队列已满，或排队超时。`retry_after` 为建议的重试间隔（秒）。"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    发往大模型的生成请求的并发限制器（每个worker进程一个）。
+
+    同时进行的请求数不超过 `max_concurrency`，超出的请求按到达顺序进入等待队列，
+    队列最多容纳 `max_queue` 个请求。队列已满时立即拒绝，排队超过 `queue_timeout` 秒也会被拒绝，
+    两种情况都抛出 `LLMOverloadedError`，由调用方转换为HTTP 429或SSE错误事件。
+    这样突发流量不会全部堆积到vLLM中，已接受的请求的首token延迟保持稳定。
+    `max_concurrency` 为0时不做限制。
+
+    只能在同一个事件循环中使用。
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, queue_timeout: float = 30.0):
+        self.max_concurrency = max(0, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # 每个请求占用名额时长的指数移动平均（秒），用于估算重试提示
+        self._avg_hold: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def is_saturated(self) -> bool:
+        """新到达的请求是否会被立即拒绝（名额已满且等待队列已满）。"""
+        return (
+            self.enabled
+            and self._in_flight >= self.max_concurrency
+            and len(self._waiters) >= self.max_queue
+        )
+
+    def retry_after(self) -> int:
+        """估算排在队尾的请求获得名额所需的时间，作为客户端的重试提示（秒）。"""
+        if not self.enabled or self._avg_hold is None:
+            return _MIN_RETRY_AFTER
+        estimate = self._avg_hold * (len(self._waiters) + 1) / self.max_concurrency
+        return int(min(_MAX_RETRY_AFTER, max(_MIN_RETRY_AFTER, math.ceil(estimate))))
+
+    def _update_gauges(self):
+        LLM_IN_FLIGHT.set(self._in_flight)
+        LLM_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _reject(self, reason: str) -> LLMOverloadedError:
+        LLM_REJECTED.inc()
+        retry_after = self.retry_after()
+        logging.warning(f"大模型繁忙，拒绝生成请求（{reason}），建议 {retry_after} 秒后重试。")
+        return LLMOverloadedError(f"大模型服务繁忙（{reason}），请稍后重试。", retry_after)
+
+    async def acquire(self):
+        """获取一个执行名额。队列已满或排队超时时抛出 `LLMOverloadedError`。"""
+        if not self.enabled:
+            return
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            self._update_gauges()
+            LLM_QUEUE_WAIT.observe(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("等待队列已满")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            # 名额由 `release` 直接转交给队首的等待者，`_in_flight` 保持不变
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout if self.queue_timeout > 0 else None)
+        except asyncio.TimeoutError:
+            raise self._reject("排队超时") from None
+        except asyncio.CancelledError:
+            # 名额刚转交过来时调用方被取消（例如客户端断开），把名额还回去
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            self._update_gauges()
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - start)
+
+    def release(self):
+        """归还一个执行名额：优先转交给排在最前面、仍在等待的请求。"""
+        if not self.enabled:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._in_flight -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """在 `async with` 块的执行期间占用一个名额。"""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self._avg_hold = held if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held
+            self.release()
+
+
+class AdmissionControlledChatOpenAI(ChatOpenAI):
+    """
+    每次异步生成（包括流式生成的整个过程）都先从 `llm_limiter` 获取名额的 `ChatOpenAI`。
+
+    问题重写、答案生成和历史摘要的调用都经过这里，共享同一个并发上限。
+    同步调用（`invoke` / `stream`，例如启动预热时的探测请求）不受限制。
+    """
+
+    async def _astream(self, *args, **kwargs) -> AsyncIterator:
+        async with llm_limiter.slot():
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+    async def _agenerate(self, *args, **kwargs):
+        if self.streaming:
+            # 流式模式下父类会转而调用 `_astream`，名额在那里获取
+            return await super()._agenerate(*args, **kwargs)
+        async with llm_limiter.slot():
+            return await super()._agenerate(*args, **kwargs)
+
+
+# 创建一个全局的并发限制器实例
+llm_limiter = ConcurrencyLimiter(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.core.config import settings
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+@dataclass
+class CachedAnswer:
+    """语义缓存中的一条记录：一个已完成回答的全部token及其溯源文档。"""
+    question: str
+    tokens: List[str]
+    source_documents: List[Document]
+    expires_at: float
+
+
+class SemanticCache:
+    """
+    基于问题向量相似度的答案缓存。
+
+    缓存的键是“独立问题”的嵌入向量。查询时计算新问题向量与所有缓存向量的余弦相似度，
+    若最高相似度不低于阈值，则视为命中，直接返回缓存的答案token和溯源文档，
+    从而跳过FAISS检索和LLM生成。
+
+    - 容量上限：超过 `max_size` 时按LRU顺序淘汰最久未使用的记录。
+    - 过期时间：每条记录在写入 `ttl_seconds` 秒后失效。
+    - 失效机制：RAG链切换到向量数据库的新版本时调用 `clear` 清空整个缓存
+      （见 app/rag/chain.py 中的 `_swap_retriever`），查询和写入时不访问文件系统。
+      `generation` 在每次清空时加1：回答开始时记下它，写入时若缓存已被清空过，
+      说明答案可能来自旧版本的知识库，不再写入。
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, threshold: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        # 槽位号 -> 缓存记录，按最近使用顺序排列（末尾为最近使用）
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        # 所有槽位的归一化向量矩阵，首次写入时按向量维度分配
+        self._vectors: Optional[np.ndarray] = None
+        self._occupied = np.zeros(max_size, dtype=bool)
+        self._expires_at = np.zeros(max_size, dtype=np.float64)
+        self._free_slots = list(range(max_size - 1, -1, -1))
+
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # --- 内部辅助方法 ---
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._occupied[:] = False
+        self._free_slots = list(range(self.max_size - 1, -1, -1))
+
+    def _release_slot(self, slot: int):
+        self._entries.pop(slot, None)
+        self._occupied[slot] = False
+        self._free_slots.append(slot)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    # --- 公共接口 ---
+
+    def lookup(self, query_vector) -> Optional[CachedAnswer]:
+        """
+        查找与给定问题向量足够相似的缓存答案。
+
+        Args:
+            query_vector: 独立问题的嵌入向量。
+
+        Returns:
+            Optional[CachedAnswer]: 命中时返回缓存记录，否则返回None。
+        """
+        q = self._normalize(query_vector)
+        with self._lock:
+            if not self._entries or self._vectors is None or self._vectors.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            similarities = self._vectors @ q
+            valid = self._occupied & (self._expires_at > now)
+            similarities[~valid] = -np.inf
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot]
+
+    def add(
+        self,
+        query_vector,
+        question: str,
+        tokens: List[str],
+        source_documents: List[Document],
+        generation: Optional[int] = None,
+    ):
+        """
+        将一个完整的回答写入缓存。
+
+        Args:
+            query_vector: 独立问题的嵌入向量。
+            question (str): 独立问题文本，仅用于日志和调试。
+            tokens (List[str]): 按流式输出顺序排列的答案token。
+            source_documents (List[Document]): 生成该答案所依据的溯源文档。
+            generation (Optional[int]): 开始生成该回答时的 `generation`。此后缓存被清空过则不写入。
+        """
+        if not tokens or self.max_size <= 0:
+            return
+        q = self._normalize(query_vector)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self._vectors is None or self._vectors.shape[1] != q.shape[0]:
+                self._vectors = np.zeros((self.max_size, q.shape[0]), dtype=np.float32)
+                self._clear_locked()
+
+            now = time.time()
+            if not self._free_slots:
+                # 优先回收已过期的记录，否则淘汰最久未使用的记录
+                expired = [s for s, e in self._entries.items() if e.expires_at <= now]
+                for s in expired:
+                    self._release_slot(s)
+                if not self._free_slots:
+                    oldest_slot = next(iter(self._entries))
+                    self._release_slot(oldest_slot)
+                self.evictions += max(len(expired), 1)
+
+            slot = self._free_slots.pop()
+            expires_at = now + self.ttl_seconds
+            self._vectors[slot] = q
+            self._occupied[slot] = True
+            self._expires_at[slot] = expires_at
+            self._entries[slot] = CachedAnswer(
+                question=question,
+                tokens=list(tokens),
+                source_documents=list(source_documents),
+                expires_at=expires_at,
+            )
+
+    def clear(self):
+        """清空整个缓存。"""
+        with self._lock:
+            self._clear_locked()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存的命中/未命中计数及当前大小。"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": settings.SEMANTIC_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# 全局语义缓存实例，在整个应用生命周期内共享。
+semantic_cache = SemanticCache(
+    max_size=settings.SEMANTIC_CACHE_MAX_SIZE,
+    ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+)
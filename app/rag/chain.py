@@ -1,31 +1,73 @@
+import asyncio
 import logging
-from typing import List, Tuple
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.schema import format_document
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import httpx
 from langchain.schema.output_parser import StrOutputParser
-from langchain.schema.runnable import RunnablePassthrough, RunnableLambda, RunnableMap
-from langchain.prompts import PromptTemplate
+from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
+from langchain.schema.runnable.utils import AddableDict
+from langchain.docstore.document import Document
 
 from app.core.config import settings
+from app.core.timing import CHAT_TOKENS_STREAMED, record_count, record_stage, stage
 from app.rag.prompts import QA_PROMPT, CONTEXTUALIZE_Q_PROMPT
+from app.rag.admission import AdmissionControlledChatOpenAI
+from app.rag.cache import CachedAnswer, semantic_cache
+from app.rag.context import assemble_context
+from app.rag.embedding_backends import create_embedding_model
+from app.rag.embeddings import BatchingEmbeddings
+from app.rag.history import format_chat_history
+from app.rag.index import apply_search_params
+from app.rag.rerank import CrossEncoderReranker
+from app.rag.retrieval import HybridRetriever
+from app.rag.sidecar import SidecarClient, SidecarEmbeddings, SidecarRetriever
+from app.rag.reload import VectorStoreReloader
+from app.rag.store import load_sparse_index, load_vector_store, resolve_store_version
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- 1. 加载必要的组件 ---
 
+# 发往vLLM的HTTP连接池，由所有LLM客户端（问答链和历史摘要）共享
+_llm_http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_llm_http_clients_lock = threading.Lock()
+
+def _get_llm_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    返回发往vLLM的同步和异步HTTP客户端。
+
+    连接池按并发上限配置：保持足够的keep-alive连接，生成请求不必每次重新建立TCP连接；
+    空闲超过 LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS 的连接会被关闭。
+    """
+    global _llm_http_clients
+    with _llm_http_clients_lock:
+        if _llm_http_clients is None:
+            limits = httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            )
+            _llm_http_clients = (httpx.Client(limits=limits), httpx.AsyncClient(limits=limits))
+        return _llm_http_clients
+
 def get_llm():
-    """初始化并返回大语言模型客户端。"""
+    """初始化并返回大语言模型客户端。异步生成请求受 `llm_limiter` 的并发限制。"""
     logging.info("正在初始化LLM客户端...")
     try:
-        llm = ChatOpenAI(
+        http_client, http_async_client = _get_llm_http_clients()
+        llm = AdmissionControlledChatOpenAI(
             model=settings.LLM_MODEL_NAME,
             openai_api_base=settings.VLLM_API_BASE,
             openai_api_key=settings.VLLM_API_KEY,
             temperature=0.1,  # 较低的温度使回答更具事实性
-            streaming=True    # 开启流式输出
+            streaming=True,   # 开启流式输出
+            request_timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
         logging.info("LLM客户端初始化成功。")
         return llm
@@ -35,11 +77,15 @@ def get_llm():
 
 def get_embeddings():
     """初始化并返回嵌入模型。"""
-    logging.info(f"正在加载嵌入模型: {settings.EMBEDDING_MODEL_NAME}")
+    logging.info(f"正在加载嵌入模型: {settings.EMBEDDING_MODEL_NAME}（{settings.EMBEDDING_BACKEND}后端）")
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL_NAME,
-            model_kwargs={'device': 'cpu'}  # 如果有GPU，可改为'cuda'
+        embeddings = create_embedding_model()
+        # 在模型前加一层微批处理和LRU缓存，合并并发的查询向量化请求
+        embeddings = BatchingEmbeddings(
+            embeddings,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+            cache_size=settings.EMBEDDING_QUERY_CACHE_SIZE,
         )
         logging.info("嵌入模型加载成功。")
         return embeddings
@@ -47,38 +93,128 @@ def get_embeddings():
         logging.error(f"加载嵌入模型失败: {e}", exc_info=True)
         raise
 
-def get_retriever(embeddings):
-    """初始化并返回FAISS检索器。"""
-    vector_store_path = settings.VECTOR_STORE_PATH
+def get_retriever(embeddings, vector_store_path: Optional[str] = None) -> HybridRetriever:
+    """
+    初始化并返回混合检索器（FAISS向量检索 + BM25关键词检索）。
+
+    `vector_store_path` 为某个版本的目录，默认为当前发布的版本。
+    """
+    if vector_store_path is None:
+        _, path = resolve_store_version(settings.VECTOR_STORE_PATH)
+        vector_store_path = str(path)
     logging.info(f"正在从路径加载向量数据库: {vector_store_path}")
     try:
-        vector_store = FAISS.load_local(vector_store_path, embeddings, allow_dangerous_deserialization=True)
-        retriever = vector_store.as_retriever(search_kwargs={"k": 4})  # 设置检索器返回4个最相关的文档
+        # 索引以内存映射方式只读打开，文本块按需从SQLite读取：启动时间与知识库大小无关，
+        # 多个worker进程共享操作系统的页缓存，而不是各自持有一份索引副本
+        vector_store = load_vector_store(vector_store_path, embeddings, mmap=True)
+        # 为IVF/HNSW等近似索引设置查询时参数（nprobe、efSearch）
+        apply_search_params(vector_store.index)
+        sparse_index = load_sparse_index(vector_store_path) if settings.HYBRID_SEARCH_ENABLED else None
+        retriever = HybridRetriever(
+            vector_store,
+            sparse_index,
+            # 启用重排序时先取回更多候选文档，由重排序保留最相关的RETRIEVAL_TOP_K个
+            k=settings.RERANK_CANDIDATES if settings.RERANK_ENABLED else settings.RETRIEVAL_TOP_K,
+            fetch_k=settings.HYBRID_SEARCH_FETCH_K,
+            rrf_k=settings.HYBRID_SEARCH_RRF_K,
+        )
         logging.info("检索器初始化成功。")
         return retriever
     except Exception as e:
         logging.error(f"加载向量数据库或创建检索器失败: {e}", exc_info=True)
         raise
 
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """初始化并返回交叉编码器重排序器；未启用重排序时返回None。"""
+    if not settings.RERANK_ENABLED:
+        return None
+    logging.info(f"正在加载重排序模型: {settings.RERANK_MODEL_NAME}")
+    try:
+        reranker = CrossEncoderReranker(
+            settings.RERANK_MODEL_NAME,
+            top_k=settings.RETRIEVAL_TOP_K,
+            timeout_ms=settings.RERANK_TIMEOUT_MS,
+            max_length=settings.RERANK_MAX_LENGTH,
+            max_queue=settings.RERANK_MAX_QUEUE,
+        )
+        logging.info("重排序模型加载成功。")
+        return reranker
+    except Exception as e:
+        logging.error(f"加载重排序模型失败: {e}", exc_info=True)
+        raise
+
 # --- 2. 定义辅助函数和链组件 ---
 
-def _format_chat_history(chat_history: List[Tuple[str, str]]) -> str:
-    """将聊天历史格式化为可读的字符串。"""
-    buffer = []
-    for role, content in chat_history:
-        if role == "user":
-            buffer.append(f"用户: {content}")
-        else:
-            buffer.append(f"助手: {content}")
-    return "\n".join(buffer)
+# FAISS检索是同步的CPU密集型操作。为了不阻塞uvicorn的事件循环，
+# 它被放到这个有界线程池中执行，线程数由配置项 RETRIEVAL_MAX_WORKERS 控制。
+# （查询向量化由 BatchingEmbeddings 的后台批处理线程执行。）
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=settings.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="rag-retrieval",
+)
 
-# 默认的文档格式化Prompt，仅包含页面内容
-DEFAULT_DOCUMENT_PROMPT = PromptTemplate.from_template(template="{page_content}")
+async def _run_in_retrieval_executor(func, *args):
+    """在检索线程池中执行一个同步函数，并异步等待其结果。"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, func, *args)
 
-def _combine_documents(docs, document_prompt=DEFAULT_DOCUMENT_PROMPT, document_separator="\n\n"):
-    """将多个文档合并成一个字符串。"""
-    doc_strings = [format_document(doc, document_prompt) for doc in docs]
-    return document_separator.join(doc_strings)
+def _replay_cached_answer(cached: CachedAnswer):
+    """将缓存的回答按与RAG链流式输出相同的数据块格式逐个重放。"""
+    yield AddableDict(source_documents=cached.source_documents)
+    for token in cached.tokens:
+        yield AddableDict(answer=token)
+
+class _AnswerRecorder:
+    """
+    在流式输出过程中收集答案token和溯源文档，待回答完整生成后写入语义缓存。
+
+    同时记录生成阶段的耗时：从检索完成（溯源文档输出）开始，到第一个答案token（first_token）
+    和全部答案token（generation）输出为止。每个token只多一次判断，不影响流式输出的开销。
+    """
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.source_documents: List[Document] = []
+        self.generation_started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        # 检索之前记下缓存的代数：生成期间切换了知识库版本时，答案不写入缓存
+        self.cache_generation = semantic_cache.generation
+
+    def record(self, chunk):
+        if "answer" in chunk:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+                if self.generation_started_at is not None:
+                    record_stage("first_token", self.first_token_at - self.generation_started_at)
+            self.tokens.append(chunk["answer"])
+        if "source_documents" in chunk:
+            self.source_documents = chunk["source_documents"]
+            self.generation_started_at = time.perf_counter()
+
+    def finish(self, completed: bool):
+        """流式输出结束（或被提前中断）时调用，记录输出的token数和生成耗时。"""
+        CHAT_TOKENS_STREAMED.inc(len(self.tokens))
+        if completed and self.generation_started_at is not None:
+            record_stage("generation", time.perf_counter() - self.generation_started_at)
+
+    def save(self, x):
+        if settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(
+                x["query_vector"], x["standalone_question"], self.tokens, self.source_documents,
+                generation=self.cache_generation,
+            )
+
+def _combine_documents(docs, document_separator="\n\n"):
+    """
+    将检索到的文档构建为问答Prompt的上下文：合并同一来源中相邻的文本块、去除近似重复，
+    并控制在 CONTEXT_TOKEN_BUDGET 之内（见 app/rag/context.py）。
+    上下文的token数和节省的token数记录到本轮的耗时日志和 /metrics 中。
+    """
+    with stage("prompt_build"):
+        context = assemble_context(docs, separator=document_separator)
+    record_count("context_tokens", context.tokens)
+    record_count("context_tokens_saved", context.tokens_saved)
+    return context.text
 
 # --- 3. 构建RAG链 ---
 
@@ -88,53 +224,157 @@ def create_rag_chain():
 
     这条链是整个系统的“大脑”，它通过LangChain表达式语言（LCEL）将各个组件串联起来。
     """
+    global embeddings_instance, retriever_instance
     try:
         # 初始化所有核心组件
         llm = get_llm()
-        embeddings = get_embeddings()
-        retriever = get_retriever(embeddings)
+        if settings.RETRIEVAL_SIDECAR_SOCKET:
+            # 嵌入模型和向量数据库由独立的检索服务进程持有，本进程只保留一个轻量的客户端
+            logging.info(f"使用检索服务进程: {settings.RETRIEVAL_SIDECAR_SOCKET}")
+            client = SidecarClient(
+                settings.RETRIEVAL_SIDECAR_SOCKET,
+                pool_size=settings.RETRIEVAL_SIDECAR_POOL_SIZE,
+                timeout=settings.RETRIEVAL_SIDECAR_TIMEOUT_SECONDS,
+            )
+            embeddings = SidecarEmbeddings(client)
+            retriever = SidecarRetriever(client, on_version_change=_on_sidecar_version_change)
+        else:
+            embeddings = get_embeddings()
+            embeddings_instance = embeddings
+            retriever = vector_store_reloader.load()
+        reranker = get_reranker()
 
         # 这条子链用于根据聊天历史重构用户问题，使其成为一个独立的、无需上下文的问题。
         contextualize_q_chain = (
             RunnablePassthrough.assign(
-                chat_history=lambda x: _format_chat_history(x["chat_history"])
+                chat_history=lambda x: format_chat_history(x["chat_history"], x.get("history_summary"))
             )
             | CONTEXTUALIZE_Q_PROMPT
             | llm
             | StrOutputParser()
         )
 
-        # 这是主RAG链的核心逻辑
+        # 第一步：生成独立问题。
+        # 如果有聊天历史（或较早对话的摘要），则调用contextualize_q_chain重构问题；否则直接使用原始问题。
+        # 该结果只计算一次，后续的检索和问答都复用它。
+        def _has_history(x):
+            return bool(x.get("chat_history") or x.get("history_summary"))
+
+        def _standalone_question(x):
+            if not _has_history(x):
+                return x["question"]
+            with stage("question_rewrite"):
+                return contextualize_q_chain.invoke(x)
+
+        async def _astandalone_question(x):
+            # 异步路径：通过ainvoke调用LLM，等待期间不会占用事件循环。
+            if not _has_history(x):
+                return x["question"]
+            with stage("question_rewrite"):
+                return await contextualize_q_chain.ainvoke(x)
+
+        standalone_question = RunnableLambda(_standalone_question, afunc=_astandalone_question)
+
+        # 第二步：计算独立问题的查询向量。
+        # 它既是语义缓存的键，也直接用于FAISS检索，因此每轮对话只向量化一次。
+        # 异步路径下，直接等待批处理线程返回的向量，不占用事件循环。
+        def _embed_query(x):
+            with stage("query_embed"):
+                return embeddings.embed_query(x["standalone_question"])
+
+        async def _aembed_query(x):
+            with stage("query_embed"):
+                return await embeddings.aembed_query(x["standalone_question"])
+
+        query_vector = RunnableLambda(_embed_query, afunc=_aembed_query)
+
+        # 第三步：用独立问题和查询向量进行混合检索（复用已计算的向量，避免重复向量化），
+        # 启用重排序时再对候选文档批量打分并截取前k个。
+        # 检索结果只计算一次，既用于构建问答Prompt的上下文，也作为溯源文档返回给前端。
+        # 异步路径下，检索在检索线程池中执行，重排序在其专用线程中执行。
+        # 检索器在每次检索时从 `retriever_instance` 读取：热加载切换到新版本后，之后的请求使用新版本，
+        # 已经开始检索的请求仍在旧版本上完成。
+        def _retrieve(x):
+            with stage("retrieval"):
+                documents = retriever_instance.search(x["standalone_question"], x["query_vector"])
+            if reranker is not None:
+                with stage("rerank"):
+                    documents = reranker.rerank(x["standalone_question"], documents)
+            return documents
+
+        async def _aretrieve(x):
+            with stage("retrieval"):
+                documents = await _run_in_retrieval_executor(
+                    retriever_instance.search, x["standalone_question"], x["query_vector"]
+                )
+            if reranker is not None:
+                with stage("rerank"):
+                    documents = await reranker.arerank(x["standalone_question"], documents)
+            return documents
+
+        retrieve_documents = RunnableLambda(_retrieve, afunc=_aretrieve)
+
+        # 第四步：将检索到的文档合并成上下文，填入最终的问答Prompt并调用LLM生成答案。
         qa_chain = (
             RunnablePassthrough.assign(
-                # 'context'的生成逻辑：
-                # 1. 如果有聊天历史，则先调用contextualize_q_chain生成独立问题，再用该问题进行检索。
-                # 2. 如果没有聊天历史，则直接用原始问题进行检索。
-                # 3. 将检索到的文档合并成一个字符串。
-                context=RunnableLambda(
-                    lambda x: contextualize_q_chain.invoke(x) if x.get("chat_history") else x["question"]
-                )
-                | retriever
-                | _combine_documents
+                context=lambda x: _combine_documents(x["source_documents"])
             )
             | QA_PROMPT  # 将组合好的上下文和问题填入最终的问答Prompt
             | llm        # 调用LLM生成答案
+            | StrOutputParser()
+        )
+
+        # 检索并生成答案的子链。流式调用时，'source_documents'会在答案token之前输出，
+        # 随后是逐个的'answer' token。
+        generate_chain = (
+            RunnablePassthrough.assign(source_documents=retrieve_documents)
+            | RunnablePassthrough.assign(answer=qa_chain)
         )
 
-        # 最终的链，它将并行地返回AI的回答和溯源文档。
-        rag_chain = RunnableMap(
-            {
-                "answer": qa_chain,
-                "source_documents": (
-                    # 这部分并行运行，用于获取溯源文档。
-                    # 其输入（重构后的问题）与qa_chain中的检索步骤完全相同，以确保一致性。
-                    RunnableLambda(
-                        lambda x: contextualize_q_chain.invoke(x) if x.get("chat_history") else x["question"]
-                    )
-                    | retriever
-                ),
-            }
+        # 第五步：先查询语义缓存。命中时按相同的数据块格式重放缓存的溯源文档和答案token；
+        # 未命中时执行检索和生成，并在答案完整生成后写入缓存。
+        def _answer_with_cache(x):
+            cached = semantic_cache.lookup(x["query_vector"]) if settings.SEMANTIC_CACHE_ENABLED else None
+            if cached is not None:
+                yield from _replay_cached_answer(cached)
+                CHAT_TOKENS_STREAMED.inc(len(cached.tokens))
+                return
+            recorder = _AnswerRecorder()
+            completed = False
+            try:
+                for chunk in generate_chain.stream(x):
+                    recorder.record(chunk)
+                    yield chunk
+                completed = True
+            finally:
+                recorder.finish(completed)
+            recorder.save(x)
+
+        async def _aanswer_with_cache(x):
+            cached = semantic_cache.lookup(x["query_vector"]) if settings.SEMANTIC_CACHE_ENABLED else None
+            if cached is not None:
+                for chunk in _replay_cached_answer(cached):
+                    yield chunk
+                CHAT_TOKENS_STREAMED.inc(len(cached.tokens))
+                return
+            recorder = _AnswerRecorder()
+            completed = False
+            try:
+                async for chunk in generate_chain.astream(x):
+                    recorder.record(chunk)
+                    yield chunk
+                completed = True
+            finally:
+                recorder.finish(completed)
+            recorder.save(x)
+
+        # 最终的链按顺序执行上述各步，每一步的结果都会合并到输出中。
+        rag_chain = (
+            RunnablePassthrough.assign(standalone_question=standalone_question)
+            | RunnablePassthrough.assign(query_vector=query_vector)
+            | RunnableLambda(_answer_with_cache, afunc=_aanswer_with_cache)
         )
+        embeddings_instance, retriever_instance = embeddings, retriever
         logging.info("RAG链创建成功。")
         return rag_chain
 
@@ -144,11 +384,118 @@ def create_rag_chain():
 
 # --- 单例模式入口 ---
 # 使用单例模式确保在整个应用生命周期中，RAG链（包括模型）只被加载一次，以节省资源。
+# 应用启动时由 `warm_up_rag_chain` 预先创建；锁保证并发的首次调用只会创建一次（single-flight），
+# 而不是各自加载一份模型和索引。
 rag_chain_instance = None
+_rag_chain_lock = threading.Lock()
+# 与RAG链一同创建的嵌入模型和检索器。检索器也用于按文本块ID读取溯源文档
+embeddings_instance = None
+retriever_instance: Optional[Union[HybridRetriever, SidecarRetriever]] = None
+# 预热是否已完成。只有预热完成的worker才会在 /ready 接口返回就绪
+_ready = threading.Event()
 
 def get_rag_chain():
-    """返回RAG链的单例实例。"""
+    """返回RAG链的单例实例（线程安全，首次调用时创建；创建失败时返回None，下次调用会重试）。"""
     global rag_chain_instance
     if rag_chain_instance is None:
-        rag_chain_instance = create_rag_chain()
+        with _rag_chain_lock:
+            if rag_chain_instance is None:
+                rag_chain_instance = create_rag_chain()
     return rag_chain_instance
+
+async def aget_rag_chain():
+    """
+    `get_rag_chain` 的异步版本。
+
+    RAG链尚未创建（或正在由启动预热创建）时，在线程池中等待，不会阻塞事件循环。
+    """
+    if rag_chain_instance is not None:
+        return rag_chain_instance
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_rag_chain)
+
+def warm_up_rag_chain() -> bool:
+    """
+    创建RAG链并预热各组件，使第一个用户请求不必等待模型和索引加载。
+
+    依次执行：创建RAG链（加载嵌入模型、LLM客户端和向量数据库）、向量化一个查询、
+    执行一次检索（将内存映射的索引页读入缓存），以及可选地（WARMUP_LLM_PING）向vLLM发送一个
+    只生成1个token的请求。这是一个同步的、耗时的函数，应在线程池中调用。
+
+    Returns:
+        bool: 预热是否成功。成功后 `is_ready()` 返回True。
+    """
+    start = time.perf_counter()
+    if get_rag_chain() is None or retriever_instance is None:
+        logging.error("预热失败：RAG链不可用。")
+        return False
+    try:
+        query = "预热"
+        query_vector = embeddings_instance.embed_query(query)
+        retriever_instance.search(query, query_vector)
+        if settings.WARMUP_LLM_PING:
+            get_llm().bind(max_tokens=1).invoke(query)
+    except Exception as e:
+        logging.error(f"预热RAG链时出错: {e}", exc_info=True)
+        return False
+    _ready.set()
+    logging.info(f"RAG链预热完成，耗时 {time.perf_counter() - start:.2f}s。")
+    return True
+
+def is_ready() -> bool:
+    """返回RAG链是否已创建并预热完成。"""
+    return _ready.is_set()
+
+# --- 向量数据库热加载 ---
+
+def _warm_up_retriever(retriever):
+    """用一次检索预热新加载的检索器（将内存映射的索引页和SQLite页读入缓存）。"""
+    query = "预热"
+    retriever.search(query, embeddings_instance.embed_query(query))
+
+def _swap_retriever(version: Optional[str], retriever: HybridRetriever):
+    """原子地替换RAG链使用的检索器。旧检索器在进行中的请求结束、最后一个引用释放后被回收。"""
+    global retriever_instance
+    previous, previous_version = retriever_instance, vector_store_reloader.version
+    retriever_instance = retriever
+    # 缓存的答案和溯源文档来自旧版本的知识库
+    semantic_cache.clear()
+    if previous is not None:
+        weakref.finalize(previous, logging.info, f"向量数据库版本 {previous_version} 的检索器已释放。")
+
+def _on_sidecar_version_change(previous: Optional[str], version: Optional[str]):
+    """检索服务进程返回的向量数据库版本变化时调用（服务进程自行热加载了新版本）。"""
+    logging.info(f"检索服务进程已切换到向量数据库版本 {version}（上一个版本: {previous}），正在清空语义缓存。")
+    semantic_cache.clear()
+
+vector_store_reloader = VectorStoreReloader(
+    settings.VECTOR_STORE_PATH,
+    load_retriever=lambda path: get_retriever(embeddings_instance, path),
+    warm_up=_warm_up_retriever,
+    on_swap=_swap_retriever,
+)
+
+def reload_vector_store(force: bool = False) -> Dict[str, Any]:
+    """
+    如果数据灌输发布了新的向量数据库版本，在后台加载、预热并切换到该版本，无需重启服务。
+
+    使用检索服务进程时，由服务进程执行加载和切换。这是一个同步的、耗时的函数，应在线程池中调用。
+    """
+    if get_rag_chain() is None or retriever_instance is None:
+        raise RuntimeError("RAG链不可用，无法热加载向量数据库。")
+    if isinstance(retriever_instance, SidecarRetriever):
+        result = retriever_instance.reload(force=force)
+        if result.get("status") == "reloaded":
+            semantic_cache.clear()
+        return result
+    return vector_store_reloader.reload(force=force)
+
+async def aget_source_documents(chunk_ids: Iterable[str]) -> Dict[str, Document]:
+    """
+    按文本块ID从文档库中读取溯源文档（在检索线程池中执行）。
+
+    RAG链不可用时返回空字典；已被移除的文本块不会出现在结果中。
+    """
+    if await aget_rag_chain() is None or retriever_instance is None:
+        return {}
+    return await _run_in_retrieval_executor(retriever_instance.get_documents, list(chunk_ids))
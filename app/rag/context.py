@@ -0,0 +1,198 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from langchain.docstore.document import Document
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.rag.tokens import count_tokens, truncate_to_tokens
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- 上下文构建的统计指标 ---
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "问答Prompt中检索上下文的token数（合并、去重和预算截断之后）",
+    buckets=[128, 256, 512, 1024, 2048, 3072, 4096, 8192],
+)
+CONTEXT_TOKENS_SAVED = Counter("rag_context_tokens_saved_total", "与直接拼接全部检索结果相比，上下文构建节省的token数")
+CONTEXT_MERGED = Counter("rag_context_merged_chunks_total", "与同一来源中相邻文本块合并的文本块数")
+CONTEXT_DUPLICATES = Counter("rag_context_duplicates_dropped_total", "因与排名更靠前的文本重复而丢弃的文本块数")
+CONTEXT_TRUNCATED = Counter("rag_context_truncated_total", "因超出token预算而被截断或丢弃的文本块数")
+
+# 判定两个文本块首尾重叠所需的最少重叠字符数，避免偶然相同的短句被误合并
+_MIN_OVERLAP_CHARS = 20
+# 预算只剩下不到这么多token时不再截取下一段，避免放入一个没有意义的片段
+_MIN_TRUNCATED_TOKENS = 50
+# 近似重复判定使用的字符n-gram长度
+_SHINGLE_SIZE = 3
+_WHITESPACE = re.compile(r"\s+")
+
+
+def get_context_stats() -> dict:
+    """返回上下文构建的token数直方图、节省的token数以及合并、去重和截断的次数。"""
+    return {
+        "context_tokens": CONTEXT_TOKENS.snapshot(),
+        "tokens_saved": CONTEXT_TOKENS_SAVED.value,
+        "merged_chunks": CONTEXT_MERGED.value,
+        "duplicates_dropped": CONTEXT_DUPLICATES.value,
+        "truncated": CONTEXT_TRUNCATED.value,
+    }
+
+
+@dataclass
+class AssembledContext:
+    """构建好的上下文，以及与直接拼接全部检索结果相比节省的token数。"""
+    text: str
+    passages: int
+    tokens: int
+    raw_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+
+@dataclass
+class _Passage:
+    text: str
+    source: Optional[str]
+
+
+def _join_overlapping(first: str, second: str) -> Optional[str]:
+    """
+    如果 `second` 的开头与 `first` 的结尾重叠（文本分割时的 chunk_overlap），返回拼接后的文本；
+    一方包含另一方时返回较长的一方；不相邻时返回None。
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    probe = second[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return None
+    pos = first.find(probe)
+    while pos != -1:
+        if second.startswith(first[pos:]):
+            return first + second[len(first) - pos:]
+        pos = first.find(probe, pos + 1)
+    return None
+
+
+def _merge_adjacent(passages: List[_Passage]) -> int:
+    """就地合并同一来源中首尾重叠的文本块，合并结果放在排名较靠前的位置。返回合并掉的块数。"""
+    merged = 0
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(passages)):
+            for j in range(i + 1, len(passages)):
+                if passages[i].source is None or passages[i].source != passages[j].source:
+                    continue
+                text = _join_overlapping(passages[i].text, passages[j].text) or _join_overlapping(passages[j].text, passages[i].text)
+                if text is not None:
+                    passages[i].text = text
+                    del passages[j]
+                    merged += 1
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def _shingles(text: str) -> set:
+    text = _WHITESPACE.sub("", text)
+    if len(text) <= _SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + _SHINGLE_SIZE] for i in range(len(text) - _SHINGLE_SIZE + 1)}
+
+
+def _drop_near_duplicates(passages: List[_Passage], threshold: float) -> List[_Passage]:
+    """
+    按排名顺序保留文本块，与已保留的某一段的字符n-gram重合度（交集 / 较小集合）达到 `threshold`
+    的文本块视为近似重复而丢弃，例如从不同文件复制的相同段落。
+    """
+    kept, kept_shingles = [], []
+    for passage in passages:
+        shingles = _shingles(passage.text)
+        if any(len(shingles & other) / max(1, min(len(shingles), len(other))) >= threshold for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def assemble_context(
+    docs: Sequence[Document],
+    token_budget: Optional[int] = None,
+    dedup_threshold: Optional[float] = None,
+    merge_adjacent: Optional[bool] = None,
+    separator: str = "\n\n",
+) -> AssembledContext:
+    """
+    将检索到的文档构建为问答Prompt的上下文。
+
+    1. 合并同一来源中相邻的文本块：文本分割时相邻块之间有 chunk_overlap 个字符的重叠，
+       同时命中时合并为一段，重叠部分只出现一次。
+    2. 去除近似重复：与排名更靠前的文本高度重合的文本块被丢弃。
+    3. 按排名顺序放入token预算：放不下的那一段截取开头部分，之后的文本块丢弃。
+
+    Args:
+        docs (Sequence[Document]): 按相关性从高到低排列的检索结果。
+        token_budget (Optional[int]): 上下文的token预算，默认取配置项 CONTEXT_TOKEN_BUDGET，0表示不限制。
+        dedup_threshold (Optional[float]): 近似重复的判定阈值，默认取配置项 CONTEXT_DEDUP_THRESHOLD，0表示不去重。
+        merge_adjacent (Optional[bool]): 是否合并相邻文本块，默认取配置项 CONTEXT_MERGE_ADJACENT。
+        separator (str): 文本块之间的分隔符。
+
+    Returns:
+        AssembledContext: 上下文文本及其token数，`raw_tokens` 为直接拼接全部检索结果的token数。
+    """
+    token_budget = settings.CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    dedup_threshold = settings.CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+    merge_adjacent = settings.CONTEXT_MERGE_ADJACENT if merge_adjacent is None else merge_adjacent
+
+    raw_tokens = count_tokens(separator.join(doc.page_content for doc in docs))
+    passages = [_Passage(doc.page_content.strip(), doc.metadata.get("source")) for doc in docs if doc.page_content.strip()]
+    n_passages = len(passages)
+
+    if merge_adjacent:
+        CONTEXT_MERGED.inc(_merge_adjacent(passages))
+    if dedup_threshold > 0:
+        before = len(passages)
+        passages = _drop_near_duplicates(passages, dedup_threshold)
+        CONTEXT_DUPLICATES.inc(before - len(passages))
+
+    texts: List[str] = []
+    if token_budget > 0:
+        separator_tokens = count_tokens(separator)
+        remaining = token_budget
+        for i, passage in enumerate(passages):
+            cost = count_tokens(passage.text) + (separator_tokens if texts else 0)
+            if cost <= remaining:
+                texts.append(passage.text)
+                remaining -= cost
+                continue
+            # 放不下整段：剩余预算足够时（或这是第一段）截取开头部分，之后的文本块全部丢弃
+            if not texts or remaining >= _MIN_TRUNCATED_TOKENS:
+                truncated = truncate_to_tokens(passage.text, remaining - (separator_tokens if texts else 0))
+                if truncated:
+                    texts.append(truncated)
+            CONTEXT_TRUNCATED.inc(len(passages) - i)
+            break
+    else:
+        texts = [passage.text for passage in passages]
+
+    text = separator.join(texts)
+    context = AssembledContext(text=text, passages=len(texts), tokens=count_tokens(text), raw_tokens=raw_tokens)
+    CONTEXT_TOKENS.observe(context.tokens)
+    CONTEXT_TOKENS_SAVED.inc(context.tokens_saved)
+    if n_passages:
+        logging.debug(
+            f"上下文构建: {n_passages} 个文本块 -> {context.passages} 段，"
+            f"{raw_tokens} -> {context.tokens} tokens（节省 {context.tokens_saved}）"
+        )
+    return context
@@ -0,0 +1,248 @@
+import inspect
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.core.config import settings
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 支持的嵌入模型推理后端
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+# 导出目录中的文件
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_INT8_MODEL_FILENAME = "model_int8.onnx"
+ONNX_CONFIG_FILENAME = "embedding_config.json"
+
+
+def onnx_model_dir(model_name: Optional[str] = None, cache_dir: Optional[str] = None) -> Path:
+    """返回模型导出后的缓存目录：`<EMBEDDING_ONNX_CACHE_DIR>/<模型名称>`。"""
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    cache_dir = cache_dir or settings.EMBEDDING_ONNX_CACHE_DIR
+    return Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name.strip("/"))
+
+
+def export_onnx_model(model_name: Optional[str] = None, cache_dir: Optional[str] = None, force: bool = False) -> Path:
+    """
+    将sentence-transformers模型导出为ONNX格式，并生成int8动态量化的版本（只需执行一次）。
+
+    导出目录中包含FP32和int8两个模型、分词器，以及池化方式（CLS或平均）、是否归一化、
+    最大长度等推理参数，使ONNX后端的输出与sentence-transformers保持一致。
+    先导出到临时目录，完成后再重命名为最终目录，多个进程同时导出时不会读到不完整的文件。
+
+    Args:
+        model_name (Optional[str]): 模型名称或本地路径，默认取配置项 EMBEDDING_MODEL_NAME。
+        cache_dir (Optional[str]): 缓存目录，默认取配置项 EMBEDDING_ONNX_CACHE_DIR。
+        force (bool): 为True时即使已经导出过也重新导出。
+
+    Returns:
+        Path: 导出目录。
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer, models
+
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    target = onnx_model_dir(model_name, cache_dir)
+    if (target / ONNX_CONFIG_FILENAME).exists() and not force:
+        return target
+
+    logging.info(f"正在将嵌入模型 {model_name} 导出为ONNX格式...")
+    sentence_model = SentenceTransformer(model_name, device="cpu")
+    transformer = sentence_model[0]
+    if not isinstance(transformer, models.Transformer):
+        raise ValueError(f"不支持导出的模型结构: {type(transformer).__name__}")
+    pooling = next((m for m in sentence_model if isinstance(m, models.Pooling)), None)
+    if pooling is not None and pooling.pooling_mode_cls_token:
+        pooling_mode = "cls"
+    elif pooling is None or pooling.pooling_mode_mean_tokens:
+        pooling_mode = "mean"
+    else:
+        raise ValueError("ONNX后端只支持CLS池化或平均池化的模型。")
+    normalize = any(isinstance(m, models.Normalize) for m in sentence_model)
+
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["导出ONNX模型"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _Encoder(torch.nn.Module):
+        """只输出最后一层隐藏状态，池化在ONNX Runtime之外完成。"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *tensors):
+            return self.model(**dict(zip(input_names, tensors)), return_dict=True).last_hidden_state
+
+    Path(target.parent).mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{target.name}-", dir=target.parent))
+    try:
+        fp32_path = tmp_dir / ONNX_MODEL_FILENAME
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        export_kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            # 新版本PyTorch默认使用dynamo导出，这里使用更成熟的TorchScript导出
+            export_kwargs["dynamo"] = False
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(transformer.auto_model.eval()),
+                tuple(sample[name] for name in input_names),
+                str(fp32_path),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                **export_kwargs,
+            )
+        logging.info("正在生成int8动态量化模型...")
+        quantize_dynamic(str(fp32_path), str(tmp_dir / ONNX_INT8_MODEL_FILENAME), weight_type=QuantType.QInt8)
+
+        tokenizer.save_pretrained(str(tmp_dir))
+        config = {
+            "source_model": model_name,
+            "pooling": pooling_mode,
+            "normalize": normalize,
+            "max_seq_length": sentence_model.max_seq_length,
+            "do_lower_case": bool(getattr(transformer, "do_lower_case", False)),
+            "input_names": input_names,
+            "dimension": sentence_model.get_sentence_embedding_dimension(),
+        }
+        (tmp_dir / ONNX_CONFIG_FILENAME).write_text(json.dumps(config, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        if force and target.exists():
+            shutil.rmtree(target)
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # 另一个进程已经完成了导出
+            logging.info(f"ONNX模型已由其他进程导出到 {target}。")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logging.info(f"ONNX模型已导出到: {target}")
+    return target
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    使用ONNX Runtime在CPU上推理的嵌入模型，输出与sentence-transformers一致（池化和归一化方式相同）。
+
+    默认加载int8动态量化的模型：矩阵乘法使用int8指令，推理速度显著快于FP32的PyTorch，
+    内存占用约为其四分之一。文本按长度排序后分批推理，减少同一批次中的填充。
+    ONNX Runtime的会话是线程安全的，可以同时用于查询批处理线程和灌输流水线。
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, intra_op_threads: int = 0, batch_size: int = 32):
+        """
+        Args:
+            model_dir (str): `export_onnx_model` 的导出目录。
+            quantized (bool): 是否使用int8量化的模型。
+            intra_op_threads (int): 算子内线程数，0表示使用ONNX Runtime的默认值（物理核数）。
+            batch_size (int): 单次推理的文本数。
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        config = json.loads((model_dir / ONNX_CONFIG_FILENAME).read_text(encoding="utf-8"))
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+        self.do_lower_case = config.get("do_lower_case", False)
+        self.input_names = config["input_names"]
+        self.batch_size = max(1, batch_size)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        model_path = model_dir / (ONNX_INT8_MODEL_FILENAME if quantized else ONNX_MODEL_FILENAME)
+        self.session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        texts = [text.strip() for text in texts]
+        if self.do_lower_case:
+            texts = [text.lower() for text in texts]
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 按长度排序后分批，长度相近的文本在同一批次中，填充的token更少
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            vectors = self._encode_batch([texts[i] for i in indices])
+            for i, vector in zip(indices, vectors):
+                results[i] = vector.tolist()
+        return results
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # 查询与文档使用相同的编码方式，`BatchingEmbeddings` 用它批量向量化并发的查询
+        return self.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+
+def create_embedding_model(backend: Optional[str] = None) -> Embeddings:
+    """
+    按配置项 EMBEDDING_BACKEND 创建嵌入模型（数据灌输和在线查询使用同一个函数）。
+
+    - `torch`：sentence-transformers（PyTorch，FP32）。
+    - `onnx`：ONNX Runtime，默认使用int8动态量化的模型（EMBEDDING_ONNX_QUANTIZE）。
+      模型尚未导出时会先自动导出，也可以提前运行 `python scripts/export_onnx_embeddings.py`。
+
+    Args:
+        backend (Optional[str]): 推理后端，默认取配置项 EMBEDDING_BACKEND。
+
+    Returns:
+        Embeddings: 嵌入模型。
+    """
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    threads = settings.EMBEDDING_INTRA_OP_THREADS
+    batch_size = settings.EMBEDDING_INFERENCE_BATCH_SIZE
+    if backend == "torch":
+        import torch
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return HuggingFaceEmbeddings(
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            model_kwargs={'device': 'cpu'},  # 如果有GPU，可改为'cuda'
+            encode_kwargs={'batch_size': batch_size},
+        )
+    if backend == "onnx":
+        model_dir = onnx_model_dir()
+        if not (model_dir / ONNX_CONFIG_FILENAME).exists():
+            logging.warning(f"未找到导出的ONNX模型 {model_dir}，正在导出（只需执行一次）...")
+            export_onnx_model()
+        return OnnxEmbeddings(
+            str(model_dir),
+            quantized=settings.EMBEDDING_ONNX_QUANTIZE,
+            intra_op_threads=threads,
+            batch_size=batch_size,
+        )
+    raise ValueError(f"不支持的嵌入模型后端: {backend}，可选值为 {', '.join(EMBEDDING_BACKENDS)}")
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from langchain.embeddings.base import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from app.core.metrics import Counter, Histogram
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- 查询向量化的统计指标 ---
+EMBED_BATCH_SIZE = Histogram(
+    "rag_query_embed_batch_size",
+    "每次批量向量化调用中包含的查询数量",
+    buckets=[1, 2, 4, 8, 16, 32, 64],
+)
+EMBED_QUEUE_WAIT = Histogram(
+    "rag_query_embed_queue_wait_seconds",
+    "查询从进入队列到开始批量向量化的等待时间（秒）",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25],
+)
+EMBED_CACHE_HITS = Counter("rag_query_embed_cache_hits_total", "查询向量LRU缓存命中次数")
+EMBED_CACHE_MISSES = Counter("rag_query_embed_cache_misses_total", "查询向量LRU缓存未命中次数")
+
+
+def get_embedding_stats() -> dict:
+    """返回查询向量化的批大小、排队等待直方图及LRU缓存计数。"""
+    return {
+        "batch_size": EMBED_BATCH_SIZE.snapshot(),
+        "queue_wait_seconds": EMBED_QUEUE_WAIT.snapshot(),
+        "cache_hits": EMBED_CACHE_HITS.value,
+        "cache_misses": EMBED_CACHE_MISSES.value,
+    }
+
+
+def _batch_query_encoder(embeddings: Embeddings) -> Optional[Callable[[List[str]], List[List[float]]]]:
+    """
+    返回按模型的查询路径批量向量化查询的函数，结果与逐条调用 `embed_query` 相同；
+    不确定模型的查询路径能否批量执行时返回None。
+
+    - 模型提供 `embed_queries(texts)` 时直接使用（例如 `OnnxEmbeddings`）。
+    - `HuggingFaceEmbeddings` 的 `embed_query` 就是单条的 `embed_documents`，可以直接用后者批量执行。
+    - 其他模型（例如在查询前加指令的BGE、E5风格模型）的查询向量与文档向量不同，不能改用 `embed_documents`。
+    """
+    embed_queries = getattr(embeddings, "embed_queries", None)
+    if callable(embed_queries):
+        return embed_queries
+    if isinstance(embeddings, HuggingFaceEmbeddings) and not getattr(embeddings, "query_encode_kwargs", None):
+        return embeddings.embed_documents
+    return None
+
+
+class _EmbedRequest:
+    """批处理队列中的一个待向量化查询。"""
+    __slots__ = ("text", "future", "enqueued_at")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    为查询向量化提供微批处理和LRU缓存的嵌入模型前端。
+
+    并发到达的 `embed_query` 调用会进入同一个队列，由后台线程在 `max_wait_ms` 的时间窗口内
+    收集至多 `max_batch_size` 个查询，按模型的查询路径合并为一次批量调用（见 `_batch_query_encoder`），
+    从而充分利用sentence-transformers的批处理吞吐量。查询路径无法批量执行的模型（例如在查询前加指令的模型）
+    仍在后台线程中逐条调用其 `embed_query`，查询向量不会变成文档向量。
+    最近查询过的向量保存在LRU缓存中，重复的查询不会再次进入模型。
+
+    文档向量化（`embed_documents`）直接透传给底层模型。
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0, cache_size: int = 2048):
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.cache_size = cache_size
+        self._encode_queries = _batch_query_encoder(embeddings)
+        if self._encode_queries is None:
+            logging.info(f"{type(embeddings).__name__} 的查询向量化无法批量执行，将逐条调用 embed_query。")
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue: "queue.Queue[_EmbedRequest]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="query-embed-batcher", daemon=True)
+        self._worker.start()
+
+    # --- LRU缓存 ---
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+            return vector
+
+    def _cache_put(self, text: str, vector: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- 批处理 ---
+
+    def _collect_batch(self, first: _EmbedRequest) -> List[_EmbedRequest]:
+        """从第一个请求开始，在时间窗口内尽可能多地收集后续请求。"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch(self._queue.get())
+            started_at = time.perf_counter()
+            for request in batch:
+                EMBED_QUEUE_WAIT.observe(started_at - request.enqueued_at)
+
+            # 同一批次中的重复查询只向量化一次
+            texts = list(dict.fromkeys(request.text for request in batch))
+            EMBED_BATCH_SIZE.observe(len(texts))
+            try:
+                if self._encode_queries is not None:
+                    vectors = dict(zip(texts, self._encode_queries(texts)))
+                else:
+                    vectors = {text: self.embeddings.embed_query(text) for text in texts}
+            except Exception as e:
+                logging.error(f"批量查询向量化失败: {e}", exc_info=True)
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            for text, vector in vectors.items():
+                self._cache_put(text, vector)
+            for request in batch:
+                request.future.set_result(vectors[request.text])
+
+    def _submit(self, text: str) -> Future:
+        """返回一个Future：缓存命中时立即完成，否则在所属批次完成向量化后完成。"""
+        vector = self._cache_get(text)
+        if vector is not None:
+            EMBED_CACHE_HITS.inc()
+            future: Future = Future()
+            future.set_result(vector)
+            return future
+        EMBED_CACHE_MISSES.inc()
+        request = _EmbedRequest(text)
+        self._queue.put(request)
+        return request.future
+
+    # --- Embeddings 接口 ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # 直接等待批处理线程的结果，不占用事件循环或检索线程池中的线程
+        return await asyncio.wrap_future(self._submit(text))
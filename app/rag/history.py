@@ -0,0 +1,164 @@
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+from langchain.schema.output_parser import StrOutputParser
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import crud, models
+from app.db.database import AsyncSessionLocal
+from app.db.writer import message_writer
+from app.rag.admission import LLMOverloadedError
+from app.rag.prompts import SUMMARIZE_HISTORY_PROMPT
+from app.rag.tokens import count_tokens, truncate_to_tokens
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 格式化聊天历史时，每条消息除内容外额外计入的token数（角色前缀和换行）
+_MESSAGE_OVERHEAD_TOKENS = 4
+# 每次更新摘要时最多合并的消息数，控制摘要Prompt的长度
+_MAX_FOLD_MESSAGES = 20
+
+
+@dataclass
+class ChatHistory:
+    """一轮对话使用的聊天历史：较早轮次的滚动摘要，加上最近几轮的原文。"""
+    summary: Optional[str] = None
+    messages: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def format_chat_history(chat_history: Sequence[Tuple[str, str]], summary: Optional[str] = None) -> str:
+    """将聊天历史（及较早对话的摘要）格式化为可读的字符串。"""
+    buffer = []
+    if summary:
+        buffer.append(f"较早对话的摘要: {summary}")
+    for role, content in chat_history:
+        if role == "user":
+            buffer.append(f"用户: {content}")
+        else:
+            buffer.append(f"助手: {content}")
+    return "\n".join(buffer)
+
+
+def _to_turns(messages: Sequence[models.Message]) -> List[Tuple[str, str]]:
+    return [("user" if msg.message_type == "user" else "ai", msg.content) for msg in messages]
+
+
+def _recent_window_start(messages: Sequence[models.Message]) -> int:
+    """
+    从最新的消息向前选取原文保留的消息，返回保留部分在列表中的起始下标。
+
+    最多保留 HISTORY_MAX_TURNS 轮（每轮包含用户和助手各一条消息），且总token数不超过
+    HISTORY_TOKEN_BUDGET。最新的一条消息总会被保留。
+    """
+    max_messages = max(1, settings.HISTORY_MAX_TURNS * 2)
+    budget = settings.HISTORY_TOKEN_BUDGET
+    start, used = len(messages), 0
+    for i in range(len(messages) - 1, -1, -1):
+        cost = count_tokens(messages[i].content) + _MESSAGE_OVERHEAD_TOKENS
+        if start < len(messages) and (len(messages) - i > max_messages or used + cost > budget):
+            break
+        start, used = i, used + cost
+    return start
+
+
+async def load_chat_history(db: AsyncSession, conversation_id: int) -> ChatHistory:
+    """
+    读取一轮对话所需的聊天历史。
+
+    只查询摘要之后的最近一个窗口内的消息，读取量和Prompt长度都与会话的总长度无关。
+    窗口之外、尚未合并进摘要的消息（摘要更新滞后时才会出现）不会出现在本轮的Prompt中。
+    batched持久化模式下，写入队列中尚未提交的消息也会合并进来。
+
+    应在保存本轮的用户消息之前调用，使历史中不包含本轮的问题。
+
+    Args:
+        db (AsyncSession): 数据库会话对象。
+        conversation_id (int): 会话的ID。
+
+    Returns:
+        ChatHistory: 摘要和最近几轮的原文。
+    """
+    conversation = await crud.get_conversation(db, conversation_id)
+    if conversation is None:
+        return ChatHistory()
+    messages = await crud.get_recent_messages(
+        db,
+        conversation_id,
+        after_id=conversation.summarized_until_id or 0,
+        limit=max(1, settings.HISTORY_MAX_TURNS * 2),
+    )
+    # 合并写入队列中的消息；查询期间恰好提交的消息已带有ID，按ID去重
+    stored_ids = {msg.id for msg in messages}
+    messages += [msg for msg in message_writer.pending_messages(conversation_id) if msg.id not in stored_ids]
+
+    recent = _to_turns(messages[_recent_window_start(messages):])
+    if recent and count_tokens(recent[0][1]) > settings.HISTORY_TOKEN_BUDGET:
+        # 单条消息就超出预算时，只保留其开头部分
+        role, content = recent[0]
+        recent[0] = (role, truncate_to_tokens(content, settings.HISTORY_TOKEN_BUDGET))
+    return ChatHistory(summary=conversation.summary, messages=recent)
+
+
+_summary_chain = None
+
+
+def _get_summary_chain():
+    """返回用于生成滚动摘要的链（首次调用时创建）。"""
+    global _summary_chain
+    if _summary_chain is None:
+        from app.rag.chain import get_llm  # 在函数内导入，避免与chain模块循环导入
+        _summary_chain = SUMMARIZE_HISTORY_PROMPT | get_llm() | StrOutputParser()
+    return _summary_chain
+
+
+async def update_history_summary(conversation_id: int):
+    """
+    将移出历史窗口的消息增量地合并进会话的滚动摘要。
+
+    在每轮回答发送完毕后作为后台任务执行，不增加回答的延迟。每次只把新移出窗口的消息
+    和已有摘要交给大模型，不会重新总结整个会话。使用独立的数据库会话，出错时只记录日志。
+
+    Args:
+        conversation_id (int): 会话的ID。
+    """
+    if not settings.HISTORY_SUMMARY_ENABLED:
+        return
+    async with AsyncSessionLocal() as db:
+        try:
+            await _update_history_summary(db, conversation_id)
+        except LLMOverloadedError as e:
+            # 未合并的消息会在下一轮对话结束后再次尝试合并
+            logging.warning(f"大模型繁忙，暂不更新会话 {conversation_id} 的摘要: {e}")
+        except Exception as e:
+            logging.error(f"更新会话 {conversation_id} 的摘要失败: {e}", exc_info=True)
+
+
+async def _update_history_summary(db: AsyncSession, conversation_id: int):
+    # 只合并已写入数据库的消息：先等待该会话在写入队列中的消息提交
+    await message_writer.wait_for(conversation_id)
+    conversation = await crud.get_conversation(db, conversation_id)
+    if conversation is None:
+        return
+    summarized_until_id = conversation.summarized_until_id or 0
+    # 窗口之前最多再读取 _MAX_FOLD_MESSAGES 条消息；更早的未合并消息（例如升级前的长会话）会被跳过
+    messages = await crud.get_recent_messages(
+        db,
+        conversation_id,
+        after_id=summarized_until_id,
+        limit=max(1, settings.HISTORY_MAX_TURNS * 2) + _MAX_FOLD_MESSAGES,
+    )
+    to_fold = messages[:_recent_window_start(messages)]
+    if not to_fold:
+        return
+
+    summary = await _get_summary_chain().ainvoke({
+        "summary": conversation.summary or "（无）",
+        "new_lines": format_chat_history(_to_turns(to_fold)),
+        "max_length": settings.HISTORY_SUMMARY_MAX_TOKENS,
+    })
+    summary = truncate_to_tokens(summary.strip(), settings.HISTORY_SUMMARY_MAX_TOKENS)
+    if await crud.update_conversation_summary(db, conversation_id, summary, to_fold[-1].id, summarized_until_id):
+        logging.info(f"会话 {conversation_id} 的摘要已更新，合并了 {len(to_fold)} 条消息。")
@@ -0,0 +1,158 @@
+import logging
+from typing import Optional, Sequence
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 支持的FAISS索引类型
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# IVF聚类时每个聚类中心建议的最少训练样本数（低于此值FAISS会给出警告，聚类质量也会下降）
+_MIN_POINTS_PER_CENTROID = 39
+# PQ每个子量化器使用8位编码，即256个聚类中心，训练样本不能少于这个数
+_PQ_CENTROIDS = 256
+
+
+def index_needs_training(index_type: Optional[str] = None) -> bool:
+    """返回该索引类型在写入向量之前是否需要先用样本训练。"""
+    index_type = (index_type or settings.VECTOR_INDEX_TYPE).lower()
+    return index_type in ("ivf_flat", "ivf_pq")
+
+
+def _index_factory_string(index_type: str, n_train: int) -> str:
+    """根据索引类型和训练样本数，生成 `faiss.index_factory` 使用的描述字符串。"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{settings.VECTOR_INDEX_HNSW_M}"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # 样本较少时自动减少聚类数，保证每个聚类中心都有足够的训练样本
+        nlist = max(1, min(settings.VECTOR_INDEX_NLIST, n_train // _MIN_POINTS_PER_CENTROID))
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        return f"IVF{nlist},PQ{settings.VECTOR_INDEX_PQ_M}"
+    raise ValueError(f"不支持的索引类型: {index_type}，可选值为 {', '.join(INDEX_TYPES)}")
+
+
+def build_faiss_index(dimension: int, train_vectors: Optional[np.ndarray] = None, index_type: Optional[str] = None):
+    """
+    按配置创建一个空的FAISS索引（L2距离，与LangChain默认的Flat索引一致）。
+
+    需要训练的索引类型（IVF-Flat、IVF-PQ）会用 `train_vectors` 进行训练。
+    如果训练样本太少，不足以训练所选的索引类型，则退回到Flat索引。
+
+    Args:
+        dimension (int): 向量维度。
+        train_vectors (Optional[np.ndarray]): 训练样本，形状为 (n, dimension)。
+        index_type (Optional[str]): 索引类型，默认取配置项 VECTOR_INDEX_TYPE。
+
+    Returns:
+        faiss.Index: 已训练、可直接写入向量的索引。
+    """
+    index_type = (index_type or settings.VECTOR_INDEX_TYPE).lower()
+    n_train = 0 if train_vectors is None else len(train_vectors)
+
+    if index_needs_training(index_type):
+        min_train = _PQ_CENTROIDS if index_type == "ivf_pq" else _MIN_POINTS_PER_CENTROID
+        if n_train < min_train:
+            logging.warning(f"训练样本只有 {n_train} 个，不足以训练 {index_type} 索引，将改用Flat索引。")
+            index_type = "flat"
+
+    factory_string = _index_factory_string(index_type, n_train)
+    logging.info(f"正在创建FAISS索引: {factory_string}")
+    index = faiss.index_factory(dimension, factory_string)
+
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efConstruction = settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        logging.info(f"正在使用 {n_train} 个样本训练索引...")
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    return index
+
+
+def _hnsw_of(index):
+    """返回索引（或 IndexIDMap2 包装的子索引）的HNSW图结构，不是HNSW索引时返回None。"""
+    if isinstance(index, faiss.IndexIDMap2):
+        index = index.index
+    return getattr(faiss.downcast_index(index), "hnsw", None)
+
+
+def with_ids(index):
+    """
+    返回按文本块的固定ID（int64）写入、检索和删除向量的索引。
+
+    IVF索引本身按ID保存向量（`add_with_ids`、`remove_ids`），原样返回；Flat和HNSW索引包装在
+    `IndexIDMap2` 中。检索返回写入时指定的ID而不是向量在索引中的位置，删除向量不会改变其余向量的ID。
+    """
+    if isinstance(index, faiss.IndexIDMap2) or faiss.try_extract_index_ivf(index) is not None:
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def build_id_index(dimension: int, train_vectors: Optional[np.ndarray] = None, index_type: Optional[str] = None):
+    """与 `build_faiss_index` 相同，但返回按ID写入向量的索引（见 `with_ids`），供数据灌输使用。"""
+    return with_ids(build_faiss_index(dimension, train_vectors, index_type))
+
+
+def migrate_to_id_index(index):
+    """
+    将旧版本灌输的索引转换为按ID写入的索引，ID即向量原来的位置（与文档库中保存的位置一致）。
+
+    旧版本中Flat和HNSW索引以位置作为ID，这里读出全部向量后写入一个 `IndexIDMap2`，无需重新向量化。
+    """
+    if isinstance(index, faiss.IndexIDMap2) or faiss.try_extract_index_ivf(index) is not None:
+        return index
+    logging.info(f"正在将旧格式的 {type(index).__name__} 索引转换为按ID写入的索引（{index.ntotal} 个向量）...")
+    vectors = index.reconstruct_n(0, index.ntotal)
+    empty = faiss.clone_index(index)
+    empty.reset()
+    migrated = faiss.IndexIDMap2(empty)
+    migrated.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+    return migrated
+
+
+def remove_vectors(index, ids: Sequence[int]):
+    """
+    从按ID写入的索引中删除指定ID的向量，返回删除后的索引。
+
+    Flat和IVF索引原地删除。HNSW索引不支持删除，改为用其余向量重新构建图结构后返回新的索引：
+    向量直接从索引中读出，不需要重新解析文档或向量化。
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return index
+    if _hnsw_of(index) is None:
+        index.remove_ids(ids)
+        return index
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    logging.info(f"HNSW索引不支持删除向量，正在用其余 {int(keep.sum())} 个向量重新构建图结构...")
+    vectors = index.index.reconstruct_n(0, index.ntotal)[keep]
+    rebuilt = build_id_index(index.d, index_type="hnsw")
+    if len(vectors):
+        rebuilt.add_with_ids(vectors, all_ids[keep])
+    return rebuilt
+
+
+def apply_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    为索引设置查询时参数：IVF索引的nprobe和HNSW索引的efSearch。不适用的参数会被忽略。
+
+    Args:
+        index: FAISS索引。
+        nprobe (Optional[int]): IVF索引查询时访问的聚类数，默认取配置项 VECTOR_SEARCH_NPROBE。
+        ef_search (Optional[int]): HNSW索引查询时的候选列表大小，默认取配置项 VECTOR_SEARCH_EF。
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or settings.VECTOR_SEARCH_NPROBE
+    hnsw = _hnsw_of(index)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search or settings.VECTOR_SEARCH_EF
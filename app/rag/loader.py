@@ -1,6 +1,11 @@
 import logging
+import signal
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
 from langchain_community.document_loaders import (
     UnstructuredFileLoader,
     UnstructuredMarkdownLoader,
@@ -8,6 +13,8 @@ from langchain_community.document_loaders import (
 )
 from langchain.docstore.document import Document
 
+from app.core.config import settings
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -23,7 +30,176 @@ LOADER_MAPPING = {
     ".doc": (UnstructuredFileLoader, {}),
 }
 
-def load_documents(docs_path: str) -> List[Document]:
+def iter_document_files(docs_path: str) -> Iterator[Path]:
+    """
+    按路径排序，依次返回目录下所有受支持的文档文件。
+
+    Args:
+        docs_path (str): 包含文档的目录路径。
+
+    Yields:
+        Path: 受支持的文档文件路径。
+    """
+    path = Path(docs_path)
+    # 递归地遍历目录下的所有文件，排序以保证每次运行的处理顺序一致
+    for file_path in sorted(path.rglob("*.*")):
+        if not file_path.is_file():
+            continue
+        if file_path.suffix.lower() in LOADER_MAPPING:
+            yield file_path
+        else:
+            logging.warning(f"不支持的文件类型: {file_path}，已跳过。")
+
+def load_file(file_path: Path) -> List[Document]:
+    """
+    使用与文件扩展名对应的加载器加载单个文件。
+
+    Args:
+        file_path (Path): 要加载的文件路径。
+
+    Returns:
+        List[Document]: 该文件解析出的Document对象列表。
+    """
+    loader_class, loader_args = LOADER_MAPPING[file_path.suffix.lower()]
+    logging.info(f"正在加载文件: {file_path}")
+    loader = loader_class(str(file_path), **loader_args)
+    return loader.load()
+
+# --- 并行解析 ---
+
+# SIGALRM只能在Python字节码之间中断解析，卡在C扩展或外部调用中的解析不会响应。
+# 等待一个文件超过 `timeout + 此宽限时间（秒）` 仍未返回时，直接终止解析进程。
+_HUNG_FILE_GRACE_SECONDS = 30
+
+def _load_file_in_worker(file_path: Path, timeout: Optional[float] = None) -> List[Document]:
+    """
+    加载单个文件，并在超过 `timeout` 秒时抛出TimeoutError。
+
+    超时通过SIGALRM实现，因此只在类Unix系统的主线程中生效（进程池的工作进程满足这一条件）。
+    """
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        def _on_timeout(signum, frame):
+            raise TimeoutError(f"解析超过 {timeout} 秒")
+
+        previous_handler = signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return load_file(file_path)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+def _hung_timeout(timeout: Optional[float]) -> Optional[float]:
+    """等待单个文件的最长时间（秒），不限制解析时间时为None。"""
+    return timeout + _HUNG_FILE_GRACE_SECONDS if timeout else None
+
+def _wait_for_file(future: Future, timeout: Optional[float]) -> bool:
+    """等待解析任务结束，返回它是否在 `_hung_timeout(timeout)` 之内结束。"""
+    return not wait([future], timeout=_hung_timeout(timeout)).not_done
+
+def _terminate_pool(executor: ProcessPoolExecutor):
+    """立即终止进程池的所有工作进程，并取消尚未开始的任务。"""
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    for process in processes:
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _load_file_isolated(file_path: Path, timeout: Optional[float]) -> List[Document]:
+    """在一个独立的单进程进程池中加载文件，用于定位导致工作进程崩溃或卡死的文件。"""
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(_load_file_in_worker, file_path, timeout)
+        if not _wait_for_file(future, timeout):
+            raise TimeoutError(f"解析超过 {timeout} 秒后仍未结束，已终止解析进程")
+        return future.result()
+    finally:
+        _terminate_pool(executor)
+
+def load_files(
+    file_paths: Iterable[Path],
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[Path, Optional[List[Document]]]]:
+    """
+    加载一组文件，按输入顺序逐个返回每个文件的解析结果。
+
+    当 `max_workers` 大于1时，使用进程池并行解析（PDF解析、libreoffice转换和OCR都是CPU密集型操作），
+    但结果仍严格按照输入顺序返回，保证每次运行的结果一致。
+    每个文件的失败都是相互隔离的：解析出错或超时的文件返回None并记录日志，不影响其他文件。
+    如果某个文件导致工作进程崩溃，进程池会被重建，当时在途的文件会逐个在独立进程中重试。
+    如果某个文件在超时之后仍未返回（解析卡在SIGALRM无法中断的调用中），它被记为失败，
+    进程池的工作进程被终止并重建，其他在途文件同样逐个在独立进程中重试。
+
+    Args:
+        file_paths (Iterable[Path]): 要加载的文件路径。
+        max_workers (Optional[int]): 解析进程数，默认取配置项 LOADER_MAX_WORKERS。
+        timeout (Optional[float]): 单个文件的解析超时时间（秒），默认取配置项 LOADER_FILE_TIMEOUT，0表示不限制。
+
+    Yields:
+        Tuple[Path, Optional[List[Document]]]: 文件路径及其解析出的Document列表，失败时为None。
+    """
+    max_workers = settings.LOADER_MAX_WORKERS if max_workers is None else max_workers
+    timeout = settings.LOADER_FILE_TIMEOUT if timeout is None else timeout
+
+    # SIGALRM只能在主线程中使用。在其他线程中（例如流式灌输流水线的解析阶段）串行解析时，
+    # 改用单进程的进程池，以保证超时仍然生效。
+    in_main_thread = threading.current_thread() is threading.main_thread()
+    if max_workers <= 1 and (not timeout or in_main_thread):
+        for file_path in file_paths:
+            try:
+                yield file_path, _load_file_in_worker(file_path, timeout)
+            except Exception as e:
+                logging.error(f"加载文件 {file_path} 失败: {e}", exc_info=True)
+                yield file_path, None
+        return
+
+    max_workers = max(1, max_workers)
+    files = iter(file_paths)
+    # 在途任务队列。future为None表示该文件需要在独立进程中重试。
+    pending: Deque[Tuple[Path, Optional[Future]]] = deque()
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            # 保持固定数量的在途任务：既让所有进程保持忙碌，又限制内存中积压的解析结果
+            while len(pending) < max_workers * 2:
+                file_path = next(files, None)
+                if file_path is None:
+                    break
+                pending.append((file_path, executor.submit(_load_file_in_worker, file_path, timeout)))
+            if not pending:
+                break
+
+            file_path, future = pending.popleft()
+            documents = None
+            try:
+                if future is None:
+                    documents = _load_file_isolated(file_path, timeout)
+                elif _wait_for_file(future, timeout):
+                    documents = future.result()
+                else:
+                    logging.error(f"加载文件 {file_path} 超过 {timeout} 秒后仍未结束，已终止解析进程并跳过该文件。")
+                    _terminate_pool(executor)
+                    executor = ProcessPoolExecutor(max_workers=max_workers)
+                    pending = deque((path, None) for path, _ in pending)
+            except BrokenProcessPool:
+                if future is None:
+                    logging.error(f"加载文件 {file_path} 时解析进程崩溃，已跳过。")
+                else:
+                    # 无法确定是哪个文件导致了崩溃：重建进程池，并将所有在途文件改为逐个独立重试
+                    logging.warning("解析进程意外退出，正在重建进程池并逐个重试在途文件...")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(max_workers=max_workers)
+                    pending = deque([(file_path, None)] + [(path, None) for path, _ in pending])
+                    continue
+            except Exception as e:
+                logging.error(f"加载文件 {file_path} 失败: {e}", exc_info=True)
+            yield file_path, documents
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def load_documents(docs_path: str, max_workers: Optional[int] = None, timeout: Optional[float] = None) -> List[Document]:
     """
     从指定目录加载所有支持的文档。
 
@@ -31,30 +207,21 @@ def load_documents(docs_path: str) -> List[Document]:
 
     Args:
         docs_path (str): 包含文档的目录路径。
+        max_workers (Optional[int]): 并行解析的进程数，默认取配置项 LOADER_MAX_WORKERS。
+        timeout (Optional[float]): 单个文件的解析超时时间（秒），默认取配置项 LOADER_FILE_TIMEOUT。
 
     Returns:
-        List[Document]: 加载后的Document对象列表。
+        List[Document]: 加载后的Document对象列表，按文件路径排序。
     """
-    path = Path(docs_path)
-    if not path.is_dir():
+    if not Path(docs_path).is_dir():
         logging.error(f"路径 {docs_path} 不是一个有效的目录。")
         return []
 
     loaded_documents = []
-    # 递归地遍历目录下的所有文件
-    for file_path in path.rglob("*.*"):
-        ext = file_path.suffix.lower()
-        if ext in LOADER_MAPPING:
-            loader_class, loader_args = LOADER_MAPPING[ext]
-            try:
-                logging.info(f"正在加载文件: {file_path}")
-                loader = loader_class(str(file_path), **loader_args)
-                # 调用加载器的load方法，并将结果扩展到列表中
-                loaded_documents.extend(loader.load())
-            except Exception as e:
-                logging.error(f"加载文件 {file_path} 失败: {e}", exc_info=True)
-        else:
-            logging.warning(f"不支持的文件类型: {file_path}，已跳过。")
+    for _, documents in load_files(iter_document_files(docs_path), max_workers=max_workers, timeout=timeout):
+        if documents:
+            # 将每个文件的结果扩展到列表中
+            loaded_documents.extend(documents)
 
     logging.info(f"成功加载 {len(loaded_documents)} 个文档块。")
     return loaded_documents
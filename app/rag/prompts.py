@@ -46,3 +46,23 @@ contextualize_q_system_prompt = """
 """
 
 CONTEXTUALIZE_Q_PROMPT = PromptTemplate.from_template(contextualize_q_system_prompt)
+
+
+# 这个Prompt用于把超出历史窗口的较早对话轮次增量地合并进滚动摘要。
+# 每次只把新移出窗口的几条消息和已有摘要一起交给模型，而不是重新总结整个会话。
+
+summarize_history_prompt = """
+下面是一段客服对话中较早部分的摘要，以及紧接着的几条新对话。
+请将新对话中的关键信息（用户的问题和需求、涉及的产品或单号、助手给出的结论）合并进摘要，
+生成一份新的摘要。摘要应简洁、客观，使用中文，不超过{max_length}个字，不要添加对话中没有的信息。
+
+已有摘要:
+{summary}
+
+新对话:
+{new_lines}
+
+新的摘要:
+"""
+
+SUMMARIZE_HISTORY_PROMPT = PromptTemplate.from_template(summarize_history_prompt)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.rag.store import resolve_store_version
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class VectorStoreReloader:
+    """
+    向量数据库的热加载器。
+
+    数据灌输完成后会发布一个新的版本目录（见 app/rag/store.py 中的 CURRENT 指针）。
+    `reload` 在后台加载新版本的检索器并用一次查询预热，然后通过 `on_swap` 原子地替换
+    RAG链使用的检索器：之后的请求使用新版本，已经开始检索的请求仍在旧版本上完成，
+    旧版本在最后一个引用释放后被回收。同一时间最多加载一个新版本，内存中最多短暂并存两个版本。
+    """
+
+    def __init__(
+        self,
+        store_path: str,
+        load_retriever: Callable[[str], Any],
+        warm_up: Callable[[Any], None],
+        on_swap: Callable[[Optional[str], Any], None],
+    ):
+        """
+        Args:
+            store_path (str): 向量数据库根目录（VECTOR_STORE_PATH）。
+            load_retriever (Callable[[str], Any]): 从一个版本目录加载检索器。
+            warm_up (Callable[[Any], None]): 用一次查询预热新加载的检索器。
+            on_swap (Callable[[Optional[str], Any], None]): 以新的版本号和检索器替换正在使用的检索器。
+        """
+        self.store_path = store_path
+        self._load_retriever = load_retriever
+        self._warm_up = warm_up
+        self._on_swap = on_swap
+        # 当前正在使用的版本号（旧的目录结构为None）
+        self.version: Optional[str] = None
+        self.loaded = False
+        # 上一次加载失败的版本，避免定期检查时反复加载同一个损坏的版本
+        self._failed_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """加载当前发布的版本并返回检索器（用于首次创建RAG链，不调用 `on_swap`）。"""
+        with self._lock:
+            version, path = resolve_store_version(self.store_path)
+            retriever = self._load_retriever(str(path))
+            self.version, self.loaded = version, True
+            return retriever
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """
+        如果发布了新版本（或 `force` 为True），加载、预热并切换到该版本。
+
+        这是一个同步的、耗时的函数，应在线程池中调用。加载或预热失败时抛出异常，继续使用当前版本。
+
+        Returns:
+            Dict[str, Any]: 包含 `status`（"reloaded" 或 "unchanged"）和 `version` 的结果。
+        """
+        with self._lock:
+            version, path = resolve_store_version(self.store_path)
+            if not force and (version == self.version or version == self._failed_version):
+                return {"status": "unchanged", "version": self.version}
+
+            start = time.perf_counter()
+            logging.info(f"正在加载向量数据库版本 {version}...")
+            try:
+                retriever = self._load_retriever(str(path))
+                self._warm_up(retriever)
+            except Exception:
+                self._failed_version = version
+                raise
+            previous = self.version
+            self._on_swap(version, retriever)
+            self.version, self.loaded, self._failed_version = version, True, None
+            seconds = time.perf_counter() - start
+            logging.info(f"已切换到向量数据库版本 {version}（上一个版本: {previous}），耗时 {seconds:.2f}s。")
+            return {"status": "reloaded", "version": version, "previous_version": previous, "seconds": round(seconds, 3)}
+
+    async def watch(self, interval: float):
+        """每隔 `interval` 秒检查一次是否发布了新版本，有则在线程池中加载并切换。"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if not self.loaded:
+                # 首次加载（创建RAG链）完成之前不做检查
+                continue
+            try:
+                await loop.run_in_executor(None, self.reload)
+            except Exception as e:
+                logging.error(f"热加载向量数据库失败，继续使用版本 {self.version}: {e}", exc_info=True)
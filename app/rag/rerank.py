@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+from langchain.docstore.document import Document
+
+from app.core.metrics import Counter, Histogram
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- 重排序的统计指标 ---
+RERANK_LATENCY = Histogram(
+    "rag_rerank_latency_seconds",
+    "一次批量重排序（交叉编码器打分）的耗时（秒），不含超时的调用",
+    buckets=[0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0],
+)
+RERANK_TIMEOUTS = Counter("rag_rerank_timeouts_total", "超出时间预算、退回检索顺序的重排序次数")
+RERANK_ERRORS = Counter("rag_rerank_errors_total", "出错后退回检索顺序的重排序次数")
+RERANK_SKIPPED = Counter("rag_rerank_skipped_total", "打分队列已满、直接按检索顺序返回的重排序次数")
+
+# 每次调用模型打分的（问题, 文档）对数。两次调用之间检查时间预算，超出预算的任务不再占用打分线程。
+_SCORE_CHUNK_SIZE = 8
+
+
+def get_rerank_stats() -> dict:
+    """返回重排序的耗时直方图以及超时、出错的次数。"""
+    return {
+        "latency_seconds": RERANK_LATENCY.snapshot(),
+        "timeouts": RERANK_TIMEOUTS.value,
+        "errors": RERANK_ERRORS.value,
+        "skipped": RERANK_SKIPPED.value,
+    }
+
+
+class CrossEncoderReranker:
+    """
+    使用本地CPU上的交叉编码器对检索到的候选文档重新排序。
+
+    检索阶段先取回较多的候选文档，这里将（问题, 文档）对作为一个批次一次性打分，
+    只保留得分最高的 `top_k` 个，从而在提高召回的同时控制Prompt长度（即vLLM的prefill开销）。
+
+    重排序有严格的时间预算：打分任务开始执行后超过 `timeout_ms` 仍未完成时，任务在下一次模型调用之前停止，
+    直接按检索顺序取前 `top_k` 个文档，不会拖慢整个回答。预算从任务开始执行时计算，在队列中等待的时间不计入；
+    等待打分的任务（包括正在执行的）已有 `max_queue` 个时，新的请求直接按检索顺序返回，不再排队。
+    重排序得分写入文档元数据的 `rerank_score` 字段，随溯源文档一起返回给前端。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        top_k: int = 4,
+        timeout_ms: float = 300,
+        max_length: int = 512,
+        max_queue: int = 2,
+    ):
+        # 重排序是可选阶段，只有启用时才导入
+        from sentence_transformers import CrossEncoder
+
+        self.top_k = top_k
+        self.timeout = max(0.0, timeout_ms) / 1000.0
+        self.max_queue = max(1, max_queue)
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        # 单线程执行打分：模型内部已经使用多线程计算，多个批次并行只会互相争抢CPU。
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-rerank")
+        # 已提交、尚未结束的打分任务数（包括正在执行的任务）
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+    def _score(self, query: str, documents: List[Document], abandoned: threading.Event) -> List[float]:
+        started_at = time.perf_counter()
+        deadline = started_at + self.timeout
+        scores: List[float] = []
+        for i in range(0, len(documents), _SCORE_CHUNK_SIZE):
+            if i > 0 and (time.perf_counter() > deadline or abandoned.is_set()):
+                raise TimeoutError("超过时间预算")
+            pairs = [(query, doc.page_content) for doc in documents[i:i + _SCORE_CHUNK_SIZE]]
+            chunk_scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False, convert_to_numpy=True)
+            scores.extend(float(score) for score in chunk_scores)
+        RERANK_LATENCY.observe(time.perf_counter() - started_at)
+        return scores
+
+    def _wait_limit(self) -> float:
+        """
+        等待一个打分任务的最长时间（秒）。任务自己按开始执行的时间控制预算，这只是一个兜底：
+        队列中最多 `max_queue` 个任务，每个任务最多超出预算一次模型调用的时间。
+        """
+        return 2 * (self.max_queue + 1) * self.timeout
+
+    def _submit(self, query: str, documents: List[Document]) -> Optional[Future]:
+        """提交打分任务；打分队列已满时返回None。任务的 `abandoned` 事件用于通知它不再需要结果。"""
+        with self._lock:
+            if self._outstanding >= self.max_queue:
+                return None
+            self._outstanding += 1
+        abandoned = threading.Event()
+        future = self._executor.submit(self._score, query, documents, abandoned)
+        future.abandoned = abandoned
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._outstanding -= 1
+
+    def _abandon(self, future: Future):
+        # 仍在排队的任务直接取消；正在执行的任务在下一次模型调用之前停止
+        future.abandoned.set()
+        future.cancel()
+
+    def _select(self, documents: List[Document], scores: List[float]) -> List[Document]:
+        """按得分从高到低保留前 `top_k` 个文档，并在副本的元数据中记录得分（不修改文档库中的对象）。"""
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)[:self.top_k]
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": score})
+            for doc, score in ranked
+        ]
+
+    def _fallback(self, documents: List[Document], reason: str) -> List[Document]:
+        logging.warning(f"重排序{reason}，按检索顺序返回前 {self.top_k} 个文档。")
+        return documents[:self.top_k]
+
+    def _skip(self, documents: List[Document]) -> List[Document]:
+        RERANK_SKIPPED.inc()
+        return self._fallback(documents, f"队列已满（{self.max_queue} 个任务）")
+
+    def _timed_out(self, documents: List[Document]) -> List[Document]:
+        RERANK_TIMEOUTS.inc()
+        return self._fallback(documents, f"超过时间预算（{self.timeout * 1000:.0f}ms）")
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """对候选文档重新排序，超过时间预算、队列已满或出错时按原顺序截取。"""
+        if not documents:
+            return documents
+        future = self._submit(query, documents)
+        if future is None:
+            return self._skip(documents)
+        try:
+            return self._select(documents, future.result(timeout=self._wait_limit()))
+        except (TimeoutError, FutureTimeoutError):
+            self._abandon(future)
+            return self._timed_out(documents)
+        except Exception as e:
+            RERANK_ERRORS.inc()
+            logging.error(f"重排序失败: {e}", exc_info=True)
+            return self._fallback(documents, "失败")
+
+    async def arerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """`rerank` 的异步版本：等待打分结果时不占用事件循环或检索线程池。"""
+        if not documents:
+            return documents
+        future = self._submit(query, documents)
+        if future is None:
+            return self._skip(documents)
+        try:
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self._wait_limit())
+            return self._select(documents, scores)
+        except (TimeoutError, asyncio.TimeoutError):
+            self._abandon(future)
+            return self._timed_out(documents)
+        except Exception as e:
+            RERANK_ERRORS.inc()
+            logging.error(f"重排序失败: {e}", exc_info=True)
+            return self._fallback(documents, "失败")
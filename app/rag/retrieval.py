@@ -0,0 +1,127 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+
+from app.rag.sparse import SparseIndex
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> Dict[int, float]:
+    """
+    使用倒数排名融合（RRF）合并多个排序结果。
+
+    每个结果在每个排序中的得分为 1 / (k + 排名)，各排序的得分相加。RRF只使用排名，
+    因此不需要对向量距离和BM25得分这两种尺度完全不同的分数做归一化。
+
+    Args:
+        rankings (Sequence[Sequence[int]]): 多个按相关性从高到低排列的结果列表。
+        k (int): 平滑常数，越大则排名靠后的结果权重下降得越慢。
+
+    Returns:
+        Dict[int, float]: 每个结果的融合得分。
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class HybridRetriever:
+    """
+    混合检索器：同时进行向量检索和BM25关键词检索，并用RRF融合两路结果。
+
+    向量检索擅长语义相近的问法，关键词检索则能精确命中产品编号、保单号、表单名称等
+    嵌入模型难以区分的字面内容。两路检索都以文本块在FAISS索引中的ID作为标识，
+    融合后只为最终的前k个结果读取文档内容。
+    """
+
+    def __init__(
+        self,
+        vector_store: FAISS,
+        sparse_index: Optional[SparseIndex] = None,
+        k: int = 4,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+    ):
+        """
+        Args:
+            vector_store (FAISS): 向量数据库。
+            sparse_index (Optional[SparseIndex]): 关键词索引，为None时只使用向量检索。
+            k (int): 返回的文档数。
+            fetch_k (int): 融合前每一路检索返回的候选数。
+            rrf_k (int): RRF的平滑常数。
+        """
+        self.vectorstore = vector_store
+        self.sparse_index = sparse_index
+        self.k = k
+        self.fetch_k = max(fetch_k, k)
+        self.rrf_k = rrf_k
+
+    def _dense_search(self, query_vector: List[float], k: int) -> List[Tuple[int, float]]:
+        vector = np.array([query_vector], dtype=np.float32)
+        if self.vectorstore._normalize_L2:
+            faiss.normalize_L2(vector)
+        scores, indices = self.vectorstore.index.search(vector, k)
+        return [(int(i), float(score)) for i, score in zip(indices[0], scores[0]) if i != -1]
+
+    def _get_document(self, pos: int, score: float) -> Optional[Document]:
+        chunk_id = self.vectorstore.index_to_docstore_id[pos]
+        doc = self.vectorstore.docstore.search(chunk_id)
+        if not isinstance(doc, Document):
+            logging.warning(f"文本块 {pos} 在文档库中不存在: {doc}")
+            return None
+        # 返回副本并附上文本块ID和检索得分，聊天记录中只保存这两项作为溯源文档的引用
+        return Document(
+            page_content=doc.page_content,
+            metadata={**doc.metadata, "chunk_id": chunk_id, "retrieval_score": score},
+        )
+
+    def search(self, query: str, query_vector: List[float]) -> List[Document]:
+        """
+        检索与查询最相关的k个文档。
+
+        每个文档的元数据中会附上 `chunk_id`（文本块ID）和 `retrieval_score`：
+        只使用向量检索时为FAISS返回的得分（距离或内积，取决于索引的度量方式），混合检索时为RRF融合得分。
+
+        Args:
+            query (str): 查询文本，用于关键词检索。
+            query_vector (List[float]): 查询向量，用于向量检索。
+
+        Returns:
+            List[Document]: 按融合得分从高到低排列的文档。
+        """
+        if self.sparse_index is None:
+            ranked = self._dense_search(query_vector, self.k)
+        else:
+            dense = [pos for pos, _ in self._dense_search(query_vector, self.fetch_k)]
+            sparse = [pos for pos, _ in self.sparse_index.search(query, self.fetch_k)]
+            scores = reciprocal_rank_fusion([dense, sparse], k=self.rrf_k)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.k]
+        documents = (self._get_document(pos, score) for pos, score in ranked)
+        return [doc for doc in documents if doc is not None]
+
+    def get_documents(self, chunk_ids: Iterable[str]) -> Dict[str, Document]:
+        """
+        按文本块ID读取文档，用于展开聊天记录中的溯源文档引用。
+
+        重新灌输后已被移除或替换的文本块不会出现在结果中。
+
+        Args:
+            chunk_ids (Iterable[str]): 文本块ID。
+
+        Returns:
+            Dict[str, Document]: 文本块ID到文档的映射。
+        """
+        documents = {}
+        for chunk_id in chunk_ids:
+            doc = self.vectorstore.docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                documents[chunk_id] = doc
+        return documents
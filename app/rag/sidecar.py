@@ -0,0 +1,349 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # orjson是可选依赖，未安装时退回标准库json
+    orjson = None
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 检索服务进程（sidecar）。
+#
+# 多worker部署时，每个worker进程各自加载一份嵌入模型和FAISS索引，内存随worker数线性增长。
+# 配置 RETRIEVAL_SIDECAR_SOCKET 后，嵌入模型和索引只由一个独立的本地进程持有
+# （`python -m app.rag.sidecar`），各worker通过Unix套接字向它发送查询向量化和检索请求。
+# 来自所有worker的并发查询在服务进程中进入同一个微批处理队列（BatchingEmbeddings），
+# 批次更满，检索吞吐量不低于各worker各自处理。
+#
+# 协议：每条消息是一个4字节（大端）长度前缀加一个JSON对象。
+#   请求：{"op": "embed_query" | "embed_documents" | "search" | "get_documents" | "reload" | "ping", ...参数}
+#   响应：{"result": ...} 或 {"error": "错误信息"}
+#   "search" 的结果为 {"version": 服务进程当前加载的向量数据库版本, "documents": [...]}，
+#   worker据此发现服务进程热加载了新版本，并清空自己的语义缓存。
+
+_HEADER = struct.Struct("!I")
+# 单条消息的最大长度，防止异常数据导致服务进程分配过多内存
+_MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+# 热加载向量数据库可能需要较长时间，单独使用一个更长的超时时间（秒）
+_RELOAD_TIMEOUT_SECONDS = 600
+
+
+class SidecarError(RuntimeError):
+    """检索服务进程返回的错误，或与它通信失败。"""
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _document_to_dict(doc: Document) -> Dict[str, Any]:
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+
+def _document_from_dict(data: Dict[str, Any]) -> Document:
+    return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+
+# --- worker端：客户端 ---
+
+class SidecarClient:
+    """
+    检索服务进程的同步客户端，维护一个Unix套接字连接池。
+
+    每次调用从池中取出一个连接，发送请求并等待响应，因此可以在检索线程池的多个线程中并发使用。
+    服务进程重启后，池中失效的连接会在下一次调用时被自动替换。
+    """
+
+    def __init__(self, socket_path: str, pool_size: int = 16, timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[socket.socket]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+
+    def _connect(self) -> socket.socket:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(self.timeout)
+        try:
+            conn.connect(self.socket_path)
+        except OSError:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def _recv_exactly(conn: socket.socket, size: int) -> bytes:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = conn.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError("检索服务进程关闭了连接")
+            received += n
+        return bytes(buffer)
+
+    def _roundtrip(self, conn: socket.socket, payload: bytes) -> Dict[str, Any]:
+        conn.sendall(_HEADER.pack(len(payload)) + payload)
+        (size,) = _HEADER.unpack(self._recv_exactly(conn, _HEADER.size))
+        return _loads(self._recv_exactly(conn, size))
+
+    def call(self, op: str, timeout: Optional[float] = None, **params) -> Any:
+        """
+        发送一个请求并返回结果。服务进程返回错误或通信失败时抛出 `SidecarError`。
+
+        `timeout` 为本次请求的超时时间（秒），默认使用客户端的超时时间。
+        """
+        payload = _dumps({"op": op, **params})
+        with self._slots:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = None, False
+            try:
+                if conn is None:
+                    conn = self._connect()
+                conn.settimeout(timeout or self.timeout)
+                try:
+                    response = self._roundtrip(conn, payload)
+                except ConnectionError:
+                    if not reused:
+                        raise
+                    # 池中的连接可能在服务进程重启后失效，换一个新连接重试一次
+                    conn.close()
+                    conn = self._connect()
+                    conn.settimeout(timeout or self.timeout)
+                    response = self._roundtrip(conn, payload)
+            except OSError as e:
+                if conn is not None:
+                    conn.close()
+                raise SidecarError(f"无法与检索服务进程 {self.socket_path} 通信: {e}") from e
+            conn.settimeout(self.timeout)
+            self._idle.put(conn)
+        if "error" in response:
+            raise SidecarError(response["error"])
+        return response["result"]
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SidecarEmbeddings(Embeddings):
+    """通过检索服务进程计算向量的嵌入模型前端，worker进程自身不加载模型。"""
+
+    def __init__(self, client: SidecarClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_documents", texts=texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.call("embed_query", text=text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.embed_query, text)
+
+
+class SidecarRetriever:
+    """
+    通过检索服务进程执行混合检索的检索器，接口与 `HybridRetriever` 的 `search` / `get_documents` 相同。
+
+    每次检索的响应都带有服务进程当前加载的向量数据库版本。与上一次看到的版本不同时
+    （服务进程热加载了新版本，或以新版本重启），调用 `on_version_change(上一个版本, 新版本)`。
+    """
+
+    def __init__(self, client: SidecarClient, on_version_change: Optional[Callable[[Optional[str], Optional[str]], None]] = None):
+        self.client = client
+        self.on_version_change = on_version_change
+        # 上一次检索响应中的版本，首次检索之前为None
+        self.version: Optional[str] = None
+        self._seen_version = False
+        self._version_lock = threading.Lock()
+
+    def _observe_version(self, version: Optional[str]):
+        with self._version_lock:
+            if self._seen_version and version == self.version:
+                return
+            previous, changed = self.version, self._seen_version
+            self.version, self._seen_version = version, True
+        if changed and self.on_version_change is not None:
+            self.on_version_change(previous, version)
+
+    def search(self, query: str, query_vector: List[float]) -> List[Document]:
+        result = self.client.call("search", query=query, query_vector=query_vector)
+        self._observe_version(result["version"])
+        return [_document_from_dict(doc) for doc in result["documents"]]
+
+    def get_documents(self, chunk_ids: Iterable[str]) -> Dict[str, Document]:
+        documents = self.client.call("get_documents", chunk_ids=list(chunk_ids))
+        return {chunk_id: _document_from_dict(doc) for chunk_id, doc in documents.items()}
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """请求检索服务进程热加载向量数据库的新版本（见 `VectorStoreReloader.reload`）。"""
+        return self.client.call("reload", timeout=_RELOAD_TIMEOUT_SECONDS, force=force)
+
+
+# --- 服务进程端 ---
+
+class RetrievalSidecar:
+    """
+    检索服务进程：持有嵌入模型和检索器，在Unix套接字上响应各worker的请求。
+
+    查询向量化通过 `BatchingEmbeddings` 的异步接口等待批处理结果，来自不同worker的并发查询
+    会合并到同一个批次中；检索和文档读取在线程池中执行（FAISS检索时会释放GIL）。
+    提供 `reloader` 时，向量数据库的新版本由服务进程热加载，各worker无需处理。
+    """
+
+    def __init__(self, embeddings: Embeddings, retriever, max_workers: int = 4, reloader=None, version: Optional[str] = None):
+        self.embeddings = embeddings
+        self.retriever = retriever
+        self.reloader = reloader
+        # 当前检索器对应的向量数据库版本，随检索结果一起返回给worker
+        self.version = version
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sidecar-retrieval")
+
+    async def _dispatch(self, request: Dict[str, Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        op = request.get("op")
+        if op == "embed_query":
+            return await self.embeddings.aembed_query(request["text"])
+        if op == "embed_documents":
+            return await loop.run_in_executor(self._executor, self.embeddings.embed_documents, request["texts"])
+        if op == "search":
+            # 先读版本再读检索器（切换时顺序相反）：并发切换时宁可报告旧版本号，也不会把旧版本的结果标成新版本
+            version = self.version
+            documents = await loop.run_in_executor(
+                self._executor, self.retriever.search, request["query"], request["query_vector"]
+            )
+            return {"version": version, "documents": [_document_to_dict(doc) for doc in documents]}
+        if op == "get_documents":
+            documents = await loop.run_in_executor(self._executor, self.retriever.get_documents, request["chunk_ids"])
+            return {chunk_id: _document_to_dict(doc) for chunk_id, doc in documents.items()}
+        if op == "reload":
+            if self.reloader is None:
+                raise RuntimeError("检索服务进程未启用向量数据库热加载")
+            # 在默认线程池中加载，不占用检索线程
+            return await loop.run_in_executor(None, self.reloader.reload, bool(request.get("force", False)))
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"未知的请求类型: {op}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个worker连接上的请求，直到连接关闭。每个连接上的请求按顺序处理。"""
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    return
+                (size,) = _HEADER.unpack(header)
+                if size > _MAX_MESSAGE_BYTES:
+                    logging.error(f"请求过大（{size} 字节），关闭连接。")
+                    return
+                try:
+                    response = {"result": await self._dispatch(_loads(await reader.readexactly(size)))}
+                except asyncio.IncompleteReadError:
+                    return
+                except Exception as e:
+                    logging.error(f"处理检索请求时出错: {e}", exc_info=True)
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                payload = _dumps(response)
+                writer.write(_HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: str, reload_interval: float = 0):
+        """在 `socket_path` 上监听，直到进程被终止。`reload_interval` 大于0时定期检查向量数据库的新版本。"""
+        if os.path.exists(socket_path):
+            # 上一次运行遗留的套接字文件
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+        server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        # 只允许同一用户（及同组）的worker进程连接
+        os.chmod(socket_path, 0o660)
+        logging.info(f"检索服务进程已在 {socket_path} 上就绪。")
+        watch_task = None
+        if self.reloader is not None and reload_interval > 0:
+            watch_task = asyncio.get_running_loop().create_task(self.reloader.watch(reload_interval))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watch_task is not None:
+                watch_task.cancel()
+
+
+def main():
+    """加载嵌入模型和向量数据库，预热后启动检索服务进程。"""
+    from app.rag.chain import get_embeddings, get_retriever  # 在函数内导入，worker进程导入本模块时不依赖chain
+    from app.rag.reload import VectorStoreReloader
+
+    socket_path = settings.RETRIEVAL_SIDECAR_SOCKET
+    if not socket_path:
+        raise SystemExit("请先在 .env 中设置 RETRIEVAL_SIDECAR_SOCKET（例如 /tmp/rag/retrieval.sock）。")
+
+    start = time.perf_counter()
+    embeddings = get_embeddings()
+    sidecar = RetrievalSidecar(embeddings, None, max_workers=settings.RETRIEVAL_MAX_WORKERS)
+
+    def warm_up(retriever):
+        # 预热：加载模型权重并将内存映射的索引页读入缓存
+        retriever.search("预热", embeddings.embed_query("预热"))
+
+    def swap(version, retriever):
+        sidecar.retriever = retriever
+        sidecar.version = version
+
+    sidecar.reloader = VectorStoreReloader(
+        settings.VECTOR_STORE_PATH,
+        load_retriever=lambda path: get_retriever(embeddings, path),
+        warm_up=warm_up,
+        on_swap=swap,
+    )
+    sidecar.retriever = sidecar.reloader.load()
+    sidecar.version = sidecar.reloader.version
+    warm_up(sidecar.retriever)
+    logging.info(f"嵌入模型和向量数据库加载完成，耗时 {time.perf_counter() - start:.2f}s。")
+
+    try:
+        asyncio.run(sidecar.serve(socket_path, reload_interval=settings.VECTOR_STORE_RELOAD_INTERVAL_SECONDS))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from langchain.docstore.document import Document
+
+from app.rag.chain import aget_source_documents
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 溯源文档的引用格式：
+#   {"chunk_id": "...", "metadata": {"source": ..., "retrieval_score": ..., "rerank_score": ...}}
+# 文本块的内容只保存在向量数据库的文档库中，聊天记录和SSE事件里只保存引用，
+# 需要查看原文时再按ID读取（展开后的引用会多出 "page_content" 字段）。
+# 旧版本保存的溯源文档是完整的 `Document.dict()`（带有page_content、没有chunk_id），原样返回。
+
+
+def to_source_reference(doc: Document) -> Dict[str, Any]:
+    """将检索到的文档转换为溯源引用：文本块ID和元数据（含检索/重排序得分），不含文本内容。"""
+    metadata = dict(doc.metadata)
+    chunk_id = metadata.pop("chunk_id", None)
+    return {"chunk_id": chunk_id, "metadata": metadata}
+
+
+async def expand_source_references(
+    references: Optional[List[Dict[str, Any]]]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    为溯源引用补充文本块的原文（`page_content`）。
+
+    文本块已在重新灌输时被移除的，`page_content` 为None，元数据中的来源信息仍然可用。
+
+    Args:
+        references (Optional[List[Dict[str, Any]]]): 溯源引用列表。
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: 展开后的溯源引用列表（新的列表，不修改传入的对象）。
+    """
+    if not references:
+        return references
+    chunk_ids = {ref["chunk_id"] for ref in references if ref.get("chunk_id") and "page_content" not in ref}
+    documents = await aget_source_documents(chunk_ids) if chunk_ids else {}
+    expanded = []
+    for ref in references:
+        if ref.get("chunk_id") and "page_content" not in ref:
+            doc = documents.get(ref["chunk_id"])
+            ref = {**ref, "page_content": doc.page_content if doc is not None else None}
+        expanded.append(ref)
+    return expanded
@@ -0,0 +1,169 @@
+import logging
+import math
+import re
+import sqlite3
+from array import array
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import jieba
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# jieba默认以DEBUG级别输出加载词典的日志
+jieba.setLogLevel(logging.INFO)
+
+# 稀疏（关键词）索引与文档库保存在同一个SQLite文件中：
+# - sparse_terms：每个词一行，倒排表以紧凑的二进制形式保存（文本块在FAISS索引中的ID为int32，词频为uint16），
+#   查询时只按主键读取查询中出现的几个词，不需要在启动时加载整个倒排索引。
+# - sparse_meta：每个文本块的长度（词数），用于BM25的长度归一化。
+
+# 产品编号、保单号、表单编号等由字母数字和连接符组成的代码，分词器会把它们切开，这里额外保留完整形式
+_CODE_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)+")
+# 至少包含一个汉字、字母或数字的词才会被索引（过滤标点和空白）
+_WORD_PATTERN = re.compile(r"[0-9a-z一-鿿]")
+# 常见的中文虚词，出现在几乎所有文本块中，对检索没有帮助
+STOPWORDS = frozenset(
+    "的 了 和 与 及 或 是 在 有 为 对 也 就 都 而 被 把 等 这 那 之 其 吗 呢 吧 啊 我 你 他 她 它 我们 你们 请问 如何 怎么 什么".split()
+)
+
+_TF_MAX = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    对中英文混合文本进行分词，返回用于检索的词列表（含重复）。
+
+    中文使用jieba的搜索引擎模式（长词会额外切出其中的短词，提高召回），英文和数字统一转为小写；
+    形如 `AB-1234` 的编号会同时以完整形式出现在结果中。
+    """
+    text = text.lower()
+    tokens = [
+        token for token in jieba.lcut_for_search(text)
+        if token not in STOPWORDS and _WORD_PATTERN.search(token)
+    ]
+    tokens.extend(_CODE_PATTERN.findall(text))
+    return tokens
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """返回文本中每个词的出现次数。"""
+    return dict(Counter(tokenize(text)))
+
+
+class SparseIndexWriter:
+    """在保存向量数据库时累积每个文本块的词频，最后一次性写出倒排索引。"""
+
+    def __init__(self):
+        self._vocabulary: Dict[str, int] = {}
+        # 以三个平行数组记录所有 (词ID, 文本块在FAISS中的ID, 词频) 三元组，比Python列表节省大量内存
+        self._term_ids = array("i")
+        self._positions = array("i")
+        self._tfs = array("H")
+        self._doc_lengths: Dict[int, int] = {}
+
+    def add(self, pos: int, counts: Dict[str, int]):
+        """添加一个文本块（`pos` 为它在FAISS索引中的ID）的词频。"""
+        for term, tf in counts.items():
+            term_id = self._vocabulary.setdefault(term, len(self._vocabulary))
+            self._term_ids.append(term_id)
+            self._positions.append(pos)
+            self._tfs.append(min(tf, _TF_MAX))
+        self._doc_lengths[pos] = sum(counts.values())
+
+    def write(self, conn: sqlite3.Connection):
+        """将倒排索引写入SQLite连接（调用方负责提交事务）。"""
+        conn.execute("CREATE TABLE sparse_terms (term TEXT PRIMARY KEY, positions BLOB NOT NULL, tfs BLOB NOT NULL)")
+        conn.execute("CREATE TABLE sparse_meta (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+        doc_lengths = np.zeros(max(self._doc_lengths, default=-1) + 1, dtype=np.int32)
+        for pos, length in self._doc_lengths.items():
+            doc_lengths[pos] = length
+        conn.execute("INSERT INTO sparse_meta VALUES ('doc_lengths', ?)", (doc_lengths.tobytes(),))
+
+        term_ids = np.frombuffer(self._term_ids, dtype=np.int32)
+        positions = np.frombuffer(self._positions, dtype=np.int32)
+        tfs = np.frombuffer(self._tfs, dtype=np.uint16)
+        # 按词ID排序后，每个词的倒排表就是一段连续的切片；同一个词内部保持文本块ID的顺序
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, positions, tfs = term_ids[order], positions[order], tfs[order]
+        bounds = np.searchsorted(term_ids, np.arange(len(self._vocabulary) + 1))
+        terms = list(self._vocabulary)
+
+        def _rows():
+            for term_id, term in enumerate(terms):
+                start, end = bounds[term_id], bounds[term_id + 1]
+                yield term, positions[start:end].tobytes(), tfs[start:end].tobytes()
+
+        conn.executemany("INSERT INTO sparse_terms VALUES (?, ?, ?)", _rows())
+        logging.info(f"已构建关键词索引：{len(terms)} 个词，{len(positions)} 条倒排记录。")
+
+
+class SparseIndex:
+    """
+    基于SQLite中倒排索引的BM25关键词检索。
+
+    初始化时只读取每个文本块的长度（每个文本块4字节），倒排表在查询时按词读取，
+    因此加载时间和内存占用都很小，单次查询通常只需几毫秒。
+    """
+
+    def __init__(self, reader, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            reader: 提供 `connection` 属性（每个线程一个只读SQLite连接）的对象。
+            k1 (float): BM25的词频饱和参数。
+            b (float): BM25的长度归一化参数。
+        """
+        self._reader = reader
+        self.k1 = k1
+        self.b = b
+        row = reader.connection.execute("SELECT value FROM sparse_meta WHERE key = 'doc_lengths'").fetchone()
+        self._doc_lengths = np.frombuffer(row[0], dtype=np.int32).astype(np.float32)
+        self._num_docs = int(np.count_nonzero(self._doc_lengths)) or 1
+        self._avg_length = float(self._doc_lengths.sum()) / self._num_docs or 1.0
+        # 提前加载jieba的词典，避免第一次查询时的延迟
+        jieba.initialize()
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        返回与查询最相关的前k个文本块。
+
+        Returns:
+            List[Tuple[int, float]]: (文本块在FAISS索引中的ID, BM25得分)，按得分从高到低排列。
+        """
+        connection = self._reader.connection
+        all_positions, all_scores = [], []
+        for term in set(tokenize(query)):
+            row = connection.execute("SELECT positions, tfs FROM sparse_terms WHERE term = ?", (term,)).fetchone()
+            if row is None:
+                continue
+            positions = np.frombuffer(row[0], dtype=np.int32)
+            tfs = np.frombuffer(row[1], dtype=np.uint16).astype(np.float32)
+            df = len(positions)
+            idf = math.log(1.0 + (self._num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths[positions] / self._avg_length)
+            all_positions.append(positions)
+            all_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not all_positions:
+            return []
+
+        # 同一个文本块在多个词的倒排表中出现时，累加各词的得分。
+        # 倒排表较短时只对出现过的文本块去重累加；查询中含有高频词、倒排记录与文本块总数相当时，
+        # 直接在覆盖所有文本块的稠密数组上累加更快。
+        positions = np.concatenate(all_positions)
+        weights = np.concatenate(all_scores)
+        if len(positions) * 8 > len(self._doc_lengths):
+            scores = np.bincount(positions, weights=weights, minlength=len(self._doc_lengths))
+            positions = np.flatnonzero(scores)
+            scores = scores[positions]
+        else:
+            positions, inverse = np.unique(positions, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(positions[i]), float(scores[i])) for i in top]
+
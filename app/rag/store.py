@@ -0,0 +1,288 @@
+import datetime
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import faiss
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from app.rag.sparse import SparseIndex, SparseIndexWriter, term_counts
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 向量数据库的磁盘格式：
+# - index.faiss：FAISS索引文件，服务进程以内存映射方式只读打开，多个worker进程共享操作系统的页缓存。
+# - docstore.sqlite：文本块存储，每行是一个文本块（在FAISS索引中的int64 ID `pos`、文本块ID、内容、元数据和词频），
+#   查询时只按ID读取命中的前k个文本块，无需在启动时反序列化整个文档库。
+#   同一个文件中还保存着用于关键词检索的倒排索引（见 app/rag/sparse.py）。
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.sqlite"
+# LangChain的旧格式（pickle的文档库），仅用于兼容读取
+LEGACY_PICKLE_FILENAME = "index.pkl"
+
+# 版本化的目录结构：每次灌输都写入 versions/<版本号>/ 下的一个新目录，写完后再原子地更新
+# CURRENT 文件（内容为当前版本号）。运行中的服务始终读取一个完整的版本，并可在后台热加载新版本。
+# 没有 CURRENT 文件时（旧版本的目录结构），向量数据库的文件直接位于根目录中。
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+
+
+def resolve_store_version(store_path: str) -> Tuple[Optional[str], Path]:
+    """
+    返回向量数据库当前版本的版本号和目录。
+
+    旧的目录结构（没有 CURRENT 文件）返回 (None, 根目录)。
+    """
+    root = Path(store_path)
+    try:
+        version = (root / CURRENT_FILENAME).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None, root
+    return version, root / VERSIONS_DIRNAME / version
+
+
+def create_store_version(store_path: str) -> Tuple[str, Path]:
+    """创建一个新的空版本目录（尚未发布），返回版本号和目录。版本号按创建时间排序。"""
+    versions_dir = Path(store_path) / VERSIONS_DIRNAME
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    base = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    version, n = base, 1
+    while (versions_dir / version).exists():
+        n += 1
+        version = f"{base}-{n}"
+    path = versions_dir / version
+    path.mkdir()
+    return version, path
+
+
+def publish_store_version(store_path: str, version: str):
+    """将 CURRENT 原子地指向 `version`。正在运行的服务会在下一次检查时热加载这个版本。"""
+    root = Path(store_path)
+    tmp_path = root / (CURRENT_FILENAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, root / CURRENT_FILENAME)
+
+
+def prune_store_versions(store_path: str, keep: int) -> List[str]:
+    """
+    删除较旧的版本目录，保留最新的 `keep` 个（当前版本总会保留）。返回被删除的版本号。
+
+    正在运行的服务可能仍在使用上一个版本（热加载之前），因此 `keep` 至少为2。
+    """
+    versions_dir = Path(store_path) / VERSIONS_DIRNAME
+    if not versions_dir.is_dir():
+        return []
+    current, _ = resolve_store_version(store_path)
+    versions = sorted(p.name for p in versions_dir.iterdir() if p.is_dir())
+    removed = []
+    for version in versions[:-max(2, keep)]:
+        if version == current:
+            continue
+        shutil.rmtree(versions_dir / version, ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+def _mmap_flags() -> int:
+    """返回以内存映射方式只读打开索引所用的标志。"""
+    # IO_FLAG_MMAP_IFC（faiss>=1.8）可以直接映射Flat/HNSW的向量数据；旧版本只支持映射IVF的倒排表
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return mmap_flag | faiss.IO_FLAG_READ_ONLY
+
+
+class _SQLiteReader:
+    """为每个线程维护一个只读的SQLite连接（检索在线程池中并发执行）。"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+
+class SQLiteDocstore(Docstore):
+    """按文本块ID从SQLite中读取文档的只读文档库。"""
+
+    def __init__(self, reader: _SQLiteReader):
+        self._reader = reader
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._reader.connection.execute(
+            "SELECT page_content, metadata FROM chunks WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+
+class SQLiteIndexMapping(Mapping):
+    """FAISS索引中的ID（`pos`）到文本块ID的只读映射，按需从SQLite中查询。"""
+
+    def __init__(self, reader: _SQLiteReader):
+        self._reader = reader
+
+    def __getitem__(self, pos: int) -> str:
+        row = self._reader.connection.execute("SELECT id FROM chunks WHERE pos = ?", (int(pos),)).fetchone()
+        if row is None:
+            raise KeyError(pos)
+        return row[0]
+
+    def __iter__(self) -> Iterator[int]:
+        for (pos,) in self._reader.connection.execute("SELECT pos FROM chunks ORDER BY pos"):
+            yield pos
+
+    def __len__(self) -> int:
+        return self._reader.connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+def open_docstore(db_path: Path) -> sqlite3.Connection:
+    """
+    打开（不存在时创建）可写的文档库，供数据灌输逐批写入文本块。
+
+    旧版本保存的文档库没有词频列时会补上该列，缺少的词频在 `write_sparse_index` 中补算。
+    """
+    conn = sqlite3.connect(str(db_path))
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS chunks ("
+        " pos INTEGER PRIMARY KEY,"
+        " id TEXT NOT NULL UNIQUE,"
+        " page_content TEXT NOT NULL,"
+        " metadata TEXT NOT NULL,"
+        " terms TEXT NOT NULL)"
+    )
+    if "terms" not in {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}:
+        conn.execute("ALTER TABLE chunks ADD COLUMN terms TEXT")
+    conn.commit()
+    return conn
+
+
+def insert_chunks(conn: sqlite3.Connection, chunks: Iterable[Tuple[int, str, Document]]):
+    """
+    将文本块写入文档库（调用方负责提交事务），同时保存每个文本块的词频，构建关键词索引时无需重新分词。
+
+    Args:
+        conn (sqlite3.Connection): `open_docstore` 打开的连接。
+        chunks (Iterable[Tuple[int, str, Document]]): （在FAISS索引中的ID, 文本块ID, 文档）。
+    """
+    conn.executemany(
+        "INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                pos,
+                chunk_id,
+                doc.page_content,
+                json.dumps(doc.metadata, ensure_ascii=False, default=str),
+                json.dumps(term_counts(doc.page_content), ensure_ascii=False),
+            )
+            for pos, chunk_id, doc in chunks
+        ),
+    )
+
+
+def write_sparse_index(conn: sqlite3.Connection):
+    """
+    根据文档库中每个文本块的词频，重新构建关键词检索的倒排索引（调用方负责提交事务）。
+
+    文本块的内容不会读入内存，只按顺序读取词频；旧版本文档库中缺少的词频会先分批补算。
+    """
+    while True:
+        rows = conn.execute("SELECT pos, page_content FROM chunks WHERE terms IS NULL LIMIT 1000").fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE chunks SET terms = ? WHERE pos = ?",
+            ((json.dumps(term_counts(content), ensure_ascii=False), pos) for pos, content in rows),
+        )
+    conn.execute("DROP TABLE IF EXISTS sparse_terms")
+    conn.execute("DROP TABLE IF EXISTS sparse_meta")
+    sparse_writer = SparseIndexWriter()
+    for pos, terms in conn.execute("SELECT pos, terms FROM chunks ORDER BY pos"):
+        sparse_writer.add(pos, json.loads(terms))
+    sparse_writer.write(conn)
+
+
+def load_vector_store(store_path: str, embeddings, mmap: bool = False) -> FAISS:
+    """
+    加载向量数据库。
+
+    - `mmap=True`（服务进程）：索引以内存映射方式只读打开，文档库和ID映射直接查询SQLite，
+      启动时间与知识库大小基本无关。得到的向量数据库是只读的。
+    - `mmap=False`（数据灌输）：索引和所有文本块都读入内存，得到一个可修改的向量数据库。
+
+    如果目录中只有旧格式（index.pkl）的数据，则回退到LangChain的 `FAISS.load_local`。
+
+    Args:
+        store_path (str): 向量数据库目录。
+        embeddings: 嵌入模型。
+        mmap (bool): 是否以内存映射的只读方式加载。
+
+    Returns:
+        FAISS: 加载后的向量数据库。
+    """
+    path = Path(store_path)
+    db_path = path / DOCSTORE_FILENAME
+    if not db_path.exists():
+        logging.warning(f"{store_path} 中没有 {DOCSTORE_FILENAME}，将以旧的pickle格式加载。重新灌输数据即可迁移到新格式。")
+        return FAISS.load_local(store_path, embeddings, allow_dangerous_deserialization=True)
+
+    if mmap:
+        index = faiss.read_index(str(path / INDEX_FILENAME), _mmap_flags())
+        reader = _SQLiteReader(db_path)
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=SQLiteDocstore(reader),
+            index_to_docstore_id=SQLiteIndexMapping(reader),
+        )
+
+    index = faiss.read_index(str(path / INDEX_FILENAME))
+    documents, index_to_docstore_id = {}, {}
+    conn = sqlite3.connect(str(db_path))
+    try:
+        for pos, chunk_id, page_content, metadata in conn.execute("SELECT pos, id, page_content, metadata FROM chunks"):
+            index_to_docstore_id[pos] = chunk_id
+            documents[chunk_id] = Document(page_content=page_content, metadata=json.loads(metadata))
+    finally:
+        conn.close()
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(documents),
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def load_sparse_index(store_path: str) -> Optional[SparseIndex]:
+    """
+    加载向量数据库目录中的关键词倒排索引。
+
+    旧格式的向量数据库没有倒排索引，此时返回None，检索退化为只使用向量检索。
+    """
+    db_path = Path(store_path) / DOCSTORE_FILENAME
+    if not db_path.exists():
+        return None
+    reader = _SQLiteReader(db_path)
+    try:
+        return SparseIndex(reader)
+    except sqlite3.Error:
+        logging.warning(f"{db_path} 中没有关键词索引，将只使用向量检索。重新灌输数据即可启用混合检索。")
+        return None
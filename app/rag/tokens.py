@@ -0,0 +1,69 @@
+import logging
+import re
+import threading
+
+from app.core.config import settings
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 估算文本的token数。
+# 项目的大模型、嵌入模型都在内网部署，默认不依赖需要联网下载词表的分词器，
+# 而是使用一个偏保守的估算：每个汉字（及全角字符）计为1个token，
+# 连续的字母、数字按每4个字符1个token计算，其他标点符号各计为1个token。
+# 对于Qwen等中文模型，实际token数通常略少于估算值，因此按估算值控制的预算不会超出。
+# 配置了 LLM_TOKENIZER_PATH（vLLM加载的模型目录）时，改用大模型自己的分词器精确计数。
+_TOKEN_PATTERN = re.compile(r"[　-鿿가-힯＀-￯]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+# 大模型的分词器（首次使用时加载）。加载失败时为None，退回估算
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded or not settings.LLM_TOKENIZER_PATH:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            try:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(settings.LLM_TOKENIZER_PATH)
+                logging.info(f"已加载大模型分词器: {settings.LLM_TOKENIZER_PATH}")
+            except Exception as e:
+                logging.warning(f"加载大模型分词器 {settings.LLM_TOKENIZER_PATH} 失败，将按字符估算token数: {e}")
+            _tokenizer_loaded = True
+    return _tokenizer
+
+
+def _piece_cost(piece: str) -> int:
+    if piece[0].isascii() and (piece[0].isalnum() or piece[0] == "_"):
+        return (len(piece) + 3) // 4
+    return 1
+
+
+def count_tokens(text: str) -> int:
+    """计算一段文本的token数（配置了大模型分词器时精确计数，否则估算）。"""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text or "", add_special_tokens=False))
+    return sum(_piece_cost(match.group()) for match in _TOKEN_PATTERN.finditer(text or ""))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截取文本的开头部分，使其token数不超过 `max_tokens`。"""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        offsets = tokenizer(text or "", add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens][0]] if max_tokens > 0 else ""
+    total = 0
+    for match in _TOKEN_PATTERN.finditer(text or ""):
+        cost = _piece_cost(match.group())
+        if total + cost > max_tokens:
+            return text[:match.start()]
+        total += cost
+    return text
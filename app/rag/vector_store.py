@@ -1,68 +1,511 @@
+import hashlib
+import json
 import logging
-from typing import List
+import os
+import queue
+import shutil
+import threading
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import faiss
+import numpy as np
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 
 from app.core.config import settings
+from app.rag.embedding_backends import create_embedding_model
+from app.rag.index import build_id_index, index_needs_training, migrate_to_id_index, remove_vectors
+from app.rag.loader import iter_document_files, load_files
+from app.rag.store import (
+    DOCSTORE_FILENAME,
+    create_store_version,
+    insert_chunks,
+    open_docstore,
+    prune_store_versions,
+    publish_store_version,
+    resolve_store_version,
+    write_sparse_index,
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def create_vector_store(documents: List[Document]):
-    """
-    从文档列表创建FAISS向量数据库，并将其保存到磁盘。
-
-    这个函数执行了RAG流程中的“Indexing”（索引）部分的关键步骤：
-    1.  文本分割 (Splitting)
-    2.  向量化 (Embedding)
-    3.  存储与索引 (Storing & Indexing)
-
-    Args:
-        documents (List[Document]): 从`loader`模块加载的文档对象列表。
-    """
-    if not documents:
-        logging.warning("没有提供用于创建向量数据库的文档。正在中止。")
-        return
+# 与FAISS索引保存在同一目录下的文件清单，记录每个源文件的内容哈希、修改时间和文本块ID，
+# 用于增量更新时判断哪些文件需要重新处理。
+MANIFEST_FILENAME = "manifest.json"
+FAISS_INDEX_FILENAME = "index.faiss"
+# 流式灌输过程中保存检查点的子目录
+CHECKPOINT_DIRNAME = ".checkpoint"
 
-    logging.info("开始创建向量数据库...")
+# --- 辅助函数 ---
 
-    # 1. 将文档分割成更小的块 (Chunks)
-    logging.info(f"正在将 {len(documents)} 个文档分割成文本块...")
+def split_documents(documents: List[Document]) -> List[Document]:
+    """将文档分割成更小的文本块 (Chunks)。"""
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,       # 每个块的最大字符数
         chunk_overlap=200,     # 块之间的重叠字符数
         length_function=len,
         is_separator_regex=False,
     )
-    chunks = text_splitter.split_documents(documents)
-    logging.info(f"已创建 {len(chunks)} 个文本块。")
+    return text_splitter.split_documents(documents)
 
-    # 2. 加载嵌入模型 (Embedding Model)
-    logging.info(f"正在加载嵌入模型: {settings.EMBEDDING_MODEL_NAME}")
+def _load_embeddings():
+    """加载用于文档向量化的嵌入模型。"""
+    logging.info(f"正在加载嵌入模型: {settings.EMBEDDING_MODEL_NAME}（{settings.EMBEDDING_BACKEND}后端）")
+    # 与在线查询使用同一个推理后端，保证文档向量和查询向量一致
+    return create_embedding_model()
+
+def _file_sha256(file_path: Path) -> str:
+    """计算文件内容的SHA-256哈希值。"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _manifest_key(file_path, docs_root: Path) -> str:
+    """返回文件相对于知识库根目录的路径，作为清单中的键。"""
+    return Path(file_path).resolve().relative_to(docs_root).as_posix()
+
+def _manifest_entry(file_path: Path, chunk_ids: List[str], sha256: Optional[str] = None) -> Dict:
+    stat = file_path.stat()
+    return {
+        "sha256": sha256 or _file_sha256(file_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "chunk_ids": chunk_ids,
+    }
+
+def load_manifest(store_path: str) -> Dict[str, Dict]:
+    """读取向量数据库目录下的文件清单。如果不存在或无法解析，则返回空字典。"""
+    manifest_path = Path(store_path) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
     try:
-        # 使用HuggingFaceEmbeddings类从本地加载SentenceTransformer模型
-        embeddings = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL_NAME,
-            model_kwargs={'device': 'cpu'} # 如果有GPU，可以改为 'cuda'
-        )
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
     except Exception as e:
-        logging.error(f"加载嵌入模型失败: {e}", exc_info=True)
+        logging.error(f"读取文件清单 {manifest_path} 失败，将按全新索引处理: {e}", exc_info=True)
+        return {}
+
+def save_manifest(store_path: str, files: Dict[str, Dict]):
+    """以原子方式（先写临时文件再替换）将文件清单写入向量数据库目录。"""
+    manifest_path = Path(store_path) / MANIFEST_FILENAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files}, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+# --- 流式灌输流水线 ---
+
+@dataclass
+class _ChunkBatch:
+    """流水线中的一个固定大小的文本块批次。"""
+    chunks: List[Document]
+    ids: List[str]
+    # 最后一个文本块包含在本批次中的文件（清单键, 清单记录）。本批次写入索引后，这些文件即处理完毕。
+    completed_files: List[Tuple[str, Dict]] = field(default_factory=list)
+    vectors: Optional[List[List[float]]] = None
+    # 本批次结束于文件边界，写入索引后应保存检查点
+    checkpoint: bool = False
+
+def _prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    在后台线程中迭代 `iterable`，并通过一个容量为 `maxsize` 的有界队列逐个返回其元素。
+
+    用于连接流水线的相邻阶段：上游阶段最多领先下游 `maxsize` 个元素，
+    既能让解析、向量化和写索引并行进行，又能限制内存中积压的数据量。
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    done = object()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+            _put((done, None))
+        except BaseException as e:
+            _put((None, e))
+
+    threading.Thread(target=_produce, name="ingest-stage", daemon=True).start()
+    try:
+        while True:
+            item, error = q.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _iter_split_files(changed_files: List[Tuple[str, Path, str]]) -> Iterator[Tuple[str, Path, str, List[Document]]]:
+    """流水线第一阶段：逐个解析并分割文件，返回（清单键, 文件路径, 内容哈希, 文本块列表）。"""
+    changed_by_path = {file_path: (key, sha256) for key, file_path, sha256 in changed_files}
+    for file_path, documents in load_files(changed_by_path):
+        if documents is None:
+            # 解析失败的文件不写入清单，下次运行时会重试
+            continue
+        key, sha256 = changed_by_path[file_path]
+        yield key, file_path, sha256, split_documents(documents)
+
+def _iter_chunk_batches(split_files: Iterable, batch_size: int, checkpoint_every: int) -> Iterator[_ChunkBatch]:
+    """
+    流水线第二阶段：将各文件的文本块重新组合成至多 `batch_size` 个文本块的批次，并为每个文本块分配ID。
+
+    每累计 `checkpoint_every` 个批次，就在下一个文件边界处提前结束当前批次并将其标记为检查点，
+    从而保证检查点中的索引只包含完整处理过的文件。
+    """
+    batch = _ChunkBatch(chunks=[], ids=[])
+    batches_since_checkpoint = 0
+    for key, file_path, sha256, chunks in split_files:
+        chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            if len(batch.chunks) >= batch_size:
+                yield batch
+                batches_since_checkpoint += 1
+                batch = _ChunkBatch(chunks=[], ids=[])
+            batch.chunks.append(chunk)
+            batch.ids.append(chunk_id)
+        batch.completed_files.append((key, _manifest_entry(file_path, chunk_ids, sha256=sha256)))
+        if batches_since_checkpoint + 1 >= checkpoint_every:
+            batch.checkpoint = True
+            yield batch
+            batches_since_checkpoint = 0
+            batch = _ChunkBatch(chunks=[], ids=[])
+    if batch.chunks or batch.completed_files:
+        yield batch
+
+def _iter_embedded_batches(batches: Iterable[_ChunkBatch], embeddings) -> Iterator[_ChunkBatch]:
+    """流水线第三阶段：对每个批次的文本块进行向量化。"""
+    for batch in batches:
+        if batch.chunks:
+            batch.vectors = embeddings.embed_documents([chunk.page_content for chunk in batch.chunks])
+        yield batch
+
+class _WorkingStore:
+    """
+    灌输过程中正在构建的向量数据库，位于检查点目录中，格式与发布的版本相同（index.faiss + docstore.sqlite）。
+
+    每个批次的文本块（连同词频）在写入FAISS索引的同时插入SQLite文档库，文本内容不会在内存中累积。
+    保存检查点时只需提交事务，并写出FAISS索引和文件清单；全部完成后再构建关键词倒排索引，
+    整个目录直接重命名为新的版本目录。
+
+    每个文本块在索引中有一个固定的int64 ID（文档库中的 `pos`，从已有的最大ID之后依次分配），
+    删除其他文本块不会改变它的ID，增量更新可以在任何索引类型上原地删除和追加。
+    """
+
+    def __init__(self, path: Path, index=None):
+        self.path = path
+        # 需要训练的索引类型在收集到足够的训练样本之前还没有索引（见 `_IndexWriter`）
+        self.index = index
+        self.conn = open_docstore(path / DOCSTORE_FILENAME)
+        max_id = self.conn.execute("SELECT MAX(pos) FROM chunks").fetchone()[0]
+        self._next_id = 0 if max_id is None else max_id + 1
+
+    @classmethod
+    def create(cls, path: Path) -> "_WorkingStore":
+        """全量重建：从空的文档库开始。"""
+        path.mkdir(parents=True)
+        return cls(path)
+
+    @classmethod
+    def resume(cls, path: Path) -> "_WorkingStore":
+        """从检查点恢复：检查点之后写入（尚未被清单引用）的文本块由 `remove_unreferenced` 移除。"""
+        index_path = path / FAISS_INDEX_FILENAME
+        return cls(path, faiss.read_index(str(index_path)) if index_path.exists() else None)
+
+    @classmethod
+    def copy_of(cls, path: Path, source_path: Path) -> "_WorkingStore":
+        """增量更新：以已发布的版本为起点，复制其文档库（关键词索引在完成时重建）并读入索引。"""
+        path.mkdir(parents=True)
+        shutil.copyfile(source_path / DOCSTORE_FILENAME, path / DOCSTORE_FILENAME)
+        store = cls(path, migrate_to_id_index(faiss.read_index(str(source_path / FAISS_INDEX_FILENAME))))
+        store.conn.execute("DROP TABLE IF EXISTS sparse_terms")
+        store.conn.execute("DROP TABLE IF EXISTS sparse_meta")
+        store.conn.commit()
+        return store
+
+    @property
+    def ntotal(self) -> int:
+        return 0 if self.index is None else self.index.ntotal
+
+    def add(self, batch: _ChunkBatch):
+        """将一个已向量化的批次写入索引和文档库。"""
+        ids = np.arange(self._next_id, self._next_id + len(batch.chunks), dtype=np.int64)
+        self._next_id += len(batch.chunks)
+        self.index.add_with_ids(np.array(batch.vectors, dtype=np.float32), ids)
+        insert_chunks(self.conn, zip(ids.tolist(), batch.ids, batch.chunks))
+
+    def remove_unreferenced(self, referenced_ids) -> int:
+        """从索引和文档库中移除不在 `referenced_ids` 中的文本块，返回移除的数量。"""
+        stale = [pos for pos, chunk_id in self.conn.execute("SELECT pos, id FROM chunks") if chunk_id not in referenced_ids]
+        if stale:
+            self.conn.executemany("DELETE FROM chunks WHERE pos = ?", ((pos,) for pos in stale))
+            if self.index is not None:
+                self.index = remove_vectors(self.index, stale)
+        return len(stale)
+
+    def save(self, manifest: Dict[str, Dict], final: bool = False):
+        """
+        提交文档库并写出FAISS索引和文件清单（最后写入，它的存在表示检查点是完整的）。
+        `final=True` 时先构建关键词倒排索引，目录随后即可作为一个版本发布。
+        """
+        if final:
+            write_sparse_index(self.conn)
+        self.conn.commit()
+        tmp_index = self.path / (FAISS_INDEX_FILENAME + ".tmp")
+        faiss.write_index(self.index, str(tmp_index))
+        os.replace(tmp_index, self.path / FAISS_INDEX_FILENAME)
+        save_manifest(str(self.path), manifest)
+
+    def close(self):
+        self.conn.close()
+
+class _IndexWriter:
+    """
+    将已向量化的批次写入灌输中的向量数据库（`_WorkingStore`）。
+
+    索引在第一次写入时按配置项 VECTOR_INDEX_TYPE 创建。需要训练的索引类型（IVF）会先缓存批次，
+    直到收集到 VECTOR_INDEX_TRAIN_SIZE 个训练样本（或流水线结束）后再训练索引并写入缓存的批次。
+    """
+
+    def __init__(self, store: _WorkingStore):
+        self.store = store
+        self._pending: List[_ChunkBatch] = []
+        self._pending_vectors = 0
+
+    def add(self, batch: _ChunkBatch) -> List[_ChunkBatch]:
+        """写入一个批次，返回本次实际写入索引的批次（可能为空，也可能包含之前缓存的批次）。"""
+        if self.store.index is not None:
+            self._write(batch)
+            return [batch]
+        self._pending.append(batch)
+        self._pending_vectors += len(batch.chunks)
+        required = settings.VECTOR_INDEX_TRAIN_SIZE if index_needs_training() else 1
+        if self._pending_vectors < max(1, required):
+            return []
+        return self._create_and_drain()
+
+    def flush(self) -> List[_ChunkBatch]:
+        """流水线结束时调用，写入所有仍在缓存中的批次。"""
+        if not self._pending:
+            return []
+        if self.store.index is None and self._pending_vectors == 0:
+            # 没有任何向量（例如所有文件都是空文件），无需创建索引
+            drained, self._pending = self._pending, []
+            return drained
+        return self._create_and_drain()
+
+    def _create_and_drain(self) -> List[_ChunkBatch]:
+        if self.store.index is None:
+            train_vectors = np.array([v for batch in self._pending if batch.chunks for v in batch.vectors], dtype=np.float32)
+            self.store.index = build_id_index(train_vectors.shape[1], train_vectors)
+        drained, self._pending, self._pending_vectors = self._pending, [], 0
+        for batch in drained:
+            self._write(batch)
+        return drained
+
+    def _write(self, batch: _ChunkBatch):
+        if batch.chunks:
+            self.store.add(batch)
+
+# --- 检查点 ---
+
+def _checkpoint_dir(store_path: str) -> Path:
+    return Path(store_path) / CHECKPOINT_DIRNAME
+
+def _has_checkpoint(store_path: str) -> bool:
+    # 清单文件最后写入，它的存在表示检查点是完整的
+    return (_checkpoint_dir(store_path) / MANIFEST_FILENAME).exists()
+
+def _remove_checkpoint(store_path: str):
+    checkpoint_dir = _checkpoint_dir(store_path)
+    for path in (checkpoint_dir, checkpoint_dir.with_name(CHECKPOINT_DIRNAME + ".tmp"), checkpoint_dir.with_name(CHECKPOINT_DIRNAME + ".old")):
+        shutil.rmtree(path, ignore_errors=True)
+
+# --- 构建与更新 ---
+
+def _plan_changes(docs_path: str, manifest: Dict[str, Dict]):
+    """
+    对比文件清单和知识库目录，找出需要重新处理的文件。
+
+    - 修改时间和大小都未变化的文件直接跳过；变化的文件再比较内容哈希，内容相同则只更新清单。
+    - 新增或内容已修改的文件需要重新解析、分割和向量化。
+
+    Returns:
+        Tuple: （未变化文件的新清单, 需要处理的文件列表[(清单键, 文件路径, 内容哈希)], 已删除文件的清单键列表）
+    """
+    docs_root = Path(docs_path).resolve()
+    unchanged: Dict[str, Dict] = {}
+    changed_files = []
+    current_keys = set()
+    for file_path in iter_document_files(docs_path):
+        key = _manifest_key(file_path, docs_root)
+        current_keys.add(key)
+        entry = manifest.get(key)
+        stat = file_path.stat()
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            unchanged[key] = entry
+            continue
+        sha256 = _file_sha256(file_path)
+        if entry and entry["sha256"] == sha256:
+            unchanged[key] = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            continue
+        changed_files.append((key, file_path, sha256))
+    removed_keys = [key for key in manifest if key not in current_keys]
+    return unchanged, changed_files, removed_keys
+
+def create_vector_store(docs_path: str, incremental: bool = False, resume: bool = True):
+    """
+    从知识库目录创建（或更新）FAISS向量数据库，并将其保存到磁盘。
+
+    这个函数执行了RAG流程中的“Indexing”（索引）部分的关键步骤，各步骤组成一条流式流水线：
+    1.  文档解析与文本分割 (Loading & Splitting)：逐个文件进行，不会把整个语料库读入内存。
+    2.  向量化 (Embedding)：文本块被重新组合成固定大小的批次后逐批向量化。
+    3.  存储与索引 (Storing & Indexing)：每个批次向量化后立即写入索引，文本块写入磁盘上的SQLite文档库。
+    相邻阶段之间通过有界队列连接。内存中只保留FAISS索引本身，文本块的内容不会随语料库的增大而在内存中累积。
+
+    流水线会定期保存检查点：提交文档库，并写出FAISS索引和已完成文件的清单（不重写已保存的文本块）。
+    中断后再次运行时，会从最近的检查点恢复，只处理尚未完成的文件。
+
+    结果保存为一个新的版本目录，全部写完后才更新 CURRENT 指针，运行中的服务会在后台热加载新版本；
+    只保留最新的 VECTOR_STORE_KEEP_VERSIONS 个版本。
+
+    Args:
+        docs_path (str): 包含文档的目录路径。
+        incremental (bool): 为True时在现有向量数据库的基础上增量更新，只处理新增、修改或删除的文件；
+            为False时全量重建。
+        resume (bool): 为True时，如果存在未完成的检查点，则从检查点恢复。
+    """
+    if not Path(docs_path).is_dir():
+        logging.error(f"路径 {docs_path} 不是一个有效的目录。")
+        return
+
+    store_path = settings.VECTOR_STORE_PATH
+    Path(store_path).mkdir(parents=True, exist_ok=True)
+    # 增量更新以当前发布的版本为起点（旧的目录结构下即根目录）
+    _, current_path = resolve_store_version(store_path)
+    checkpoint_dir = _checkpoint_dir(store_path)
+    resuming = resume and _has_checkpoint(store_path)
+    from_store = False
+
+    # 1. 确定起始状态：检查点、现有版本（增量模式）或空的向量数据库（全量重建）
+    if resuming:
+        logging.info("发现未完成的灌输检查点，将从检查点恢复...")
+        manifest = load_manifest(str(checkpoint_dir))
+    else:
+        _remove_checkpoint(store_path)
+        from_store = incremental and (current_path / FAISS_INDEX_FILENAME).exists()
+        if from_store and not (current_path / DOCSTORE_FILENAME).exists():
+            logging.warning("现有向量数据库是旧的pickle格式，不支持增量更新，将全量重建一次。")
+            from_store = False
+        manifest = load_manifest(str(current_path)) if from_store else {}
+
+    # 2. 对比清单，找出需要处理的文件
+    new_manifest, changed_files, removed_keys = _plan_changes(docs_path, manifest)
+    logging.info(
+        f"{len(changed_files)} 个文件需要处理，{len(removed_keys)} 个文件已删除，"
+        f"{len(new_manifest)} 个文件未变化。"
+    )
+    if from_store and not changed_files and not removed_keys:
+        if new_manifest != manifest:
+            save_manifest(str(current_path), new_manifest)
+        logging.info("知识库没有变化，无需更新向量数据库。")
         return
 
-    # 3. 从文本块创建FAISS向量数据库
-    logging.info("正在从文本块创建FAISS向量数据库...")
+    # 3. 加载嵌入模型，打开灌输中的向量数据库，并移除不再被清单引用的文本块
+    #    （已删除或已修改文件的旧文本块，以及检查点之后写入的未完成文件的文本块）
     try:
-        vector_store = FAISS.from_documents(chunks, embeddings)
+        embeddings = _load_embeddings()
     except Exception as e:
-        logging.error(f"创建FAISS向量数据库失败: {e}", exc_info=True)
+        logging.error(f"加载嵌入模型失败: {e}", exc_info=True)
         return
+    if resuming:
+        working = _WorkingStore.resume(checkpoint_dir)
+    elif from_store:
+        working = _WorkingStore.copy_of(checkpoint_dir, current_path)
+    else:
+        working = _WorkingStore.create(checkpoint_dir)
+    referenced_ids = {chunk_id for entry in new_manifest.values() for chunk_id in entry["chunk_ids"]}
+    removed = working.remove_unreferenced(referenced_ids)
+    if removed:
+        logging.info(f"已从索引中移除 {removed} 个过期的文本块。")
+
+    # 4. 运行流水线：解析分割 -> 组批 -> 向量化 -> 写入索引和文档库，并定期保存检查点
+    queue_size = settings.INGEST_QUEUE_SIZE
+    split_files = _prefetch(_iter_split_files(changed_files), queue_size)
+    batches = _prefetch(
+        _iter_chunk_batches(split_files, settings.INGEST_BATCH_SIZE, settings.INGEST_CHECKPOINT_EVERY),
+        queue_size,
+    )
+    embedded_batches = _prefetch(_iter_embedded_batches(batches, embeddings), queue_size)
+
+    writer = _IndexWriter(working)
+    total_chunks = 0
+
+    def _on_written(written: List[_ChunkBatch]):
+        nonlocal total_chunks
+        for batch in written:
+            new_manifest.update(batch.completed_files)
+            total_chunks += len(batch.chunks)
+            if batch.checkpoint and working.index is not None:
+                working.save(new_manifest)
+                logging.info(f"已保存检查点：{len(new_manifest)} 个文件，{working.ntotal} 个文本块。")
 
-    # 4. 将向量数据库保存到本地磁盘
-    logging.info(f"正在将向量数据库保存到: {settings.VECTOR_STORE_PATH}")
     try:
-        vector_store.save_local(settings.VECTOR_STORE_PATH)
-        logging.info("向量数据库已成功创建并保存。")
-    except Exception as e:
+        for batch in embedded_batches:
+            _on_written(writer.add(batch))
+        _on_written(writer.flush())
+        logging.info(f"已向量化并写入 {total_chunks} 个新文本块。")
+
+        if working.index is None:
+            logging.warning("没有可写入向量数据库的文本块。")
+            working.close()
+            _remove_checkpoint(store_path)
+            return
+
+        # 5. 构建关键词索引并保存，将检查点目录重命名为一个新版本，发布该版本
+        working.save(new_manifest, final=True)
+    finally:
+        working.close()
+    version, version_path = create_store_version(store_path)
+    logging.info(f"正在将向量数据库保存到: {version_path}")
+    try:
+        os.replace(checkpoint_dir, version_path)
+    except OSError as e:
         logging.error(f"保存向量数据库失败: {e}", exc_info=True)
+        shutil.rmtree(version_path, ignore_errors=True)
+        return
+    publish_store_version(store_path, version)
+    _remove_checkpoint(store_path)
+    removed_versions = prune_store_versions(store_path, keep=settings.VECTOR_STORE_KEEP_VERSIONS)
+    if removed_versions:
+        logging.info(f"已删除旧版本: {', '.join(removed_versions)}")
+    logging.info(f"向量数据库版本 {version} 已成功创建并发布。")
+
+def update_vector_store(docs_path: str):
+    """
+    根据文件清单增量更新FAISS向量数据库。
+
+    只有新增或内容已修改的文件才会被重新解析、分割和向量化；
+    已删除或已修改文件的旧文本块会从FAISS索引和文档库中移除。
+    如果没有任何文件变化，则不会加载嵌入模型和索引，可以在数秒内完成。
+
+    Args:
+        docs_path (str): 包含文档的目录路径。
+    """
+    create_vector_store(docs_path, incremental=True)
@@ -15,4 +15,4 @@ class StreamingChatResponse(BaseModel):
     """
     type: str = Field(..., description="数据块的类型，例如 'stream', 'sources', 'end', 'error'")
     data: Optional[str] = Field(None, description="当type为'stream'时，这里是具体的token。当type为'error'时，这里是错误信息。")
-    sources: Optional[List[Dict[str, Any]]] = Field(None, description="当type为'sources'时，这里是溯源文档列表。")
+    sources: Optional[List[Dict[str, Any]]] = Field(None, description="当type为'sources'时，这里是溯源文档引用列表（chunk_id和metadata，原文可通过 /chunks/{chunk_id} 获取）。")
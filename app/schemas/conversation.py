@@ -21,11 +21,12 @@ class Conversation(BaseModel):
 class ConversationSnippet(BaseModel):
     """
     代表一个会话的摘要信息，用于会话列表的API响应。
-    它只包含ID、创建时间和由第一条消息生成的标题，用于前端的快速预览。
+    它只包含ID、创建时间、由第一条消息生成的标题和消息数，用于前端的快速预览。
     """
     id: int
     created_at: datetime.datetime
     title: str = Field(description="会话标题，通常是第一条用户消息的摘要。")
+    message_count: int = Field(0, description="会话中的消息数。")
 
     class Config:
         """
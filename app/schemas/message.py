@@ -11,7 +11,10 @@ class Message(BaseModel):
     content: str
     message_type: str = Field(..., description="消息类型，例如 'user' 或 'ai'")
     created_at: datetime.datetime
-    source_documents: Optional[List[Dict[str, Any]]] = Field(None, description="AI消息的溯源文档列表")
+    source_documents: Optional[List[Dict[str, Any]]] = Field(
+        None,
+        description="AI消息的溯源文档引用列表（chunk_id和metadata）。请求时指定expand_sources=true才会附带原文page_content。"
+    )
 
     class Config:
         """
@@ -20,3 +23,11 @@ class Message(BaseModel):
         实现数据对象和API模型之间的自动映射。
         """
         orm_mode = True
+
+class SourceChunk(BaseModel):
+    """
+    代表知识库中单个文本块的Pydantic模型，用于按ID查看溯源文档的原文。
+    """
+    chunk_id: str
+    page_content: str = Field(..., description="文本块的原文")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="文本块的元数据，例如来源文件")
@@ -0,0 +1,245 @@
+"""
+基准测试共用的模拟组件：确定性的哈希嵌入模型、模拟vLLM（OpenAI兼容）流式接口的HTTP传输层，
+以及合成知识库。基准测试不需要GPU、模型文件或网络。
+
+注意：`prepare_environment` 必须在导入任何 `app` 模块之前调用，配置项在导入时读取。
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import importlib.util
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# 模拟的答案token：中英文混合，长度与Qwen的常见token相近
+SAMPLE_TOKENS = ["根据", "公司", "的", "报销", "政策", "，", "员工", "需要", "在", "30", "天", "内",
+                 "提交", "发票", "。", " The", " form", " PL", "-", "2023", "-", "0042", "\n"]
+
+# 合成知识库的主题和句式
+_TOPICS = ["报销", "差旅", "请假", "保险", "采购", "报修", "入职", "培训", "考勤", "福利"]
+_SENTENCES = [
+    "员工申请{topic}时，应在{days}个工作日内通过OA系统提交表单{code}。",
+    "{topic}相关费用超过{amount}元的，需要部门负责人和财务部共同审批。",
+    "如对{topic}流程有疑问，可联系人力资源部，分机号{ext}。",
+    "自{year}年起，{topic}的审批时限缩短为{days}天，逾期未处理的申请将自动提醒。",
+    "The {topic} policy applies to all full-time employees; see form {code} for details.",
+    "{topic}材料需加盖部门公章，电子版与纸质版须保持一致，编号为{code}。",
+]
+
+_WORD_RE = re.compile(r"[a-z0-9]+|[一-鿿]")
+
+
+def prepare_environment(workdir: str, overrides: Optional[Dict[str, str]] = None):
+    """
+    将数据库、知识库和向量数据库指向 `workdir` 下的临时目录，并使用模拟的模型名称和vLLM地址，
+    基准测试不会读写真实的数据。`overrides` 中的配置项（例如 LLM_MAX_CONCURRENCY）优先。
+    """
+    workdir = Path(workdir)
+    env = {
+        "DATABASE_URL": f"sqlite:///{workdir / 'benchmark.db'}",
+        "DOCS_PATH": str(workdir / "docs"),
+        "VECTOR_STORE_PATH": str(workdir / "vector_store"),
+        "EMBEDDING_MODEL_NAME": "fake-hash-embeddings",
+        "LLM_MODEL_NAME": "fake-llm",
+        "VLLM_API_BASE": "http://fake-vllm/v1",
+        "VLLM_API_KEY": "EMPTY",
+        # 基准测试在当前进程内完成检索，不使用检索服务进程，也不做定期热加载
+        "RETRIEVAL_SIDECAR_SOCKET": "",
+        "VECTOR_STORE_RELOAD_INTERVAL_SECONDS": "0",
+        "RERANK_ENABLED": "false",
+        "WARMUP_LLM_PING": "false",
+        # 串行解析文件（不使用进程池），`use_plain_text_loader_if_needed` 替换的加载器才会生效
+        "LOADER_MAX_WORKERS": "1",
+        "LOADER_FILE_TIMEOUT": "0",
+    }
+    env.update(overrides or {})
+    os.environ.update(env)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    确定性的哈希嵌入模型：把英文单词和汉字散列到固定维度的向量上（特征哈希）并做L2归一化。
+
+    含有相同字词的文本向量相近，检索结果有意义且每次运行都相同。
+    `latency_ms` 模拟模型每次调用（一个批次）的耗时。
+    """
+
+    def __init__(self, dimension: int = 384, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in _WORD_RE.findall(text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        return [self._embed(text) for text in texts]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+
+class FakeOpenAIServer:
+    """
+    模拟vLLM的OpenAI兼容接口 `/v1/chat/completions` 的HTTP传输层。
+
+    流式请求先等待 `ttft_ms` 毫秒再输出第一个token，之后每隔 `interval_ms` 毫秒输出一个，
+    共 `n_tokens` 个；输出内容由请求的消息确定。通过 `http_clients` 创建的客户端替换
+    RAG链的vLLM连接池后，请求会经过真实的 `AdmissionControlledChatOpenAI`（准入控制、流式解析）。
+    """
+
+    def __init__(self, ttft_ms: float = 50.0, n_tokens: int = 128, interval_ms: float = 10.0):
+        self.ttft_ms = ttft_ms
+        self.n_tokens = n_tokens
+        self.interval_ms = interval_ms
+        self.requests = 0
+
+    def _tokens(self, body: Dict) -> List[str]:
+        digest = hashlib.md5(json.dumps(body.get("messages"), ensure_ascii=False).encode("utf-8")).digest()
+        offset = digest[0] % len(SAMPLE_TOKENS)
+        return [SAMPLE_TOKENS[(offset + i) % len(SAMPLE_TOKENS)] for i in range(self.n_tokens)]
+
+    def _chunk(self, body: Dict, delta: Dict, finish_reason: Optional[str] = None) -> bytes:
+        chunk = {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-llm"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+    def _completion(self, body: Dict, tokens: List[str]) -> Dict:
+        return {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-llm"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        }
+
+    async def _astream(self, body: Dict, tokens: List[str]):
+        await asyncio.sleep(self.ttft_ms / 1000.0)
+        yield self._chunk(body, {"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            if i > 0 and self.interval_ms > 0:
+                await asyncio.sleep(self.interval_ms / 1000.0)
+            yield self._chunk(body, {"content": token})
+        yield self._chunk(body, {}, finish_reason="stop")
+        yield b"data: [DONE]\n\n"
+
+    async def handle_async(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        body = json.loads(request.content or b"{}")
+        tokens = self._tokens(body)
+        if body.get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=self._astream(body, tokens))
+        await asyncio.sleep((self.ttft_ms + self.interval_ms * max(0, len(tokens) - 1)) / 1000.0)
+        return httpx.Response(200, json=self._completion(body, tokens))
+
+    def handle_sync(self, request: httpx.Request) -> httpx.Response:
+        """同步调用（例如启动预热的探测请求）不模拟延迟，一次性返回完整结果。"""
+        self.requests += 1
+        body = json.loads(request.content or b"{}")
+        tokens = self._tokens(body)
+        if body.get("stream"):
+            content = b"".join(
+                [self._chunk(body, {"content": token}) for token in tokens]
+                + [self._chunk(body, {}, finish_reason="stop"), b"data: [DONE]\n\n"]
+            )
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=content)
+        return httpx.Response(200, json=self._completion(body, tokens))
+
+    def http_clients(self) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """返回发往本模拟服务的同步和异步HTTP客户端，可直接替换 `chain._llm_http_clients`。"""
+        return (
+            httpx.Client(transport=httpx.MockTransport(self.handle_sync)),
+            httpx.AsyncClient(transport=httpx.MockTransport(self.handle_async)),
+        )
+
+
+def _paragraph(rng: random.Random, topic: str) -> str:
+    sentences = []
+    for template in rng.sample(_SENTENCES, k=4):
+        sentences.append(template.format(
+            topic=topic,
+            days=rng.choice([3, 5, 7, 10, 15, 30]),
+            amount=rng.choice([500, 1000, 2000, 5000, 10000]),
+            code=f"{topic[:1]}{rng.choice('ABCDEFGH')}-{rng.randint(2018, 2024)}-{rng.randint(1, 9999):04d}",
+            ext=rng.randint(1000, 9999),
+            year=rng.randint(2018, 2024),
+        ))
+    return "".join(sentences)
+
+
+def sample_queries(n: int, seed: int = 1) -> List[str]:
+    """生成 `n` 个与合成知识库同主题的查询（部分含表单编号，可以测试关键词检索）。"""
+    rng = random.Random(seed)
+    return [_paragraph(rng, rng.choice(_TOPICS)).split("。")[0] for _ in range(n)]
+
+
+def write_corpus(docs_dir: str, n_files: int = 200, paragraphs_per_file: int = 12, seed: int = 0) -> int:
+    """
+    在 `docs_dir` 下生成 `n_files` 个合成的制度文档（.txt），每个文件约 `paragraphs_per_file` 段。
+
+    Returns:
+        int: 生成的总字符数。
+    """
+    rng = random.Random(seed)
+    Path(docs_dir).mkdir(parents=True, exist_ok=True)
+    total = 0
+    for i in range(n_files):
+        topic = _TOPICS[i % len(_TOPICS)]
+        paragraphs = [f"{topic}管理办法（第{i + 1}号）"]
+        paragraphs += [_paragraph(rng, topic) for _ in range(paragraphs_per_file)]
+        text = "\n\n".join(paragraphs)
+        (Path(docs_dir) / f"policy_{i:05d}.txt").write_text(text, encoding="utf-8")
+        total += len(text)
+    return total
+
+
+def use_plain_text_loader_if_needed() -> bool:
+    """
+    没有安装 `unstructured` 时，把 .txt 文件的加载器换成不依赖它的 `TextLoader`，
+    使合成知识库仍能通过 `load_documents` 和灌输流水线加载。返回是否做了替换。
+    """
+    if importlib.util.find_spec("unstructured") is not None:
+        return False
+    from langchain_community.document_loaders import TextLoader
+    from app.rag import loader
+
+    loader.LOADER_MAPPING[".txt"] = (TextLoader, {"encoding": "utf-8"})
+    return True
+
+
+def build_knowledge_base(docs_dir: str, embeddings: Embeddings):
+    """用 `embeddings` 运行真实的灌输流水线（`create_vector_store`），在 VECTOR_STORE_PATH 下发布一个版本。"""
+    from app.rag import vector_store
+
+    vector_store._load_embeddings = lambda: embeddings
+    vector_store.create_vector_store(docs_dir)
@@ -0,0 +1,126 @@
+import sys
+import os
+import time
+import logging
+import argparse
+
+import faiss
+import numpy as np
+
+# 将项目根目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.core.config import settings
+from app.rag.index import apply_search_params, build_faiss_index
+from app.rag.store import resolve_store_version
+
+# 配置日志：只输出警告和错误，避免干扰结果表格
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger().setLevel(logging.WARNING)
+
+# 要比较的索引配置：(索引类型, 查询时参数)
+BENCHMARK_CONFIGS = [
+    ("flat", {}),
+    ("ivf_flat", {"nprobe": 1}),
+    ("ivf_flat", {"nprobe": 8}),
+    ("ivf_flat", {"nprobe": 16}),
+    ("ivf_flat", {"nprobe": 64}),
+    ("ivf_pq", {"nprobe": 8}),
+    ("ivf_pq", {"nprobe": 16}),
+    ("ivf_pq", {"nprobe": 64}),
+    ("hnsw", {"ef_search": 32}),
+    ("hnsw", {"ef_search": 64}),
+    ("hnsw", {"ef_search": 128}),
+    ("hnsw", {"ef_search": 256}),
+]
+
+
+def load_vectors_from_store(store_path: str) -> np.ndarray:
+    """从现有的FAISS向量数据库中读取所有向量（要求索引支持重建向量，如Flat或HNSW）。"""
+    index = faiss.read_index(os.path.join(store_path, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def make_synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """生成带聚类结构的随机向量，用于在没有真实向量数据库时进行基准测试。"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 100), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), size=n)
+    return centers[assignments] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    """从数据向量中随机抽样并加入噪声作为查询向量。"""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    scale = float(np.std(vectors)) * 0.1
+    return (picked + scale * rng.normal(size=picked.shape)).astype(np.float32)
+
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int):
+    """依次构建每种配置的索引，报告recall@k、查询延迟和内存占用。"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(2)
+    train_size = min(len(vectors), settings.VECTOR_INDEX_TRAIN_SIZE)
+    train_vectors = vectors[rng.choice(len(vectors), size=train_size, replace=False)]
+
+    # 以Flat索引的精确检索结果作为基准
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    print(f"向量数: {len(vectors)}, 维度: {dim}, 查询数: {len(queries)}, k={k}")
+    header = f"{'索引类型':<10} {'查询参数':<16} {'recall@k':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'内存(MB)':>9} {'构建(s)':>8}"
+    print(header)
+    print("-" * len(header))
+
+    built = {}
+    for index_type, params in BENCHMARK_CONFIGS:
+        if index_type not in built:
+            start = time.perf_counter()
+            index = build_faiss_index(dim, train_vectors, index_type=index_type)
+            index.add(vectors)
+            built[index_type] = (index, time.perf_counter() - start, len(faiss.serialize_index(index)))
+        index, build_seconds, size_bytes = built[index_type]
+        apply_search_params(index, nprobe=params.get("nprobe"), ef_search=params.get("ef_search"))
+
+        # 逐条查询，模拟在线服务时单个请求的延迟
+        latencies = []
+        results = np.empty((len(queries), k), dtype=np.int64)
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results[i] = ids[0]
+
+        recall = np.mean([len(set(results[i]) & set(ground_truth[i])) / k for i in range(len(queries))])
+        param_str = ",".join(f"{name}={value}" for name, value in params.items()) or "-"
+        print(
+            f"{index_type:<10} {param_str:<16} {recall:>9.4f} {np.percentile(latencies, 50):>9.3f} "
+            f"{np.percentile(latencies, 95):>9.3f} {size_bytes / 1024 / 1024:>9.1f} {build_seconds:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较不同FAISS索引类型的召回率、查询延迟和内存占用。")
+    parser.add_argument("--synthetic", type=int, default=0, help="使用指定数量的合成向量，而不是读取现有的向量数据库。")
+    parser.add_argument("--dim", type=int, default=768, help="合成向量的维度。")
+    parser.add_argument("--queries", type=int, default=1000, help="查询数量。")
+    parser.add_argument("--k", type=int, default=4, help="每次查询返回的结果数。")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = make_synthetic_vectors(args.synthetic, args.dim)
+    else:
+        _, store_path = resolve_store_version(settings.VECTOR_STORE_PATH)
+        vectors = load_vectors_from_store(str(store_path))
+    queries = make_queries(vectors, args.queries)
+    run_benchmark(vectors, queries, args.k)
+
+
+if __name__ == "__main__":
+    # 在项目根目录下执行 `python scripts/benchmark_index.py`，默认读取VECTOR_STORE_PATH中的向量；
+    # 或执行 `python scripts/benchmark_index.py --synthetic 1000000` 使用合成数据。
+    main()
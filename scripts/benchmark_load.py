@@ -0,0 +1,270 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# 将项目根目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import benchmark_fakes
+
+# 配置日志：只输出警告和错误，避免干扰结果表格
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger().setLevel(logging.WARNING)
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_questions.jsonl")
+
+
+def load_questions(path: str) -> List[List[str]]:
+    """
+    读取JSONL问题集，按会话分组。每行包含 `question`，可选的 `session` 相同的问题按顺序
+    组成一个多轮会话（在同一个会话中依次提问）；没有 `session` 的问题各自是一个单轮会话。
+    """
+    sessions: Dict[str, List[str]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            session = item.get("session") or f"__line_{line_no}"
+            sessions.setdefault(str(session), []).append(item["question"])
+    return list(sessions.values())
+
+
+async def call_asgi(app, method: str, path: str, body: Optional[Dict] = None, on_body=None) -> int:
+    """
+    在当前进程内直接调用ASGI应用（不经过网络和HTTP服务器），返回响应状态码。
+
+    每收到一段响应体就调用一次 `on_body(bytes)`，调用方可以逐帧记录到达时间；
+    httpx的ASGITransport会把整个响应缓冲后才返回，无法测量首token延迟。
+    """
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode("ascii"))],
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # 响应发送完毕之前客户端不断开
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if on_body is not None and message.get("body"):
+                on_body(message["body"])
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+class ChatRecorder:
+    """解析一次流式聊天响应的SSE事件，记录首token时间、结束时间和错误。"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._buffer = b""
+
+    def on_body(self, data: bytes):
+        self._buffer += data
+        while b"\n\n" in self._buffer:
+            frame, self._buffer = self._buffer.split(b"\n\n", 1)
+            if not frame.startswith(b"data: "):
+                continue
+            event = json.loads(frame[len(b"data: "):])
+            now = time.perf_counter()
+            if event.get("type") == "stream" and self.first_token_at is None:
+                self.first_token_at = now
+            elif event.get("type") == "error":
+                self.error = event.get("data")
+            elif event.get("type") == "end":
+                self.finished_at = now
+
+
+async def chat_once(app, question: str, conversation_id: Optional[int]) -> Dict[str, Any]:
+    recorder = ChatRecorder()
+    status = await call_asgi(
+        app, "POST", "/api/chat/stream",
+        {"question": question, "conversation_id": conversation_id},
+        on_body=recorder.on_body,
+    )
+    ok = status == 200 and recorder.error is None and recorder.finished_at is not None
+    return {
+        "status": status,
+        "ok": ok,
+        "error": recorder.error,
+        "ttft": recorder.first_token_at - recorder.started_at if ok and recorder.first_token_at else None,
+        "latency": recorder.finished_at - recorder.started_at if ok else None,
+    }
+
+
+async def run_session(app, questions: List[str], semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    """依次发送一个会话中的所有问题。多轮会话先创建会话，后续问题带上聊天历史。"""
+    async with semaphore:
+        conversation_id = None
+        if len(questions) > 1:
+            body = bytearray()
+            await call_asgi(app, "POST", "/api/conversations/", on_body=body.extend)
+            conversation_id = json.loads(bytes(body))["id"]
+        return [await chat_once(app, question, conversation_id) for question in questions]
+
+
+def _percentiles(values: List[float]) -> str:
+    if not values:
+        return "-"
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return f"p50={p50:.0f}ms  p95={p95:.0f}ms  p99={p99:.0f}ms"
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_benchmark(app, sessions: List[List[str]], concurrency: int, ready_timeout: float):
+    from app.core.timing import CHAT_STAGES, CHAT_STAGE_LATENCY, CHAT_TOKENS_STREAMED
+    from app.rag.chain import is_ready
+
+    await app.router.startup()
+    try:
+        deadline = time.perf_counter() + ready_timeout
+        while not is_ready():
+            if time.perf_counter() > deadline:
+                raise RuntimeError("RAG链预热超时，请检查日志。")
+            await asyncio.sleep(0.05)
+
+        stages_before = {name: CHAT_STAGE_LATENCY[name].snapshot() for name in CHAT_STAGES}
+        tokens_before = CHAT_TOKENS_STREAMED.value
+        semaphore = asyncio.Semaphore(concurrency)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_session(app, questions, semaphore) for questions in sessions))
+        wall = time.perf_counter() - start
+        tokens = CHAT_TOKENS_STREAMED.value - tokens_before
+        stages_after = {name: CHAT_STAGE_LATENCY[name].snapshot() for name in CHAT_STAGES}
+    finally:
+        await app.router.shutdown()
+
+    results = [r for session in results for r in session]
+    succeeded = [r for r in results if r["ok"]]
+    rejected = [r for r in results if r["status"] == 429]
+    failed = [r for r in results if not r["ok"] and r["status"] != 429]
+
+    print(f"请求数: {len(results)}  成功: {len(succeeded)}  429拒绝: {len(rejected)}  失败: {len(failed)}  "
+          f"总耗时: {wall:.2f}s")
+    print(f"{'首token延迟(TTFT)':<18} {_percentiles([r['ttft'] for r in succeeded])}")
+    print(f"{'完整响应延迟':<18} {_percentiles([r['latency'] for r in succeeded])}")
+    print(f"{'吞吐量':<18} {len(succeeded) / wall:.2f} 请求/s  {tokens / wall:.1f} token/s")
+    print(f"{'进程峰值RSS':<18} {_peak_rss_mb():.1f} MB")
+    if failed:
+        print(f"失败示例: status={failed[0]['status']} error={failed[0]['error']}")
+
+    print()
+    header = f"{'阶段':<18} {'次数':>6} {'平均(ms)':>10}"
+    print(header)
+    print("-" * len(header))
+    for name in CHAT_STAGES:
+        count = stages_after[name]["count"] - stages_before[name]["count"]
+        total = stages_after[name]["sum"] - stages_before[name]["sum"]
+        if count:
+            print(f"{name:<18} {count:>6} {total / count * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="在进程内启动FastAPI应用（模拟的vLLM和嵌入模型，无需GPU和网络），"
+                    "按给定并发重放问题集，统计首token延迟、吞吐量和峰值内存。"
+    )
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="JSONL问题集（每行包含question，可选session）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时进行的会话数")
+    parser.add_argument("--repeat", type=int, default=5, help="重放问题集的次数")
+    parser.add_argument("--docs", type=int, default=200, help="合成知识库的文件数")
+    parser.add_argument("--embedding-dim", type=int, default=384, help="模拟嵌入模型的向量维度")
+    parser.add_argument("--embedding-latency-ms", type=float, default=5.0, help="模拟嵌入模型每个批次的耗时（毫秒）")
+    parser.add_argument("--llm-ttft-ms", type=float, default=50.0, help="模拟大模型的首token延迟（毫秒）")
+    parser.add_argument("--llm-tokens", type=int, default=128, help="模拟大模型每次输出的token数")
+    parser.add_argument("--llm-interval-ms", type=float, default=10.0, help="模拟大模型相邻token的间隔（毫秒）")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="启用语义缓存（默认关闭，否则重放的重复问题会直接命中缓存）")
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="等待RAG链预热完成的最长时间（秒）")
+    parser.add_argument("--workdir", help="存放临时数据库和向量数据库的目录，默认新建一个临时目录")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-benchmark-")
+    benchmark_fakes.prepare_environment(workdir, {
+        "SEMANTIC_CACHE_ENABLED": "true" if args.semantic_cache else "false",
+    })
+
+    # 配置项在导入时读取，必须在设置环境变量之后导入应用
+    from app.core.config import settings
+    from app.main import app
+    from app.rag import chain
+    from app.rag.embeddings import BatchingEmbeddings
+
+    if benchmark_fakes.use_plain_text_loader_if_needed():
+        print("未安装unstructured，合成知识库改用TextLoader加载。")
+    if not Path(settings.VECTOR_STORE_PATH, "CURRENT").exists():
+        start = time.perf_counter()
+        chars = benchmark_fakes.write_corpus(settings.DOCS_PATH, n_files=args.docs)
+        benchmark_fakes.build_knowledge_base(settings.DOCS_PATH, benchmark_fakes.HashEmbeddings(args.embedding_dim))
+        print(f"已生成并灌输合成知识库: {args.docs} 个文件，{chars} 字符，耗时 {time.perf_counter() - start:.2f}s")
+
+    # 替换vLLM连接池和嵌入模型，其余部分（准入控制、批处理、检索、持久化）都是真实的实现
+    server = benchmark_fakes.FakeOpenAIServer(args.llm_ttft_ms, args.llm_tokens, args.llm_interval_ms)
+    chain._llm_http_clients = server.http_clients()
+    chain.get_embeddings = lambda: BatchingEmbeddings(
+        benchmark_fakes.HashEmbeddings(args.embedding_dim, args.embedding_latency_ms),
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+        cache_size=settings.EMBEDDING_QUERY_CACHE_SIZE,
+    )
+
+    sessions = load_questions(args.questions) * args.repeat
+    n_questions = sum(len(questions) for questions in sessions)
+    print(f"工作目录: {workdir}")
+    print(f"会话数: {len(sessions)}, 问题数: {n_questions}, 并发: {args.concurrency}, "
+          f"模拟大模型: TTFT {args.llm_ttft_ms:g}ms / {args.llm_tokens} token / 间隔 {args.llm_interval_ms:g}ms, "
+          f"语义缓存: {'开启' if args.semantic_cache else '关闭'}")
+    print()
+    asyncio.run(run_benchmark(app, sessions, args.concurrency, args.ready_timeout))
+
+
+if __name__ == "__main__":
+    main()
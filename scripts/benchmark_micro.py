@@ -0,0 +1,169 @@
+import sys
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Callable, List
+
+# 将项目根目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import benchmark_fakes
+
+# 配置日志：只输出警告和错误，避免干扰结果表格
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger().setLevel(logging.WARNING)
+
+BENCHMARKS = ("load", "split", "ingest", "search", "crud")
+
+
+def _print_row(name: str, n: int, seconds: float, unit: str):
+    per_op = seconds / n * 1000 if n else 0.0
+    rate = n / seconds if seconds > 0 else 0.0
+    print(f"{name:<30} {n:>8} {seconds:>10.3f} {per_op:>12.3f} {rate:>12.1f} {unit}/s")
+
+
+def _timed(func: Callable, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_search(args, queries: List[str], embeddings):
+    """向量检索、BM25检索和混合检索（含读取文本块）的单次查询耗时。"""
+    from app.core.config import settings
+    from app.rag.index import apply_search_params
+    from app.rag.retrieval import HybridRetriever
+    from app.rag.store import load_sparse_index, load_vector_store, resolve_store_version
+
+    _, path = resolve_store_version(settings.VECTOR_STORE_PATH)
+    vector_store = load_vector_store(str(path), embeddings, mmap=True)
+    apply_search_params(vector_store.index)
+    sparse_index = load_sparse_index(str(path))
+    hybrid = HybridRetriever(vector_store, sparse_index, k=settings.RETRIEVAL_TOP_K,
+                             fetch_k=settings.HYBRID_SEARCH_FETCH_K, rrf_k=settings.HYBRID_SEARCH_RRF_K)
+    dense_only = HybridRetriever(vector_store, None, k=settings.RETRIEVAL_TOP_K)
+    vectors = embeddings.embed_documents(queries)
+
+    def _run(func):
+        start = time.perf_counter()
+        for _ in range(args.search_rounds):
+            for query, vector in zip(queries, vectors):
+                func(query, vector)
+        return time.perf_counter() - start
+
+    n = len(queries) * args.search_rounds
+    print(f"（索引类型: {settings.VECTOR_INDEX_TYPE}，文本块数: {vector_store.index.ntotal}）")
+    _print_row("FAISS向量检索", n, _run(lambda q, v: hybrid._dense_search(v, hybrid.fetch_k)), "查询")
+    if sparse_index is not None:
+        _print_row("BM25关键词检索", n, _run(lambda q, v: sparse_index.search(q, hybrid.fetch_k)), "查询")
+        _print_row("混合检索（含读取文本块）", n, _run(hybrid.search), "查询")
+    _print_row("向量检索（含读取文本块）", n, _run(dense_only.search), "查询")
+
+
+async def bench_crud(args):
+    """会话和消息的增删查（create_conversation、create_message、列表、详情、最近消息、删除）。"""
+    from app.db import crud
+    from app.db.database import AsyncSessionLocal, init_db
+
+    await init_db()
+    n_conv, n_msg = args.conversations, args.messages
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        ids = [(await crud.create_conversation(db)).id for _ in range(n_conv)]
+        _print_row("create_conversation", n_conv, time.perf_counter() - start, "次")
+
+        start = time.perf_counter()
+        for conversation_id in ids:
+            for i in range(n_msg):
+                await crud.create_message(
+                    db, conversation_id, f"第{i}条消息：报销需要在30天内提交发票。",
+                    "user" if i % 2 == 0 else "ai",
+                    source_documents=None if i % 2 == 0 else [{"chunk_id": f"chunk-{i}", "metadata": {}}],
+                )
+        _print_row("create_message", n_conv * n_msg, time.perf_counter() - start, "次")
+
+        start = time.perf_counter()
+        before_id = None
+        pages = 0
+        while True:
+            page = await crud.get_conversations(db, before_id=before_id, limit=100)
+            pages += 1
+            if len(page) < 100:
+                break
+            before_id = page[-1].id
+        _print_row("get_conversations（分页遍历）", pages, time.perf_counter() - start, "页")
+
+        start = time.perf_counter()
+        for conversation_id in ids:
+            await crud.get_conversation(db, conversation_id, with_messages=True)
+        _print_row("get_conversation（含消息）", n_conv, time.perf_counter() - start, "次")
+
+        start = time.perf_counter()
+        for conversation_id in ids:
+            await crud.get_recent_messages(db, conversation_id, limit=10)
+        _print_row("get_recent_messages", n_conv, time.perf_counter() - start, "次")
+
+        start = time.perf_counter()
+        for conversation_id in ids:
+            await crud.delete_conversation(db, conversation_id)
+        _print_row("delete_conversation", n_conv, time.perf_counter() - start, "次")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="文档加载、文本分割、灌输、检索和会话数据库操作的微基准测试（合成数据，无需GPU和网络）。"
+    )
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"要运行的测试，逗号分隔：{','.join(BENCHMARKS)}")
+    parser.add_argument("--docs", type=int, default=500, help="合成知识库的文件数")
+    parser.add_argument("--workers", type=int, default=1, help="load_documents的解析进程数")
+    parser.add_argument("--embedding-dim", type=int, default=384, help="模拟嵌入模型的向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="检索测试的查询数")
+    parser.add_argument("--search-rounds", type=int, default=5, help="每个查询重复的次数")
+    parser.add_argument("--conversations", type=int, default=200, help="数据库测试创建的会话数")
+    parser.add_argument("--messages", type=int, default=10, help="数据库测试中每个会话的消息数")
+    parser.add_argument("--workdir", help="存放合成数据的目录，默认新建一个临时目录")
+    args = parser.parse_args()
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-micro-benchmark-")
+    benchmark_fakes.prepare_environment(workdir)
+
+    # 配置项在导入时读取，必须在设置环境变量之后导入应用
+    from app.core.config import settings
+    from app.rag.loader import load_documents
+    from app.rag.vector_store import split_documents
+
+    replaced = benchmark_fakes.use_plain_text_loader_if_needed()
+    chars = benchmark_fakes.write_corpus(settings.DOCS_PATH, n_files=args.docs)
+    embeddings = benchmark_fakes.HashEmbeddings(args.embedding_dim)
+    print(f"工作目录: {workdir}，合成知识库: {args.docs} 个文件，{chars} 字符"
+          + ("（未安装unstructured，.txt改用TextLoader加载）" if replaced else ""))
+    header = f"{'测试':<30} {'次数':>8} {'总耗时(s)':>10} {'每次(ms)':>12} {'速率':>12}"
+    print(header)
+    print("-" * len(header))
+
+    documents = []
+    if "load" in selected or "split" in selected:
+        documents, seconds = _timed(load_documents, settings.DOCS_PATH, args.workers)
+        if "load" in selected:
+            _print_row(f"load_documents（{args.workers}进程）", args.docs, seconds, "文件")
+    if "split" in selected:
+        chunks, seconds = _timed(split_documents, documents)
+        _print_row(f"split_documents（{len(chunks)}块）", len(documents), seconds, "文档")
+    if "ingest" in selected or "search" in selected:
+        _, seconds = _timed(benchmark_fakes.build_knowledge_base, settings.DOCS_PATH, embeddings)
+        if "ingest" in selected:
+            _print_row("create_vector_store（哈希嵌入）", args.docs, seconds, "文件")
+    if "search" in selected:
+        queries = benchmark_fakes.sample_queries(args.queries)
+        bench_search(args, queries, embeddings)
+    if "crud" in selected:
+        asyncio.run(bench_crud(args))
+
+
+if __name__ == "__main__":
+    main()
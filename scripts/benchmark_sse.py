@@ -0,0 +1,138 @@
+import sys
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+
+# 将项目根目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.api.sse import coalesce_answer_tokens, encode_event, orjson
+
+# 配置日志：只输出警告和错误，避免干扰结果表格
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger().setLevel(logging.WARNING)
+
+# 模拟的答案token：中英文混合，长度与Qwen的常见token相近
+SAMPLE_TOKENS = ["根据", "公司", "的", "报销", "政策", "，", "员工", "需要", "在", "30", "天", "内",
+                 "提交", "发票", "。", " The", " form", " PL", "-", "2023", "-", "0042", "\n"]
+# 模拟的溯源文档引用
+SAMPLE_SOURCES = [
+    {"chunk_id": f"chunk-{i}", "metadata": {"source": f"data/policy_{i}.pdf", "page": i, "retrieval_score": 0.03}}
+    for i in range(4)
+]
+
+
+async def fake_rag_stream(n_tokens: int, interval_ms: float):
+    """模拟RAG链的astream输出：先是溯源文档，然后每隔 `interval_ms` 毫秒输出一个答案token。"""
+    yield {"source_documents": SAMPLE_SOURCES}
+    for i in range(n_tokens):
+        if interval_ms > 0:
+            await asyncio.sleep(interval_ms / 1000.0)
+        yield {"answer": SAMPLE_TOKENS[i % len(SAMPLE_TOKENS)]}
+
+
+async def baseline_frames(n_tokens: int, interval_ms: float):
+    """改进前的实现：每个token一帧，用json.dumps编码，逐个拼接答案字符串。"""
+    full_ai_response = ""
+    async for chunk in fake_rag_stream(n_tokens, interval_ms):
+        if "answer" in chunk:
+            token = chunk["answer"]
+            full_ai_response += token
+            response_json = json.dumps({"type": "stream", "data": token}, ensure_ascii=False)
+            yield f"data: {response_json}\n\n"
+        if "source_documents" in chunk and chunk["source_documents"]:
+            response_json = json.dumps({"type": "sources", "sources": chunk["source_documents"]}, ensure_ascii=False)
+            yield f"data: {response_json}\n\n"
+    yield f"data: {json.dumps({'type': 'end'})}\n\n"
+
+
+async def coalesced_frames(n_tokens: int, interval_ms: float, max_delay_ms: float, max_chars: int):
+    """改进后的实现：合并相邻token，用orjson编码，答案片段收集到列表中。"""
+    answer_parts = []
+    chunks = fake_rag_stream(n_tokens, interval_ms)
+    async for chunk in coalesce_answer_tokens(chunks, max_delay_ms=max_delay_ms, max_chars=max_chars):
+        if "answer" in chunk:
+            answer_parts.append(chunk["answer"])
+            yield encode_event({"type": "stream", "data": chunk["answer"]})
+        if "source_documents" in chunk and chunk["source_documents"]:
+            yield encode_event({"type": "sources", "sources": chunk["source_documents"]})
+    yield encode_event({"type": "end"})
+
+
+async def _drain(reader: asyncio.StreamReader):
+    """模拟客户端（或Nginx）读取响应。"""
+    while await reader.read(65536):
+        pass
+
+
+async def consume(frames):
+    """
+    像StreamingResponse一样消费生成器：字符串帧编码为UTF-8，按HTTP分块传输编码写入套接字。
+    每一帧都对应一次套接字写入，与实际部署中每帧的系统调用开销相同。返回帧数和字节数。
+    """
+    server_sock, client_sock = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=server_sock)
+    reader, client_writer = await asyncio.open_connection(sock=client_sock)
+    drain_task = asyncio.create_task(_drain(reader))
+    n_frames, n_bytes = 0, 0
+    try:
+        async for frame in frames:
+            if isinstance(frame, str):
+                frame = frame.encode("utf-8")
+            writer.write(b"%x\r\n%b\r\n" % (len(frame), frame))
+            await writer.drain()
+            n_frames += 1
+            n_bytes += len(frame)
+    finally:
+        writer.close()
+        await drain_task
+        client_writer.close()
+    return n_frames, n_bytes
+
+
+async def run_case(make_frames, n_streams: int):
+    """并发运行 `n_streams` 个流，返回每个流的CPU时间（毫秒）、帧数、字节数和总耗时。"""
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(consume(make_frames()) for _ in range(n_streams)))
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    frames = sum(r[0] for r in results) / n_streams
+    size = sum(r[1] for r in results) / n_streams
+    return cpu * 1000 / n_streams, frames, size, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="比较SSE逐token发送与合并发送时，每个流的CPU开销（含编码和套接字写入）和帧数。"
+    )
+    parser.add_argument("--streams", type=int, default=100, help="并发的流数量")
+    parser.add_argument("--tokens", type=int, default=500, help="每个回答的token数")
+    parser.add_argument("--interval-ms", type=float, default=5.0, help="模拟大模型输出相邻token的间隔（毫秒）")
+    parser.add_argument("--max-delay-ms", type=float, default=30.0, help="合并窗口的最长时间（毫秒）")
+    parser.add_argument("--max-chars", type=int, default=64, help="合并窗口的最大字符数")
+    args = parser.parse_args()
+
+    print(f"并发流数: {args.streams}, 每个回答token数: {args.tokens}, token间隔: {args.interval_ms}ms, "
+          f"JSON编码器: {'orjson' if orjson is not None else 'json'}")
+    header = f"{'实现':<28} {'CPU/流(ms)':>11} {'帧数/流':>9} {'字节/流':>9} {'总耗时(s)':>10}"
+    print(header)
+    print("-" * len(header))
+
+    cases = [
+        ("逐token + json.dumps", lambda: baseline_frames(args.tokens, args.interval_ms)),
+        ("仅换用快速JSON（不合并）", lambda: coalesced_frames(args.tokens, args.interval_ms, 0, 0)),
+        (f"合并({args.max_delay_ms:g}ms/{args.max_chars}字符)",
+         lambda: coalesced_frames(args.tokens, args.interval_ms, args.max_delay_ms, args.max_chars)),
+    ]
+    for name, make_frames in cases:
+        cpu, frames, size, wall = asyncio.run(run_case(make_frames, args.streams))
+        print(f"{name:<28} {cpu:>11.2f} {frames:>9.0f} {size:>9.0f} {wall:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
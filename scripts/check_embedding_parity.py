@@ -0,0 +1,147 @@
+import sys
+import os
+import json
+import time
+import random
+import logging
+import argparse
+from typing import List, Set, Tuple
+
+import numpy as np
+
+# 将项目根目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from langchain.docstore.document import Document
+
+from app.core.config import settings
+from app.rag.embedding_backends import OnnxEmbeddings, create_embedding_model, export_onnx_model
+from app.rag.index import build_faiss_index
+from app.rag.loader import load_documents
+from app.rag.vector_store import split_documents
+
+# 配置日志：只输出警告和错误，避免干扰结果表格
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def load_chunks(max_chunks: int, seed: int) -> List[Document]:
+    """加载知识库并分割为文本块，超过 `max_chunks` 时随机抽样。"""
+    chunks = split_documents(load_documents(settings.DOCS_PATH))
+    if len(chunks) > max_chunks:
+        chunks = random.Random(seed).sample(chunks, max_chunks)
+    return chunks
+
+
+def make_self_queries(chunks: List[Document], n_queries: int, seed: int) -> List[Tuple[str, Set[int]]]:
+    """从随机文本块中截取一段文字作为查询，该文本块即为相关文档。"""
+    rng = random.Random(seed)
+    queries = []
+    for i in rng.sample(range(len(chunks)), min(n_queries, len(chunks))):
+        text = chunks[i].page_content
+        length = min(len(text), rng.randint(30, 80))
+        start = rng.randint(0, len(text) - length)
+        queries.append((text[start:start + length], {i}))
+    return queries
+
+
+def load_labeled_queries(path: str, chunks: List[Document]) -> List[Tuple[str, Set[int]]]:
+    """读取JSONL标注集（每行包含 `question` 和 `source`），来源文件匹配的文本块都是相关文档。"""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            relevant = {i for i, chunk in enumerate(chunks) if str(chunk.metadata.get("source", "")).endswith(item["source"])}
+            if relevant:
+                queries.append((item["question"], relevant))
+    return queries
+
+
+def encode(embeddings, texts: List[str]) -> Tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+def search(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    """与向量数据库相同的精确检索（Flat索引，L2距离），返回每个查询的前k个文本块。"""
+    index = build_faiss_index(doc_vectors.shape[1], index_type="flat")
+    index.add(doc_vectors)
+    _, ids = index.search(query_vectors, k)
+    return ids
+
+
+def recall_at_k(ids: np.ndarray, queries: List[Tuple[str, Set[int]]]) -> float:
+    """前k个结果中包含相关文本块的查询所占的比例。"""
+    hits = sum(1 for row, (_, relevant) in zip(ids, queries) if relevant.intersection(row.tolist()))
+    return hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="比较ONNX（int8量化）嵌入模型与PyTorch基线的检索召回率，召回率下降超过容差时以非0状态退出。"
+    )
+    parser.add_argument("--k", type=int, default=settings.RETRIEVAL_TOP_K, help="计算recall@k的k")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="允许的召回率下降（绝对值）")
+    parser.add_argument("--max-chunks", type=int, default=5000, help="参与比较的最大文本块数")
+    parser.add_argument("--n-queries", type=int, default=500, help="自动生成的查询数（未提供 --queries 时）")
+    parser.add_argument("--queries", help="JSONL标注集，每行包含question和source（来源文件）")
+    parser.add_argument("--fp32", action="store_true", help="比较未量化的FP32 ONNX模型")
+    parser.add_argument("--seed", type=int, default=0, help="抽样的随机种子")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.max_chunks, args.seed)
+    if not chunks:
+        raise SystemExit(f"知识库 {settings.DOCS_PATH} 中没有可用的文档。")
+    if args.queries:
+        queries = load_labeled_queries(args.queries, chunks)
+    else:
+        queries = make_self_queries(chunks, args.n_queries, args.seed)
+    if not queries:
+        raise SystemExit("没有可用的查询。")
+    texts = [chunk.page_content for chunk in chunks]
+    query_texts = [question for question, _ in queries]
+
+    baseline = create_embedding_model("torch")
+    candidate = OnnxEmbeddings(
+        str(export_onnx_model()),
+        quantized=not args.fp32,
+        intra_op_threads=settings.EMBEDDING_INTRA_OP_THREADS,
+        batch_size=settings.EMBEDDING_INFERENCE_BATCH_SIZE,
+    )
+    candidate_name = "ONNX FP32" if args.fp32 else "ONNX int8"
+
+    print(f"模型: {settings.EMBEDDING_MODEL_NAME}，文本块数: {len(chunks)}，查询数: {len(queries)}，k={args.k}")
+    header = f"{'后端':<12} {'向量化(块/s)':>12} {f'recall@{args.k}':>10}"
+    print(header)
+    print("-" * len(header))
+    results = {}
+    for name, embeddings in (("PyTorch", baseline), (candidate_name, candidate)):
+        doc_vectors, seconds = encode(embeddings, texts)
+        query_vectors, _ = encode(embeddings, query_texts)
+        ids = search(doc_vectors, query_vectors, args.k)
+        results[name] = (doc_vectors, ids, recall_at_k(ids, queries))
+        print(f"{name:<12} {len(texts) / seconds:>12.1f} {results[name][2]:>10.4f}")
+
+    base_vectors, base_ids, base_recall = results["PyTorch"]
+    cand_vectors, cand_ids, cand_recall = results[candidate_name]
+    cosine = np.sum(base_vectors * cand_vectors, axis=1) / (
+        np.linalg.norm(base_vectors, axis=1) * np.linalg.norm(cand_vectors, axis=1) + 1e-12
+    )
+    overlap = np.mean([len(set(a.tolist()) & set(b.tolist())) / args.k for a, b in zip(base_ids, cand_ids)])
+    print()
+    print(f"文本块向量余弦相似度: 平均 {cosine.mean():.4f}，最小 {cosine.min():.4f}")
+    print(f"与PyTorch基线的前{args.k}个结果重合率: {overlap:.4f}")
+
+    drop = base_recall - cand_recall
+    if drop > args.tolerance:
+        print(f"未通过：{candidate_name} 的召回率比基线低 {drop:.4f}，超过容差 {args.tolerance}。")
+        sys.exit(1)
+    print(f"通过：{candidate_name} 的召回率与基线相差 {drop:+.4f}（容差 {args.tolerance}）。")
+
+
+if __name__ == "__main__":
+    main()
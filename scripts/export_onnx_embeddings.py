@@ -0,0 +1,36 @@
+import sys
+import os
+import logging
+import argparse
+
+# 将项目根目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.core.config import settings
+from app.rag.embedding_backends import ONNX_INT8_MODEL_FILENAME, ONNX_MODEL_FILENAME, export_onnx_model
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="将嵌入模型导出为ONNX格式并生成int8量化版本，供 EMBEDDING_BACKEND=onnx 使用（只需执行一次）。"
+    )
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME, help="模型名称或本地路径，默认取 EMBEDDING_MODEL_NAME")
+    parser.add_argument("--cache-dir", default=settings.EMBEDDING_ONNX_CACHE_DIR, help="缓存目录，默认取 EMBEDDING_ONNX_CACHE_DIR")
+    parser.add_argument("--force", action="store_true", help="即使已经导出过也重新导出")
+    args = parser.parse_args()
+
+    model_dir = export_onnx_model(args.model, args.cache_dir, force=args.force)
+    for filename in (ONNX_MODEL_FILENAME, ONNX_INT8_MODEL_FILENAME):
+        size = os.path.getsize(model_dir / filename) / (1024 * 1024)
+        logging.info(f"{filename}: {size:.1f} MB")
+    logging.info("导出完成。请运行 `python scripts/check_embedding_parity.py` 确认量化模型的检索召回率。")
+
+
+if __name__ == "__main__":
+    # 在项目根目录下执行 `python scripts/export_onnx_embeddings.py`
+    # 或者在使用Docker时，执行 `docker-compose exec backend python scripts/export_onnx_embeddings.py`
+    main()
@@ -1,42 +1,35 @@
 import sys
 import os
 import logging
+import argparse
 
 # 将项目根目录添加到Python的模块搜索路径中
 # 这使得该脚本可以作为独立脚本运行时，能够正确地导入'app'目录下的模块
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
-from app.rag.loader import load_documents
 from app.rag.vector_store import create_vector_store
 from app.core.config import settings
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def main():
+def main(incremental: bool = False, resume: bool = True):
     """
     数据灌输主函数。
-    - 从配置文件中指定的源目录加载文档。
-    - 从加载的文档创建并保存向量数据库。
+    - 从配置文件中指定的源目录流式地加载、分割文档。
+    - 逐批向量化文本块并写入向量数据库，最后保存到磁盘。
+
+    Args:
+        incremental (bool): 为True时只处理新增、修改或删除的文件，增量更新现有的向量数据库。
+        resume (bool): 为True时，如果上次灌输被中断，则从最近的检查点继续。
     """
     logging.info("开始执行数据灌输流程...")
+    mode = "增量更新" if incremental else "全量构建"
+    logging.info(f"正在从路径 {settings.DOCS_PATH} {mode}向量数据库...")
 
-    # 步骤 1: 从配置指定的路径加载文档
-    logging.info(f"正在从路径加载文档: {settings.DOCS_PATH}")
-    try:
-        documents = load_documents(settings.DOCS_PATH)
-        if not documents:
-            logging.warning("未能加载任何文档。请检查DOCS_PATH及其内容是否正确。")
-            return
-        logging.info(f"成功加载 {len(documents)} 个文档块。")
-    except Exception as e:
-        logging.error(f"文档加载过程中发生错误: {e}", exc_info=True)
-        return
-
-    # 步骤 2: 创建并保存向量数据库
     try:
-        create_vector_store(documents)
+        create_vector_store(settings.DOCS_PATH, incremental=incremental, resume=resume)
     except Exception as e:
         logging.error(f"创建向量数据库过程中发生错误: {e}", exc_info=True)
         return
@@ -46,4 +39,25 @@ def main():
 if __name__ == "__main__":
     # 要运行此脚本，请在项目根目录下执行 `python scripts/ingest_data.py`
     # 或者在使用Docker时，执行 `docker-compose exec backend python scripts/ingest_data.py`
-    main()
+    # 添加 `--incremental` 参数则只处理发生变化的文件。
+    parser = argparse.ArgumentParser(description="将知识库文档灌输到FAISS向量数据库。")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="根据文件清单只处理新增、修改或删除的文件，而不是全量重建索引。",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="忽略上次中断时留下的检查点，从头开始灌输。",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="并行解析文档的进程数，覆盖配置项 LOADER_MAX_WORKERS。",
+    )
+    args = parser.parse_args()
+    if args.workers is not None:
+        settings.LOADER_MAX_WORKERS = args.workers
+    main(incremental=args.incremental, resume=not args.no_resume)
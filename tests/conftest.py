@@ -0,0 +1,17 @@
+"""
+测试共用的配置：使用基准测试的模拟组件（`scripts/benchmark_fakes.py`），
+数据库、知识库和向量数据库都指向临时目录，不需要GPU、模型文件或网络。
+"""
+import os
+import sys
+import tempfile
+
+# 将项目根目录和scripts目录添加到Python的模块搜索路径中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, "scripts"))
+
+import benchmark_fakes
+
+# 配置项在导入时读取，必须在导入任何 `app` 模块之前设置环境变量
+benchmark_fakes.prepare_environment(tempfile.mkdtemp(prefix="rag-tests-"))
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.docstore.document import Document
+
+import benchmark_fakes
+from app.core.config import settings
+from app.rag import chain
+
+HISTORY = [("user", "报销需要提交什么材料？"), ("ai", "需要提交发票和报销单。")]
+
+
+class CountingRetriever:
+    """模拟的检索器：记录 `search` 的调用次数，每次返回固定的文档。"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, query_vector):
+        self.calls += 1
+        return [Document(page_content="员工应在30天内提交发票。", metadata={"source": "policy.txt", "chunk_id": "c1"})]
+
+
+def _create_chain(monkeypatch, retriever, server):
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_ENABLED", False)
+    monkeypatch.setattr(chain, "_llm_http_clients", server.http_clients())
+    monkeypatch.setattr(chain, "get_embeddings", lambda: benchmark_fakes.HashEmbeddings(dimension=64))
+    monkeypatch.setattr(chain.vector_store_reloader, "load", lambda: retriever)
+    monkeypatch.setattr(chain, "embeddings_instance", None)
+    monkeypatch.setattr(chain, "retriever_instance", None)
+    rag_chain = chain.create_rag_chain()
+    assert rag_chain is not None
+    return rag_chain
+
+
+async def _run_turn(rag_chain, chat_history):
+    answer, sources = [], []
+    async for chunk in rag_chain.astream({"question": "那电子发票可以吗？", "chat_history": chat_history}):
+        answer.append(chunk.get("answer", ""))
+        sources.extend(chunk.get("source_documents") or [])
+    return "".join(answer), sources
+
+
+def test_rewrite_retrieval_and_generation_run_once_per_turn(monkeypatch):
+    """多轮对话中，问题重写、检索和答案生成每轮各只执行一次，检索结果同时用于Prompt和溯源文档。"""
+    retriever = CountingRetriever()
+    server = benchmark_fakes.FakeOpenAIServer(ttft_ms=0, n_tokens=5, interval_ms=0)
+    rag_chain = _create_chain(monkeypatch, retriever, server)
+
+    answer, sources = asyncio.run(_run_turn(rag_chain, HISTORY))
+    assert answer
+    assert [doc.metadata["chunk_id"] for doc in sources] == ["c1"]
+    assert retriever.calls == 1
+    # 一次问题重写 + 一次答案生成
+    assert server.requests == 2
+
+    asyncio.run(_run_turn(rag_chain, []))
+    # 没有聊天历史时不重写问题：只有一次答案生成
+    assert retriever.calls == 2
+    assert server.requests == 3
+
+
+class SlowRetriever(CountingRetriever):
+    """模拟耗时的同步检索（FAISS检索是同步的CPU操作）。"""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def search(self, query, query_vector):
+        time.sleep(self.delay)
+        return super().search(query, query_vector)
+
+
+def test_concurrent_turns_do_not_block_event_loop(monkeypatch):
+    """N轮对话并发执行的总耗时接近单轮的耗时：问题重写、检索和生成都不会阻塞事件循环。"""
+    n_turns = 4
+    monkeypatch.setattr(chain, "retrieval_executor", ThreadPoolExecutor(max_workers=n_turns))
+    retriever = SlowRetriever(delay=0.5)
+    server = benchmark_fakes.FakeOpenAIServer(ttft_ms=500, n_tokens=5, interval_ms=0)
+    rag_chain = _create_chain(monkeypatch, retriever, server)
+
+    async def _timed(coro):
+        start = time.perf_counter()
+        await coro
+        return time.perf_counter() - start
+
+    async def _run():
+        single = await _timed(_run_turn(rag_chain, HISTORY))
+        concurrent = await _timed(asyncio.gather(*[_run_turn(rag_chain, HISTORY) for _ in range(n_turns)]))
+        return single, concurrent
+
+    single, concurrent = asyncio.run(_run())
+    assert retriever.calls == 1 + n_turns
+    # 单轮约1.5秒（重写、检索、首个token各0.5秒）；阻塞事件循环时并发总耗时会接近 n_turns 倍
+    assert concurrent < single * 1.5
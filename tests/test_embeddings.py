@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+import benchmark_fakes
+from app.rag.embeddings import BatchingEmbeddings
+
+
+class InstructionEmbeddings(Embeddings):
+    """模拟在查询前加指令的模型（BGE、E5风格）：查询向量与同一文本的文档向量不同。"""
+
+    def __init__(self):
+        self.base = benchmark_fakes.HashEmbeddings(dimension=64)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query("query: " + text)
+
+
+class RecordingEmbeddings(benchmark_fakes.HashEmbeddings):
+    """记录每次批量查询向量化的查询数。"""
+
+    def __init__(self):
+        super().__init__(dimension=64, latency_ms=20)
+        self.batches = []
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(len(texts))
+        return super().embed_queries(texts)
+
+
+def test_instruction_models_keep_their_query_path():
+    """查询前加指令的模型经过批处理前端后，得到的仍是查询向量而不是文档向量。"""
+    model = InstructionEmbeddings()
+    embeddings = BatchingEmbeddings(model, max_wait_ms=1, cache_size=0)
+    text = "报销需要多久？"
+    assert embeddings.embed_query(text) == model.embed_query(text)
+    assert embeddings.embed_query(text) != model.embed_documents([text])[0]
+
+
+def test_concurrent_queries_are_batched_through_query_path():
+    """并发的查询合并为一次 `embed_queries` 调用，结果与逐条向量化相同。"""
+    model = RecordingEmbeddings()
+    embeddings = BatchingEmbeddings(model, max_batch_size=8, max_wait_ms=50, cache_size=0)
+    texts = [f"问题{i}" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        vectors = list(pool.map(embeddings.embed_query, texts))
+    assert vectors == [model.embed_query(text) for text in texts]
+    assert max(model.batches) > 1
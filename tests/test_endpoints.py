@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import httpx
+
+import benchmark_fakes
+from app.api import endpoints
+from app.core.config import settings
+from app.core.timing import RequestTimings
+from app.db import crud
+from app.db.database import AsyncSessionLocal
+from app.db.writer import message_writer
+from app.main import app
+from app.rag.history import ChatHistory
+from tests.test_chain import CountingRetriever, _create_chain
+
+
+async def _post_chat(client: httpx.AsyncClient, conversation_id):
+    return await client.post("/api/chat/stream", json={"question": "报销需要多久？", "conversation_id": conversation_id})
+
+
+def test_chat_with_unknown_conversation_returns_404(monkeypatch):
+    """指定的会话不存在或已删除时返回404，而不是在保存用户消息时违反外键约束。"""
+    monkeypatch.setattr(settings, "WARMUP_ON_STARTUP", False)
+
+    async def _run():
+        await app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await _post_chat(client, 999999)
+                assert response.status_code == 404
+
+                conversation = (await client.post("/api/conversations/")).json()
+                assert (await client.delete(f"/api/conversations/{conversation['id']}")).status_code == 204
+                response = await _post_chat(client, conversation["id"])
+                assert response.status_code == 404
+        finally:
+            await app.router.shutdown()
+
+    asyncio.run(_run())
+
+
+def test_reading_conversation_during_database_outage_returns_503(monkeypatch):
+    """batched模式下数据库不可用时，读取会话等待排队消息写入至多 MESSAGE_WAIT_TIMEOUT_SECONDS 秒，然后返回503。"""
+    monkeypatch.setattr(settings, "WARMUP_ON_STARTUP", False)
+    monkeypatch.setattr(message_writer, "mode", "batched")
+    monkeypatch.setattr(message_writer, "wait_timeout", 0.3)
+    insert = message_writer._insert
+
+    async def _database_down(batch):
+        raise ConnectionError("数据库不可用")
+
+    async def _run():
+        await app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                conversation = (await client.post("/api/conversations/")).json()
+                message_writer._insert = _database_down
+                await message_writer.add(None, conversation["id"], "报销需要多久？", "user")
+                response = await asyncio.wait_for(client.get(f"/api/conversations/{conversation['id']}"), timeout=5)
+                assert response.status_code == 503
+                # 数据库恢复后，排队的消息写入，会话可以正常读取
+                message_writer._insert = insert
+                response = await client.get(f"/api/conversations/{conversation['id']}")
+                assert response.status_code == 200
+                assert [m["content"] for m in response.json()["messages"]] == ["报销需要多久？"]
+        finally:
+            message_writer._insert = insert
+            await message_writer.stop()
+            await app.router.shutdown()
+
+    asyncio.run(_run())
+
+
+def test_batched_turn_is_committed_before_end_event(monkeypatch):
+    """batched模式下，`end` 事件在本轮的消息提交之后才发送，下一轮对话由其他worker处理时也能读到它们。"""
+    monkeypatch.setattr(settings, "WARMUP_ON_STARTUP", False)
+    monkeypatch.setattr(message_writer, "mode", "batched")
+    monkeypatch.setattr(message_writer, "flush_interval", 0.5)
+    server = benchmark_fakes.FakeOpenAIServer(ttft_ms=0, n_tokens=5, interval_ms=0)
+    rag_chain = _create_chain(monkeypatch, CountingRetriever(), server)
+
+    async def _get_rag_chain():
+        return rag_chain
+
+    monkeypatch.setattr(endpoints, "aget_rag_chain", _get_rag_chain)
+
+    async def _run():
+        await app.router.startup()
+        try:
+            async with AsyncSessionLocal() as db:
+                conversation_id = (await crud.create_conversation(db)).id
+                await message_writer.add(db, conversation_id, "报销需要多久？", "user")
+                events = endpoints.stream_chat_response_generator(
+                    conversation_id, "报销需要多久？", ChatHistory(), db, RequestTimings()
+                )
+                async for frame in events:
+                    if json.loads(frame.decode()[len("data:"):])["type"] == "end":
+                        # 客户端收到end事件时，本轮的消息已经提交
+                        assert message_writer.pending_messages(conversation_id) == []
+                        break
+                else:
+                    raise AssertionError("没有收到end事件")
+                await events.aclose()
+            async with AsyncSessionLocal() as db:
+                conversation = await crud.get_conversation(db, conversation_id, with_messages=True)
+                assert [m.message_type for m in conversation.messages] == ["user", "ai"]
+        finally:
+            await message_writer.stop()
+            await app.router.shutdown()
+
+    asyncio.run(_run())
@@ -0,0 +1,37 @@
+import signal
+import time
+
+from langchain.docstore.document import Document
+
+from app.rag import loader
+
+
+def _load_or_hang(file_path):
+    """模拟的文件加载：名为 hang 的文件卡在一个SIGALRM无法中断的调用中。"""
+    if file_path.stem == "hang":
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(60)
+    return [Document(page_content=file_path.read_text(encoding="utf-8"), metadata={"source": str(file_path)})]
+
+
+def test_hung_file_is_skipped_without_stalling_the_ingest(tmp_path, monkeypatch):
+    """一个文件超时后仍未返回时被记为失败，解析进程被终止，其他在途文件照常完成，结果仍按输入顺序返回。"""
+    # 进程池以fork方式创建，工作进程继承这里替换的加载函数
+    monkeypatch.setattr(loader, "load_file", _load_or_hang)
+    monkeypatch.setattr(loader, "_HUNG_FILE_GRACE_SECONDS", 0.5)
+    names = ["a", "b", "hang", "c", "d", "e", "f"]
+    paths = []
+    for name in names:
+        path = tmp_path / f"{name}.txt"
+        path.write_text(f"文件 {name}", encoding="utf-8")
+        paths.append(path)
+
+    start = time.perf_counter()
+    results = list(loader.load_files(paths, max_workers=2, timeout=0.5))
+    assert time.perf_counter() - start < 20
+    assert [path.stem for path, _ in results] == names
+    for path, documents in results:
+        if path.stem == "hang":
+            assert documents is None
+        else:
+            assert [doc.page_content for doc in documents] == [f"文件 {path.stem}"]
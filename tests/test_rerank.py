@@ -0,0 +1,130 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+import types
+
+import pytest
+from langchain.docstore.document import Document
+
+import benchmark_fakes
+from app.api import endpoints
+from app.core.timing import RequestTimings
+from app.rag import chain, rerank
+from app.rag.history import ChatHistory
+from tests.test_chain import CountingRetriever, _create_chain
+
+
+class FakeCrossEncoder:
+    """模拟的交叉编码器：每次调用耗时 `delay` 秒，得分为文档的长度。"""
+
+    delay = 0.0
+
+    def __init__(self, model_name, max_length=512, device="cpu"):
+        self.calls = 0
+
+    def predict(self, pairs, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [float(len(doc)) for _, doc in pairs]
+
+
+@pytest.fixture
+def make_reranker(monkeypatch):
+    """返回一个创建重排序器的函数，重排序器使用模拟的交叉编码器（不加载sentence-transformers）。"""
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(CrossEncoder=FakeCrossEncoder))
+
+    def _make(delay: float = 0.0, **kwargs):
+        reranker = rerank.CrossEncoderReranker("fake-reranker", **kwargs)
+        reranker.model.delay = delay
+        return reranker
+
+    return _make
+
+
+def _documents(n: int):
+    return [Document(page_content="文" * (i + 1), metadata={"chunk_id": f"c{i}"}) for i in range(n)]
+
+
+def test_slow_rerank_falls_back_to_retrieval_order(make_reranker):
+    """打分超出时间预算时按检索顺序截取，打分任务在下一次模型调用之前停止，不再占用打分线程。"""
+    reranker = make_reranker(delay=0.3, top_k=3, timeout_ms=100)
+    timeouts = rerank.RERANK_TIMEOUTS.value
+    documents = _documents(20)
+
+    start = time.perf_counter()
+    result = asyncio.run(reranker.arerank("问题", documents))
+    assert time.perf_counter() - start < 1.5
+    assert [doc.metadata["chunk_id"] for doc in result] == ["c0", "c1", "c2"]
+    assert all("rerank_score" not in doc.metadata for doc in result)
+    assert rerank.RERANK_TIMEOUTS.value == timeouts + 1
+    # 20个文档分3次调用打分，第一次调用之后就超出了预算
+    assert reranker.model.calls == 1
+
+
+def test_queue_wait_does_not_count_against_budget(make_reranker):
+    """预算从打分开始时计算：排在另一个任务之后的请求仍能在预算内完成重排序。"""
+    reranker = make_reranker(delay=0.15, top_k=2, timeout_ms=250, max_queue=2)
+    documents = _documents(4)
+    results = [None, None]
+
+    def _run(i):
+        results[i] = reranker.rerank("问题", documents)
+
+    threads = [threading.Thread(target=_run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for result in results:
+        assert [doc.metadata["chunk_id"] for doc in result] == ["c3", "c2"]
+
+
+def test_full_queue_skips_rerank_immediately(make_reranker):
+    """等待打分的任务已有 `max_queue` 个时，新的请求立即按检索顺序返回。"""
+    reranker = make_reranker(delay=0.5, top_k=2, timeout_ms=1000, max_queue=1)
+    skipped = rerank.RERANK_SKIPPED.value
+    documents = _documents(4)
+    busy = threading.Thread(target=reranker.rerank, args=("问题", documents))
+    busy.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    result = reranker.rerank("问题", documents)
+    assert time.perf_counter() - start < 0.1
+    assert [doc.metadata["chunk_id"] for doc in result] == ["c0", "c1"]
+    assert rerank.RERANK_SKIPPED.value == skipped + 1
+    busy.join()
+
+
+def test_rerank_score_is_sent_in_sources_event(make_reranker, monkeypatch):
+    """启用重排序时，`sources` 事件中每个文档的元数据带有 `rerank_score`。"""
+    reranker = make_reranker(top_k=1, timeout_ms=1000)
+    monkeypatch.setattr(chain, "get_reranker", lambda: reranker)
+    server = benchmark_fakes.FakeOpenAIServer(ttft_ms=0, n_tokens=5, interval_ms=0)
+    rag_chain = _create_chain(monkeypatch, CountingRetriever(), server)
+
+    async def _get_rag_chain():
+        return rag_chain
+
+    monkeypatch.setattr(endpoints, "aget_rag_chain", _get_rag_chain)
+
+    async def _sources_events():
+        events = endpoints.stream_chat_response_generator(
+            0, "报销需要多久？", ChatHistory(), None, RequestTimings()
+        )
+        sources = []
+        async for frame in events:
+            event = json.loads(frame.decode()[len("data:"):])
+            if event["type"] == "sources":
+                sources.append(event["sources"])
+            if event["type"] == "stream":
+                break
+        await events.aclose()
+        return sources
+
+    sources = asyncio.run(_sources_events())
+    assert len(sources) == 1
+    assert [source["chunk_id"] for source in sources[0]] == ["c1"]
+    assert sources[0][0]["metadata"]["rerank_score"] == float(len("员工应在30天内提交发票。"))
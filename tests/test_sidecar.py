@@ -0,0 +1,81 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from langchain.docstore.document import Document
+
+import benchmark_fakes
+from app.rag import chain
+from app.rag.cache import semantic_cache
+from app.rag.sidecar import RetrievalSidecar, SidecarClient, SidecarRetriever
+
+
+class StaticRetriever:
+    def search(self, query, query_vector):
+        return [Document(page_content="员工应在30天内提交发票。", metadata={"source": "policy.txt", "chunk_id": "c1"})]
+
+
+@pytest.fixture
+def sidecar():
+    """在后台线程的事件循环中启动一个检索服务进程（不加载模型），返回（服务进程, 客户端）。"""
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="rag-"), "retrieval.sock")
+    server = RetrievalSidecar(benchmark_fakes.HashEmbeddings(dimension=64), StaticRetriever(), version="v1")
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(server.serve(socket_path))
+
+    def _run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    client = SidecarClient(socket_path, timeout=5)
+    yield server, client
+    client.close()
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(timeout=5)
+
+
+def test_worker_cache_is_cleared_when_sidecar_switches_version(sidecar):
+    """
+    检索服务进程自行热加载新版本后，worker从检索响应中的版本号发现变化并清空语义缓存；
+    切换之前开始生成的回答不再写入缓存。
+    """
+    server, client = sidecar
+    changes = []
+
+    def _on_version_change(previous, version):
+        changes.append((previous, version))
+        chain._on_sidecar_version_change(previous, version)
+
+    retriever = SidecarRetriever(client, on_version_change=_on_version_change)
+    vector = benchmark_fakes.HashEmbeddings(dimension=64).embed_query("报销需要什么材料？")
+
+    docs = retriever.search("报销需要什么材料？", vector)
+    assert [doc.metadata["chunk_id"] for doc in docs] == ["c1"]
+    assert retriever.version == "v1" and changes == []
+    semantic_cache.clear()
+    generation = semantic_cache.generation
+    semantic_cache.add(vector, "报销需要什么材料？", ["发票"], docs, generation=generation)
+    assert semantic_cache.lookup(vector) is not None
+
+    server.version = "v2"
+    retriever.search("报销需要什么材料？", vector)
+    assert changes == [("v1", "v2")]
+    assert semantic_cache.lookup(vector) is None
+    # 在版本切换之前开始生成的回答来自旧版本的知识库
+    semantic_cache.add(vector, "报销需要什么材料？", ["发票"], docs, generation=generation)
+    assert semantic_cache.lookup(vector) is None
+
+    retriever.search("报销需要什么材料？", vector)
+    assert changes == [("v1", "v2")]
@@ -0,0 +1,140 @@
+import time
+from pathlib import Path
+
+import pytest
+
+import benchmark_fakes
+from app.core.config import settings
+from app.rag import vector_store
+from app.rag.index import apply_search_params
+from app.rag.store import load_vector_store, resolve_store_version
+
+# 每个文件一个文本块，内容由互不相同的单词组成，哈希嵌入下每个文件都能被唯一检索到
+N_FILES = 120
+
+
+class CountingEmbeddings(benchmark_fakes.HashEmbeddings):
+    """记录向量化过的文本块数量的哈希嵌入模型。"""
+
+    def __init__(self):
+        super().__init__(dimension=64)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def _file_text(i: int, version: str) -> str:
+    return " ".join(f"{version}{i}w{j}" for j in range(8))
+
+
+def _search(embeddings, text: str):
+    _, path = resolve_store_version(settings.VECTOR_STORE_PATH)
+    store = load_vector_store(str(path), embeddings)
+    apply_search_params(store.index)
+    return store.similarity_search(text, k=1)[0]
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    """在临时目录中生成 N_FILES 个文件的知识库，返回（知识库目录, 嵌入模型）。"""
+    docs_dir, store_dir = tmp_path / "docs", tmp_path / "vector_store"
+    docs_dir.mkdir()
+    monkeypatch.setattr(settings, "DOCS_PATH", str(docs_dir))
+    monkeypatch.setattr(settings, "VECTOR_STORE_PATH", str(store_dir))
+    monkeypatch.setattr(settings, "VECTOR_INDEX_TRAIN_SIZE", 80)
+    monkeypatch.setattr(settings, "VECTOR_SEARCH_NPROBE", 64)
+    monkeypatch.setattr(settings, "INGEST_BATCH_SIZE", 16)
+    benchmark_fakes.use_plain_text_loader_if_needed()
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(vector_store, "_load_embeddings", lambda: embeddings)
+    for i in range(N_FILES):
+        (docs_dir / f"doc_{i:03d}.txt").write_text(_file_text(i, "t"), encoding="utf-8")
+    return docs_dir, embeddings
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_incremental_update_only_processes_changed_files(knowledge_base, monkeypatch, index_type):
+    """
+    增量更新在各种索引类型上原地删除和追加：只有修改过的文件被重新向量化，
+    检索更新过的文本返回新的文本块，未变化的文件仍能检索到，已删除的文件不再出现。
+    """
+    monkeypatch.setattr(settings, "VECTOR_INDEX_TYPE", index_type)
+    docs_dir, embeddings = knowledge_base
+    vector_store.create_vector_store(str(docs_dir))
+    assert embeddings.embedded == N_FILES
+
+    updated = [4, 9, 57, 101]
+    for i in updated:
+        (docs_dir / f"doc_{i:03d}.txt").write_text(_file_text(i, "n"), encoding="utf-8")
+    (docs_dir / "doc_000.txt").unlink()
+    embeddings.embedded = 0
+    vector_store.update_vector_store(str(docs_dir))
+    assert embeddings.embedded == len(updated)
+
+    for i in updated:
+        doc = _search(embeddings, _file_text(i, "n"))
+        assert doc.page_content == _file_text(i, "n")
+        assert Path(doc.metadata["source"]).name == f"doc_{i:03d}.txt"
+    for i in (1, 5, 60, 119):
+        assert _search(embeddings, _file_text(i, "t")).page_content == _file_text(i, "t")
+    assert _search(embeddings, _file_text(0, "t")).page_content != _file_text(0, "t")
+
+
+def test_update_without_changes_skips_loading_models(knowledge_base, monkeypatch):
+    """知识库没有变化时，增量更新只对比清单：不加载嵌入模型和索引，不发布新版本，数秒内完成。"""
+    docs_dir, _ = knowledge_base
+    vector_store.create_vector_store(str(docs_dir))
+    version, _ = resolve_store_version(settings.VECTOR_STORE_PATH)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("知识库没有变化时不应加载嵌入模型或索引")
+
+    monkeypatch.setattr(vector_store, "_load_embeddings", _fail)
+    monkeypatch.setattr(vector_store._WorkingStore, "copy_of", _fail)
+    start = time.perf_counter()
+    vector_store.update_vector_store(str(docs_dir))
+    assert time.perf_counter() - start < 5
+    assert resolve_store_version(settings.VECTOR_STORE_PATH)[0] == version
+
+
+class FailingEmbeddings(CountingEmbeddings):
+    """第 `fail_after` 次调用之后抛出异常的嵌入模型，模拟灌输中途被中断。"""
+
+    def __init__(self, fail_after: int):
+        super().__init__()
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls > self.fail_after:
+            raise RuntimeError("灌输被中断")
+        return super().embed_documents(texts)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_interrupted_ingest_resumes_from_checkpoint(knowledge_base, monkeypatch, index_type):
+    """
+    灌输在检查点之后中断，再次运行时从检查点恢复：只向量化检查点之后的文件，
+    检查点之后已写入的文本块被丢弃，所有文件都能检索到，检查点目录被清除。
+    """
+    monkeypatch.setattr(settings, "VECTOR_INDEX_TYPE", index_type)
+    monkeypatch.setattr(settings, "INGEST_CHECKPOINT_EVERY", 3)
+    docs_dir, embeddings = knowledge_base
+    monkeypatch.setattr(vector_store, "_load_embeddings", lambda: FailingEmbeddings(fail_after=8))
+    with pytest.raises(RuntimeError):
+        vector_store.create_vector_store(str(docs_dir))
+    checkpoint_dir = vector_store._checkpoint_dir(settings.VECTOR_STORE_PATH)
+    checkpointed = len(vector_store.load_manifest(str(checkpoint_dir)))
+    assert 0 < checkpointed < N_FILES
+
+    monkeypatch.setattr(vector_store, "_load_embeddings", lambda: embeddings)
+    vector_store.create_vector_store(str(docs_dir))
+    assert embeddings.embedded == N_FILES - checkpointed
+    assert not checkpoint_dir.exists()
+    _, path = resolve_store_version(settings.VECTOR_STORE_PATH)
+    assert load_vector_store(str(path), embeddings).index.ntotal == N_FILES
+    for i in range(0, N_FILES, 7):
+        assert _search(embeddings, _file_text(i, "t")).page_content == _file_text(i, "t")